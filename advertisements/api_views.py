@@ -1,17 +1,29 @@
 from rest_framework import viewsets, permissions, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from .models import PlayerStatus, Store, Department
 
 from rest_framework.decorators import api_view
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core import signing
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.urls import reverse
+from asgiref.sync import sync_to_async
 from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import json
 
 
-from .models import Stand, AdvertisementMaterial, EmissionSchedule
-from .serializers import StandSerializer, AdvertisementMaterialSerializer
+from .models import Stand, AdvertisementMaterial, EmissionSchedule, UploadJob
+from . import calendar_feed, direct_upload, emission_slots, heartbeats, playlist, recurrence, schedule_status
+from .resolver import PlaylistResolver
+from .store_time import local_day, to_local
+from .serializers import DirectUploadSerializer
 from accounts.models import User
 
 class IsPlayerOrAdmin(permissions.BasePermission):
@@ -44,6 +56,20 @@ class IsPlayerOrAdmin(permissions.BasePermission):
             
         return False
 
+def has_stand_access(user, stand_id, store_id):
+    """
+    Odpowiednik IsPlayerOrAdmin.has_object_permission działający na
+    identyfikatorach - nie wymaga pobierania stoiska z bazy.
+    """
+    if user.is_superadmin():
+        return True
+    if user.is_store_admin():
+        return store_id == user.managed_store_id
+    if user.is_editor() or user.is_player():
+        return stand_id == user.managed_stand_id
+    return False
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated, IsPlayerOrAdmin])
 def stand_materials(request, stand_id):
@@ -51,110 +77,241 @@ def stand_materials(request, stand_id):
     Get all materials for a specific stand.
     Used by the player to display the carousel.
     Uwzględnia harmonogram emisji.
+
+    Odpowiedź pochodzi ze skompilowanego snapshotu playlisty; przy zgodnym
+    nagłówku If-None-Match zwracamy 304 bez treści. Z parametrem ?since=<wersja>
+    zwracane są tylko zmiany od podanej wersji.
     """
     try:
-        stand = Stand.objects.get(pk=stand_id)
-        
-        # Check permissions
-        if not IsPlayerOrAdmin().has_object_permission(request, None, stand):
-            return Response({"error": "Nie masz uprawnień do tego stoiska"}, 
-                          status=status.HTTP_403_FORBIDDEN)
+        snapshot = playlist.get_snapshot(stand_id)
+    except Stand.DoesNotExist:
+        return Response({"error": "Stoisko nie istnieje"}, 
+                      status=status.HTTP_404_NOT_FOUND)
 
-        now = timezone.now()
-        current_time = now.time()
-        current_date = now.date()
-        current_weekday = now.weekday()
-
-        # Pobierz wszystkie materiały dla stoiska
-        materials = AdvertisementMaterial.objects.filter(stand=stand, status='active')
-
-        # Pobierz aktywne harmonogramy dla stoiska
-        schedules = EmissionSchedule.objects.filter(
-            materials__stand=stand,  # Corrected from 'material__stand'
-            is_active=True,
-            start_time__lte=current_time,
-            end_time__gte=current_time
-        ).order_by('-priority')
-
-        # Pobierz aktywne harmonogramy dla stoiska - dodajemy specjalną obsługę harmonogramów nocnych
-        current_schedules = EmissionSchedule.objects.filter(
-            materials__stand=stand, 
-            is_active=True
-        )
-        
-        # Filtruj harmonogramy według daty i czasu
-        active_schedules = []
-        for schedule in current_schedules:
-            # Sprawdź czy harmonogram obowiązuje w bieżącym dniu
-            if schedule.is_scheduled_for_date(current_date):
-                # Sprawdź godziny
-                if schedule.start_time <= schedule.end_time:
-                    # Normalny harmonogram dzienny (np. 8:00-20:00)
-                    if schedule.start_time <= current_time <= schedule.end_time:
-                        active_schedules.append(schedule)
-                else:
-                    # Harmonogram nocny przechodzący przez północ (np. 22:00-6:00)
-                    if schedule.start_time <= current_time or current_time <= schedule.end_time:
-                        active_schedules.append(schedule)
-        
-        # Filtruj harmonogramy według daty i typu powtarzania
-        active_schedules = []
-        for schedule in schedules:
-            if schedule.is_scheduled_for_date(current_date):
-                active_schedules.append(schedule)
-        
-        # Jeśli są aktywne harmonogramy, używaj tylko materiałów z harmonogramów
-        materials_ids = []
-        # Jeśli są aktywne harmonogramy, używaj tylko materiałów z harmonogramów
-        if active_schedules:
-            # Grupuj materiały według priorytetów harmonogramów
-            materials_by_priority = {}
-            
-            for schedule in active_schedules:
-                priority = schedule.priority
-                for material in schedule.materials.filter(status='active'):
-                    # Zachowaj tylko najwyższy priorytet dla każdego materiału
-                    if material.id not in materials_by_priority or priority > materials_by_priority[material.id]['priority']:
-                        materials_by_priority[material.id] = {
-                            'material': material,
-                            'priority': priority
-                        }
-            
-            # Konwertuj na listę i sortuj według priorytetu
-            prioritized_materials = [item['material'] for item in sorted(
-                materials_by_priority.values(), 
-                key=lambda x: x['priority'], 
-                reverse=True
-            )]
-            
-            # Użyj tylko materiałów z aktywnych harmonogramów
-            materials = prioritized_materials
-        
-        # Serializuj stoisko wraz z materiałami
-        serializer = StandSerializer(stand, context={'request': request})
-        data = serializer.data
-        
-        # Jeśli używamy harmonogramów, zastąp materiały tymi z harmonogramów w odpowiedniej kolejności
-        if active_schedules:
-            # Sortuj materiały według priorytetu harmonogramu
-            priority_map = {s.material_id: s.priority for s in active_schedules}
-            materials_data = []
-            
-            for material in materials:
-                material_data = AdvertisementMaterialSerializer(material, context={'request': request}).data
-                material_data['schedule_priority'] = priority_map.get(material.id, 0)
-                materials_data.append(material_data)
-                
-            # Sortuj według priorytetu (wyższy najpierw)
-            materials_data.sort(key=lambda x: x['schedule_priority'], reverse=True)
-            data['materials'] = materials_data
-        
-        return Response(data)
+    # Check permissions
+    store_id = snapshot['data']['department']['store']['id']
+    if not has_stand_access(request.user, stand_id, store_id):
+        return Response({"error": "Nie masz uprawnień do tego stoiska"}, 
+                      status=status.HTTP_403_FORBIDDEN)
+
+    headers = {'ETag': snapshot['etag'], 'Cache-Control': 'no-cache'}
+
+    # Synchronizacja różnicowa: ?since=<wersja> zwraca tylko zmiany od tej wersji
+    since = request.GET.get('since')
+    if since is not None:
+        try:
+            delta = playlist.build_delta(snapshot, int(since))
+        except ValueError:
+            return Response({"error": "Parametr since musi być numerem wersji"},
+                          status=status.HTTP_400_BAD_REQUEST)
+        if delta is not None:
+            return Response(delta, headers=headers)
+        # Nieznana lub zbyt stara wersja - odsyłamy pełną playlistę
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if snapshot['etag'] in [tag.strip() for tag in if_none_match.split(',')]:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(snapshot['data'], headers=headers)
     
+
+# Maksymalna liczba stoisk w jednym zapytaniu zbiorczym
+BATCH_MAX_STANDS = 500
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated, IsPlayerOrAdmin])
+def batch_stand_materials(request):
+    """
+    Playlisty wielu stoisk w jednej odpowiedzi (urządzenia brzegowe obsługujące
+    wiele ekranów). Parametry: ?store=<id> lub ?stands=1,2,3.
+    """
+    stands = Stand.objects.all()
+    if request.GET.get('store'):
+        try:
+            store_id = int(request.GET['store'])
+        except ValueError:
+            return Response({"error": "Parametr store musi być identyfikatorem sklepu"},
+                          status=status.HTTP_400_BAD_REQUEST)
+        stands = stands.filter(department__store_id=store_id)
+    elif request.GET.get('stands'):
+        try:
+            stand_ids = [int(stand_id) for stand_id in request.GET['stands'].split(',')]
+        except ValueError:
+            return Response({"error": "Parametr stands musi być listą identyfikatorów"},
+                          status=status.HTTP_400_BAD_REQUEST)
+        stands = stands.filter(pk__in=stand_ids)
+    else:
+        return Response({"error": "Podaj parametr store lub stands"},
+                      status=status.HTTP_400_BAD_REQUEST)
+
+    stand_stores = dict(stands.order_by('id').values_list('id', 'department__store_id')[:BATCH_MAX_STANDS + 1])
+    if len(stand_stores) > BATCH_MAX_STANDS:
+        return Response({"error": f"Maksymalnie {BATCH_MAX_STANDS} stoisk w jednym zapytaniu"},
+                      status=status.HTTP_400_BAD_REQUEST)
+    if not stand_stores:
+        return Response({"error": "Nie znaleziono stoisk"}, status=status.HTTP_404_NOT_FOUND)
+
+    # Check permissions
+    forbidden = [stand_id for stand_id, store_id in stand_stores.items()
+                 if not has_stand_access(request.user, stand_id, store_id)]
+    if forbidden:
+        return Response({"error": "Nie masz uprawnień do stoisk", "stands": forbidden},
+                      status=status.HTTP_403_FORBIDDEN)
+
+    snapshots = playlist.get_snapshots(list(stand_stores))
+    ordered = [snapshots[stand_id] for stand_id in sorted(snapshots)]
+    etag = '"%s"' % hashlib.md5(','.join(snapshot['etag'] for snapshot in ordered).encode('utf-8')).hexdigest()
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response({'playlists': [snapshot['data'] for snapshot in ordered]}, headers=headers)
+
+
+# Maksymalny horyzont manifestu offline (godziny)
+MANIFEST_MAX_HOURS = 7 * 24
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated, IsPlayerOrAdmin])
+def stand_manifest(request, stand_id):
+    """
+    Manifest do odtwarzania offline: oś czasu playlisty na najbliższe
+    ?hours=N godzin (domyślnie 24) z listą materiałów do pobrania z wyprzedzeniem.
+    """
+    try:
+        hours = int(request.GET.get('hours', 24))
+    except ValueError:
+        return Response({"error": "Parametr hours musi być liczbą całkowitą"},
+                      status=status.HTTP_400_BAD_REQUEST)
+    if not 1 <= hours <= MANIFEST_MAX_HOURS:
+        return Response({"error": f"Parametr hours musi mieścić się w zakresie 1-{MANIFEST_MAX_HOURS}"},
+                      status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        resolver = PlaylistResolver.for_stand(stand_id)
     except Stand.DoesNotExist:
         return Response({"error": "Stoisko nie istnieje"}, 
                       status=status.HTTP_404_NOT_FOUND)
-    
+
+    stand = resolver.stand
+    if not has_stand_access(request.user, stand.id, stand.department.store_id):
+        return Response({"error": "Nie masz uprawnień do tego stoiska"}, 
+                      status=status.HTTP_403_FORBIDDEN)
+
+    return Response(playlist.build_manifest(resolver, stand, timezone.now(), hours))
+
+
+# Jak często strumień SSE sprawdza wersję playlisty i co ile wysyła keep-alive
+PLAYLIST_EVENTS_POLL_INTERVAL = 2
+PLAYLIST_EVENTS_KEEPALIVE = 15
+# Po tym czasie zamykamy połączenie - odtwarzacz pobiera nowy bilet i łączy się ponownie
+PLAYLIST_EVENTS_MAX_AGE = 60 * 60
+# Ważność biletu strumienia (trafia do adresu URL, więc musi szybko wygasać)
+PLAYLIST_EVENTS_TICKET_MAX_AGE = 60
+PLAYLIST_EVENTS_TICKET_SALT = 'advertisements.playlist_events'
+
+
+def _playlist_event(snapshot):
+    payload = json.dumps({'version': snapshot['version'], 'etag': snapshot['etag']})
+    return f"event: playlist\nid: {snapshot['version']}\ndata: {payload}\n\n"
+
+
+async def _playlist_event_stream(stand_id):
+    """
+    Wysyła zdarzenie "playlist" przy każdej zmianie skompilowanej playlisty:
+    po podbiciu wersji treści lub po minięciu granicy okna harmonogramu.
+    """
+    # Snapshot nie korzysta ze stanu wątku - nie blokujemy wspólnego wątku synchronicznego
+    get_snapshot = sync_to_async(playlist.get_snapshot, thread_sensitive=False)
+    snapshot = await get_snapshot(stand_id)
+    yield f"retry: 10000\n\n{_playlist_event(snapshot)}"
+
+    loop = asyncio.get_running_loop()
+    started = last_sent = loop.time()
+    version_key = playlist.VERSION_KEY.format(stand_id=stand_id)
+    while loop.time() - started < PLAYLIST_EVENTS_MAX_AGE:
+        await asyncio.sleep(PLAYLIST_EVENTS_POLL_INTERVAL)
+        version = await cache.aget(version_key)
+        if version != snapshot['version'] or timezone.now() >= snapshot['valid_until']:
+            etag = snapshot['etag']
+            snapshot = await get_snapshot(stand_id)
+            if snapshot['etag'] != etag:
+                yield _playlist_event(snapshot)
+                last_sent = loop.time()
+                continue
+        if loop.time() - last_sent >= PLAYLIST_EVENTS_KEEPALIVE:
+            yield ": keep-alive\n\n"
+            last_sent = loop.time()
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated, IsPlayerOrAdmin])
+def stand_playlist_events_ticket(request, stand_id):
+    """
+    Krótkotrwały bilet do strumienia zmian playlisty stoiska. EventSource nie
+    pozwala ustawić nagłówka Authorization, a token API w adresie trafiałby do
+    logów serwerów - bilet ważny PLAYLIST_EVENTS_TICKET_MAX_AGE sekund i tylko
+    dla tego stoiska nie daje dostępu do niczego innego.
+    """
+    store_id = Stand.objects.filter(pk=stand_id).values_list('department__store_id', flat=True).first()
+    if store_id is None:
+        return Response({"error": "Stoisko nie istnieje"}, status=status.HTTP_404_NOT_FOUND)
+    if not has_stand_access(request.user, stand_id, store_id):
+        return Response({"error": "Nie masz uprawnień do tego stoiska"}, status=status.HTTP_403_FORBIDDEN)
+
+    ticket = signing.dumps({'stand': stand_id, 'user': request.user.pk}, salt=PLAYLIST_EVENTS_TICKET_SALT)
+    events_url = reverse('api-stand-playlist-events', kwargs={'stand_id': stand_id})
+    return Response({
+        "ticket": ticket,
+        "expires_in": PLAYLIST_EVENTS_TICKET_MAX_AGE,
+        "events_url": f"{events_url}?ticket={ticket}",
+    })
+
+
+async def stand_playlist_events(request, stand_id):
+    """
+    Strumień Server-Sent Events ze zmianami playlisty stoiska.
+
+    Przeglądarka uwierzytelnia się biletem ?ticket= (stand_playlist_events_ticket),
+    inni klienci mogą też użyć nagłówka Authorization. Połączenie trwa do
+    PLAYLIST_EVENTS_MAX_AGE, więc widok działa tylko pod ASGI
+    (zarzadzanie_reklamami.asgi) - pod WSGI zajmowałby na ten czas cały worker.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "Strumień zdarzeń wymaga serwera ASGI"},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    user = None
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Token '):
+        token = await Token.objects.select_related('user').filter(key=auth_header[len('Token '):].strip()).afirst()
+        user = token.user if token else None
+    elif request.GET.get('ticket'):
+        try:
+            ticket = signing.loads(request.GET['ticket'], salt=PLAYLIST_EVENTS_TICKET_SALT,
+                                   max_age=PLAYLIST_EVENTS_TICKET_MAX_AGE)
+        except signing.BadSignature:
+            ticket = None
+        if ticket and ticket.get('stand') == stand_id:
+            user = await User.objects.filter(pk=ticket.get('user')).afirst()
+    if user is None:
+        return JsonResponse({"error": "Nieprawidłowy lub wygasły bilet"}, status=status.HTTP_401_UNAUTHORIZED)
+
+    store_id = await Stand.objects.filter(pk=stand_id).values_list('department__store_id', flat=True).afirst()
+    if store_id is None:
+        return JsonResponse({"error": "Stoisko nie istnieje"}, status=status.HTTP_404_NOT_FOUND)
+    if not user.is_active or not has_stand_access(user, stand_id, store_id):
+        return JsonResponse({"error": "Nie masz uprawnień do tego stoiska"}, status=status.HTTP_403_FORBIDDEN)
+
+    response = StreamingHttpResponse(_playlist_event_stream(stand_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
@@ -203,11 +360,19 @@ def schedule_details(request, schedule_id):
             'end_time': schedule.end_time.isoformat(),
             'repeat_type': schedule.repeat_type,
             'repeat_days': schedule.repeat_days,
+            'recurrence_rule': schedule.recurrence_rule,
             'priority': schedule.priority,
             'is_active': schedule.is_active,
             'is_overnight': is_overnight,
             'materials': material_data
         }
+
+        rule = schedule.compiled_rule()
+        if rule is not None:
+            # Najbliższe dni emisji reguły niestandardowej (podgląd w kalendarzu)
+            today = timezone.localdate()
+            data['next_occurrences'] = [day.isoformat() for day in rule.occurrences(
+                today, schedule.end_date or today + timedelta(days=recurrence.MAX_RULE_DAYS), limit=5)]
         
         return Response(data)
         
@@ -216,52 +381,52 @@ def schedule_details(request, schedule_id):
                       status=status.HTTP_404_NOT_FOUND)
 
 
+def _calendar_date(value):
+    """Data lokalna z parametru okna kalendarza (ISO, także z 'Z' lub przesunięciem)."""
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if timezone.is_aware(moment):
+        moment = timezone.localtime(moment)
+    return moment.date()
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
-def api_schedule_events(request, stand_id):
-    schedules = EmissionSchedule.objects.filter(
-        materials__stand_id=stand_id,
-        is_active=True
-    ).distinct()
-
-    events = []
-
-    for s in schedules:
-        # Ustal daty bazowe
-        end_date = s.end_date if s.end_date else s.start_date
-        start_datetime = datetime.combine(s.start_date, s.start_time)
-        end_datetime = datetime.combine(end_date, s.end_time)
-
-        # Jeżeli harmonogram nocny, przesuwamy koniec o 1 dzień
-        if s.start_time > s.end_time:
-            end_datetime += timedelta(days=1)
-
-        # Jeżeli mimo to koniec jest wcześniejszy lub równy początkowi, też dodaj dzień
-        if end_datetime <= start_datetime:
-            end_datetime += timedelta(days=1)
-
-        print(start_datetime.isoformat())
-        print(end_datetime.isoformat())
-
-        events.append({
-            "id": s.id,
-            "title": s.name,
-            "start": start_datetime.isoformat(),
-            "end": end_datetime.isoformat(),
-            "allDay": False,
-            "backgroundColor": "#3788d8",
-            "borderColor": "#3788d8",
-            "textColor": "#ffffff",
-            "extendedProps": {
-                "priority": s.priority,
-                "repeat_type": s.repeat_type,
-                "isOvernight": s.start_time > s.end_time,
-                "materials": list(s.materials.values()),  # jeśli chcesz wysłać materiały
-                "stand_id": stand_id,
-            }
-        })
+def schedule_events(request, stand_id):
+    """
+    Zdarzenia kalendarza emisji stoiska w oknie ?start=&end= (ISO, koniec
+    wyłącznie jak w FullCalendar; domyślnie 6 tygodni od początku miesiąca).
+    Każde wystąpienie harmonogramu to osobne zdarzenie z konkretnym start/end.
+    Odpowiedź jest cache'owana - z pasującym If-None-Match zwracamy 304.
+    """
+    store_id = Stand.objects.filter(id=stand_id).values_list('department__store_id', flat=True).first()
+    if store_id is None:
+        return Response({"error": "Stoisko nie istnieje"},
+                      status=status.HTTP_404_NOT_FOUND)
+    if not has_stand_access(request.user, stand_id, store_id):
+        return Response({"error": "Nie masz uprawnień do tego stoiska"},
+                      status=status.HTTP_403_FORBIDDEN)
+
+    start, end = request.GET.get('start'), request.GET.get('end')
+    if start and end:
+        try:
+            start_date = _calendar_date(start)
+            end_date = _calendar_date(end) - timedelta(days=1)
+        except ValueError:
+            return Response({"error": "Parametry start i end muszą być datami w formacie ISO"},
+                          status=status.HTTP_400_BAD_REQUEST)
+    else:
+        start_date = timezone.localdate().replace(day=1)
+        end_date = start_date + timedelta(days=41)
+    if not 0 <= (end_date - start_date).days < calendar_feed.MAX_WINDOW_DAYS:
+        return Response({"error": f"Okno kalendarza musi obejmować od 1 do {calendar_feed.MAX_WINDOW_DAYS} dni"},
+                      status=status.HTTP_400_BAD_REQUEST)
 
-    return JsonResponse(events, safe=False)
+    feed = calendar_feed.get_feed(stand_id, start_date, end_date)
+    headers = {'ETag': feed['etag'], 'Cache-Control': 'private, no-cache'}
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if feed['etag'] in [tag.strip() for tag in if_none_match.split(',')]:
+        return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return HttpResponse(feed['body'], content_type='application/json', headers=headers)
 
 
 @api_view(['POST'])
@@ -320,28 +485,17 @@ def report_player_status(request):
         if not (user.is_player() or user.is_superadmin() or user.is_editor()):
             return Response({"error": "Brak uprawnień"}, status=status.HTTP_403_FORBIDDEN)
         
-        stand = getattr(user, 'managed_stand', None)
-        if not stand:
+        if not user.managed_stand_id:
             return Response({"error": "Brak przypisanego stoiska"}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Pobierz lub utwórz obiekt PlayerStatus
-        player_status, created = PlayerStatus.objects.get_or_create(stand=stand)
-        
-        # Aktualizuj informacje o statusie
-        player_status.last_seen = timezone.now()
-        player_status.is_online = True
-        player_status.ip_address = request.META.get('REMOTE_ADDR')
-        player_status.user_agent = request.META.get('HTTP_USER_AGENT', '')
-        
-        # Aktualizacja opcjonalnych danych
-        if 'screen_resolution' in request.data:
-            player_status.screen_resolution = request.data['screen_resolution']
-        if 'version' in request.data:
-            player_status.version = request.data['version']
-        if 'errors' in request.data:
-            player_status.errors = request.data['errors']
-            
-        player_status.save()
+        # Heartbeat trafia do bufora zapisywanego zbiorczo (advertisements.heartbeats)
+        optional = {field: request.data[field] for field in heartbeats.OPTIONAL_FIELDS if field in request.data}
+        heartbeats.record_heartbeat(
+            user.managed_stand_id,
+            ip_address=request.META.get('REMOTE_ADDR'),
+            user_agent=request.META.get('HTTP_USER_AGENT', ''),
+            **optional
+        )
         
         return Response({"status": "ok"})
         
@@ -364,17 +518,9 @@ def get_player_status(request, stand_id):
                 (user.is_editor() and stand == user.managed_stand)):
             return Response({"error": "Brak uprawnień"}, status=status.HTTP_403_FORBIDDEN)
             
-        # Pobierz lub utwórz status odtwarzacza
-        player_status, created = PlayerStatus.objects.get_or_create(stand=stand)
-        
-        # Sprawdź, czy status jest aktualny (ostatnia aktywność < 90 sekund)
-        from datetime import timedelta
-        is_online = False
-        if player_status.last_seen:
-            is_online = timezone.now() - player_status.last_seen <= timedelta(seconds=90)
-            if player_status.is_online != is_online:
-                player_status.is_online = is_online
-                player_status.save(update_fields=['is_online'])
+        # Odczyt bez zapisu - stan online wynika z last_seen
+        player_status = PlayerStatus.objects.filter(stand=stand).first() or PlayerStatus(stand=stand)
+        is_online = heartbeats.is_online(player_status.last_seen)
         
         return Response({
             "is_online": is_online,
@@ -388,8 +534,258 @@ def get_player_status(request, stand_id):
         return Response({"error": "Stoisko nie istnieje"}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    
-    
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def fleet_player_status(request):
+    """
+    Statusy wszystkich odtwarzaczy sklepu (admin sklepu) lub wszystkich
+    sklepów (superadmin, opcjonalnie zawężone parametrem ?store=).
+    Jedno zapytanie, bez zapisów.
+    """
+    user = request.user
+    stands = Stand.objects.all()
+    if user.is_superadmin():
+        if 'store' in request.GET:
+            try:
+                stands = stands.filter(department__store_id=int(request.GET['store']))
+            except ValueError:
+                return Response({"error": "Parametr store musi być liczbą"}, status=status.HTTP_400_BAD_REQUEST)
+    elif user.is_store_admin() and user.managed_store_id:
+        stands = stands.filter(department__store_id=user.managed_store_id)
+    else:
+        return Response({"error": "Brak uprawnień"}, status=status.HTTP_403_FORBIDDEN)
+
+    players = list(heartbeats.fleet_status(stands))
+    return Response({
+        "generated_at": timezone.now(),
+        "online_timeout": heartbeats.online_timeout(),
+        "total": len(players),
+        "online": sum(1 for player in players if player['is_online']),
+        "stands": players,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def get_player_uptime(request, stand_id):
+    """
+    Dostępność odtwarzacza w danym dniu (?date=RRRR-MM-DD, domyślnie dziś)
+    czasu lokalnego sklepu na podstawie podsumowań historii heartbeatów
+    (komenda rollup_heartbeats).
+    """
+    stand = Stand.objects.select_related('department__store').filter(pk=stand_id).first()
+    if stand is None:
+        return Response({"error": "Stoisko nie istnieje"}, status=status.HTTP_404_NOT_FOUND)
+    if not has_stand_access(request.user, stand.id, stand.department.store_id):
+        return Response({"error": "Brak uprawnień"}, status=status.HTTP_403_FORBIDDEN)
+
+    zone = stand.department.store.timezone
+    now = timezone.now()
+    try:
+        day = datetime.strptime(request.GET['date'], '%Y-%m-%d').date() if 'date' in request.GET \
+            else to_local(zone, now).date()
+    except ValueError:
+        return Response({"error": "Parametr date musi mieć format RRRR-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Doba sklepu w UTC (przy zmianie czasu ma 23 lub 25 godzin)
+    bounds = local_day(zone, day)
+    start = bounds.start
+    end = min(bounds.end, now)
+    if end <= start:
+        return Response({"error": "Dzień jeszcze się nie rozpoczął"}, status=status.HTTP_400_BAD_REQUEST)
+
+    uptime = heartbeats.stand_uptime(stand.id, start, end)
+    period = int((end - start).total_seconds())
+    return Response({
+        "stand_id": stand.id,
+        "date": day.isoformat(),
+        "timezone": zone,
+        "period_seconds": period,
+        "online_seconds": uptime['online_seconds'],
+        "uptime_percent": round(100.0 * uptime['online_seconds'] / period, 2),
+        "intervals": [{"start": interval_start, "end": interval_end} for interval_start, interval_end in uptime['intervals']],
+        "hourly": uptime['hourly'],
+    })
+
+
+def _upload_job(request, job_id):
+    """Zadanie wysyłki dostępne dla użytkownika: (zadanie, None) albo (None, odpowiedź z błędem)."""
+    job = UploadJob.objects.select_related('stand__department').filter(pk=job_id).first()
+    if job is None:
+        return None, Response({"error": "Zadanie nie istnieje"}, status=status.HTTP_404_NOT_FOUND)
+    if job.created_by_id != request.user.id and \
+            not has_stand_access(request.user, job.stand_id, job.stand.department.store_id):
+        return None, Response({"error": "Brak uprawnień"}, status=status.HTTP_403_FORBIDDEN)
+    return job, None
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def upload_job_status(request, job_id):
+    """Stan wysyłki pliku materiału w tle (formularz materiału odpytuje go do zakończenia)."""
+    job, error = _upload_job(request, job_id)
+    if error:
+        return error
+
+    return Response({
+        "id": job.pk,
+        "state": job.state,
+        "state_display": job.get_state_display(),
+        "file_name": job.original_name,
+        "total_bytes": job.total_bytes,
+        "uploaded_bytes": job.uploaded_bytes,
+        "progress": job.progress,
+        "attempts": job.attempts,
+        "error": job.error if job.state == 'failed' else '',
+        "material_id": job.material_id,
+    })
+
+
+def _direct_upload_response(request, job, response_status=status.HTTP_200_OK):
+    local_url = request.build_absolute_uri(reverse('api-direct-upload-local', kwargs={'job_id': job.pk}))
+    return Response({
+        "job_id": job.pk,
+        **direct_upload.sign_upload(job, local_url),
+        "sign_url": reverse('api-direct-upload-sign', kwargs={'job_id': job.pk}),
+        "complete_url": reverse('api-direct-upload-complete', kwargs={'job_id': job.pk}),
+        "success_url": reverse('stand-materials', kwargs={'pk': job.stand_id}),
+    }, status=response_status)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def direct_upload_start(request):
+    """
+    Rozpoczyna bezpośrednią wysyłkę pliku z przeglądarki: tworzy zadanie
+    z danymi materiału i zwraca podpisane parametry wysyłki kawałkami
+    (albo od razu material_id, jeśli plik o podanym sha256 jest już w Cloudinary).
+    """
+    if not direct_upload.available():
+        return Response({"error": "Wysyłka bezpośrednia jest niedostępna"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    serializer = DirectUploadSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({"errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+    stand = serializer.validated_data['stand']
+    if not has_stand_access(request.user, stand.id, stand.department.store_id):
+        return Response({"error": "Brak uprawnień"}, status=status.HTTP_403_FORBIDDEN)
+
+    job = direct_upload.start(serializer, request.user)
+    if job.state == 'done':
+        # Plik o tej treści jest już w Cloudinary - materiał powstał bez wysyłania
+        return Response({
+            "job_id": job.pk,
+            "material_id": job.material_id,
+            "success_url": reverse('stand-materials', kwargs={'pk': job.stand_id}),
+        }, status=status.HTTP_201_CREATED)
+    return _direct_upload_response(request, job, status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def direct_upload_sign(request, job_id):
+    """Nowy podpis dla wznawianej wysyłki (ten sam identyfikator wysyłki)."""
+    job, error = _upload_job(request, job_id)
+    if error:
+        return error
+    if job.state != 'direct':
+        return Response({"error": "Wysyłka została już zakończona"}, status=status.HTTP_409_CONFLICT)
+    return _direct_upload_response(request, job)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def direct_upload_complete(request, job_id):
+    """Rejestruje wynik wysyłki (public_id, wersja, podpis Cloudinary) jako nowy materiał."""
+    job, error = _upload_job(request, job_id)
+    if error:
+        return error
+    try:
+        material = direct_upload.complete(job, request.data)
+    except direct_upload.DirectUploadError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        "material_id": material.pk,
+        "success_url": reverse('stand-materials', kwargs={'pk': job.stand_id}),
+    })
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([permissions.AllowAny])
+def direct_upload_local(request, job_id):
+    """
+    Lokalny zastępnik wysyłki kawałkami do Cloudinary (DIRECT_UPLOAD_BACKEND='local').
+    Autoryzacją jest podpis z parametrów wysyłki.
+    """
+    if direct_upload.backend() != 'local':
+        return Response({"error": "Backend lokalny jest wyłączony"}, status=status.HTTP_404_NOT_FOUND)
+    job = UploadJob.objects.filter(pk=job_id).first()
+    if job is None or 'file' not in request.FILES:
+        return Response({"error": "Brak zadania lub pliku"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        result = direct_upload.receive_chunk(job, request.data.get('signature', ''),
+                                             request.headers.get('Content-Range'), request.FILES['file'])
+    except direct_upload.DirectUploadError as e:
+        return Response({"error": {"message": str(e)}}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(result)
+
+
+def _slot_moment(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(value)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def emission_slot_list(request):
+    """
+    Wystąpienia emisji nachodzące na okno [?start, ?end) (data i godzina ISO,
+    bez strefy - czas serwera), opcjonalnie zawężone parametrem ?stand=,
+    ?department= lub ?store=. Jedno zapytanie po indeksie wystąpień.
+    """
+    try:
+        start = _slot_moment(request.GET['start'])
+        end = _slot_moment(request.GET['end'])
+    except (KeyError, ValueError):
+        return Response({"error": "Parametry start i end muszą być datą i godziną ISO"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if not start < end <= start + timedelta(days=emission_slots.MAX_WINDOW_DAYS):
+        return Response({"error": f"Okno musi być niepuste i nie dłuższe niż {emission_slots.MAX_WINDOW_DAYS} dni"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    user = request.user
+    slots = emission_slots.slots_between(start, end)
+    if user.is_superadmin():
+        pass
+    elif user.is_store_admin() and user.managed_store_id:
+        slots = slots.filter(stand__department__store_id=user.managed_store_id)
+    elif (user.is_editor() or user.is_player()) and user.managed_stand_id:
+        slots = slots.filter(stand_id=user.managed_stand_id)
+    else:
+        return Response({"error": "Brak uprawnień"}, status=status.HTTP_403_FORBIDDEN)
+
+    for parameter, lookup in (('stand', 'stand_id'), ('department', 'stand__department_id'),
+                              ('store', 'stand__department__store_id')):
+        if parameter in request.GET:
+            try:
+                slots = slots.filter(**{lookup: int(request.GET[parameter])})
+            except ValueError:
+                return Response({"error": f"Parametr {parameter} musi być liczbą"},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        "start": start,
+        "end": end,
+        "slots": list(slots.order_by('start', 'stand_id', '-priority').values(
+            'stand_id', 'material_id', 'schedule_id', 'priority', 'start', 'end',
+        )),
+    })
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_departments_for_store(request, store_id):
@@ -463,15 +859,7 @@ def update_schedule_statuses(request):
     if not (request.user.is_superadmin() or request.user.is_store_admin()):
         return Response({"error": "Brak uprawnień"}, status=status.HTTP_403_FORBIDDEN)
         
-    now = timezone.now()
-    expired_count = 0
-    
-    active_schedules = EmissionSchedule.objects.filter(is_active=True)
-    for schedule in active_schedules:
-        if schedule.has_ended():
-            schedule.is_active = False
-            schedule.save()
-            expired_count += 1
+    expired_count = schedule_status.deactivate_expired()
             
     return Response({
         "status": "success",
@@ -0,0 +1,124 @@
+"""
+Deduplikacja plików materiałów według treści (MediaAsset).
+
+Przesłany plik jest haszowany strumieniowo (SHA-256) już przy zapisie na
+dysk; jeśli plik o tej samej treści jest w rejestrze, nowy materiał dostaje
+istniejący public_id i nic nie jest wysyłane do Cloudinary. Materiały
+wskazujące na zasób są jego odwołaniami - release() usuwa plik z Cloudinary
+dopiero razem z ostatnim z nich.
+
+Wiersz zasobu jest blokowany (select_for_update) zarówno przy dołączaniu
+nowego materiału, jak i przy zwalnianiu, więc materiał nie może dostać
+zasobu, który właśnie jest usuwany.
+
+Materiały sprzed rejestru (bez zasobu) wskazujące na ten sam plik są
+dołączane do zasobu przy jego rejestracji (adopt_legacy) - inaczej usunięcie
+ostatniego materiału z zasobem skasowałoby plik, którego nadal używają.
+
+Skrót zgłoszony przez przeglądarkę służy tylko do wyszukania istniejącego
+zasobu - do rejestru trafiają wyłącznie skróty policzone przez serwer, inaczej
+dowolny plik można by zarejestrować pod skrótem cudzej treści.
+"""
+import hashlib
+import logging
+import re
+
+import cloudinary.uploader
+from django.db import IntegrityError, transaction
+
+from .models import AdvertisementMaterial, MediaAsset
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """Skrót SHA-256 pliku liczony kawałkami (bez wczytywania całego pliku do pamięci)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def lookup(sha256):
+    """
+    Zasób o danej treści zablokowany do końca bieżącej transakcji (wywołujący
+    dołącza do niego materiał w tej samej transakcji) albo None.
+    """
+    if not sha256:
+        return None
+    return MediaAsset.objects.select_for_update().filter(sha256=sha256).first()
+
+
+def _by_public_id(public_id):
+    return MediaAsset.objects.select_for_update().filter(public_id=public_id).first()
+
+
+def adopt_legacy(asset):
+    """
+    Dołącza do zasobu materiały bez zasobu, których pole file wskazuje na jego
+    plik (wartość CloudinaryField: [typ/upload/][v<wersja>/]public_id[.format]).
+    """
+    pattern = rf'^([^/]+/[^/]+/)?(v[0-9]+/)?{re.escape(asset.public_id)}(\.[^./]+)?$'
+    return AdvertisementMaterial.objects.filter(asset__isnull=True, file__regex=pattern).update(asset=asset)
+
+
+def register(sha256, result):
+    """
+    Zapisuje w rejestrze plik wysłany do Cloudinary (wywoływane w transakcji
+    razem z utworzeniem materiału). Jeśli ta sama treść została w międzyczasie
+    zarejestrowana przez inną wysyłkę, zwraca istniejący zasób, a świeżo
+    wysłany duplikat usuwa z Cloudinary. Plik o public_id, który już jest
+    w rejestrze, nie tworzy nowego zasobu - zwracany jest istniejący.
+    """
+    existing = _by_public_id(result['public_id'])
+    if existing is not None:
+        return existing
+    existing = lookup(sha256)
+    if existing is None:
+        try:
+            with transaction.atomic():
+                asset = MediaAsset.objects.create(
+                    sha256=sha256 or None,
+                    public_id=result['public_id'],
+                    resource_type=result.get('resource_type') or 'image',
+                    format=result.get('format') or '',
+                    version=str(result.get('version') or ''),
+                    file_size=result.get('bytes'),
+                )
+                adopt_legacy(asset)
+                return asset
+        except IntegrityError:
+            existing = _by_public_id(result['public_id']) or lookup(sha256)
+            if existing is None:
+                raise
+
+    if existing.public_id != result['public_id']:
+        public_id, resource_type = result['public_id'], result.get('resource_type') or 'image'
+        logger.info(f'Plik {public_id} ma tę samą treść co {existing.public_id} - usuwam duplikat')
+        transaction.on_commit(lambda: destroy(public_id, resource_type))
+    return existing
+
+
+def destroy(public_id, resource_type):
+    try:
+        result = cloudinary.uploader.destroy(public_id, resource_type=resource_type, invalidate=True)
+        logger.info(f'Usunięto plik Cloudinary {public_id}, rezultat: {result}')
+    except Exception as e:
+        logger.error(f'Błąd podczas usuwania pliku Cloudinary {public_id}: {e}')
+
+
+def release(asset_id):
+    """
+    Usuwa zasób z rejestru i z Cloudinary, jeśli nie wskazuje na niego już
+    żaden materiał. Zwraca True, jeśli zasób został usunięty.
+    """
+    with transaction.atomic():
+        asset = MediaAsset.objects.select_for_update().filter(pk=asset_id).first()
+        if asset is None or asset.materials.exists():
+            return False
+        asset.delete()
+        transaction.on_commit(lambda: destroy(asset.public_id, asset.resource_type))
+    return True
@@ -0,0 +1,106 @@
+"""
+Kanał zdarzeń kalendarza harmonogramów stoiska.
+
+Powtórzenia są rozwijane po stronie serwera tylko w obrębie żądanego okna
+dat (te same reguły co is_scheduled_for_date), materiały pobierane jednym
+zapytaniem, a kolor harmonogramu wynika z jego id - dzięki temu odpowiedź
+jest deterministyczna i może być cache'owana. Klucz cache zawiera wersję
+treści stoiska (playlist.get_version), więc każda zmiana harmonogramów lub
+materiałów stoiska automatycznie unieważnia zapisane odpowiedzi.
+"""
+import colorsys
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from .models import EmissionSchedule
+from .playlist import get_version
+
+FEED_KEY = 'calendar:{stand_id}:{version}:{start}:{end}'
+FEED_MAX_AGE = 60 * 60
+# Najdłuższe okno, jakie rozwijamy w jednym zapytaniu
+MAX_WINDOW_DAYS = 400
+
+# Złoty podział rozkłada odcienie kolejnych id równomiernie po kole barw
+GOLDEN_RATIO = 0.618033988749895
+
+
+def schedule_color(schedule_id):
+    """Stały kolor harmonogramu (#rrggbb) wyznaczony z jego id."""
+    hue = (schedule_id * GOLDEN_RATIO) % 1
+    r, g, b = colorsys.hsv_to_rgb(hue, 0.65, 0.8)
+    return f"#{int(r * 255):02x}{int(g * 255):02x}{int(b * 255):02x}"
+
+
+def _event(schedule, stand_id, materials_data, day):
+    start = datetime.combine(day, schedule.start_time)
+    end = datetime.combine(day, schedule.end_time)
+    overnight = schedule.start_time > schedule.end_time
+    if overnight:
+        end += timedelta(days=1)
+    color = schedule_color(schedule.id)
+    return {
+        'id': schedule.id,
+        'groupId': schedule.id,
+        'title': f"{schedule.name} ({', '.join(material['type'] for material in materials_data)})",
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'allDay': False,
+        'backgroundColor': color,
+        'borderColor': color,
+        'textColor': '#ffffff',
+        'extendedProps': {
+            'materials': materials_data,
+            'repeat_type': schedule.repeat_type,
+            'priority': schedule.priority,
+            'is_active': schedule.is_active,
+            'isOvernight': overnight,
+            'stand_id': stand_id,
+        },
+    }
+
+
+def build_events(stand_id, start_date, end_date):
+    """
+    Wystąpienia harmonogramów stoiska w dniach [start_date, end_date].
+    Harmonogram nocny z dnia poprzedzającego okno też jest uwzględniany.
+    """
+    first_day = start_date - timedelta(days=1)
+    schedules = EmissionSchedule.objects.filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=first_day),
+        materials__stand_id=stand_id,
+        start_date__lte=end_date,
+    ).distinct().prefetch_related('materials').order_by('start_time', 'id')
+
+    days = [first_day + timedelta(days=offset) for offset in range((end_date - first_day).days + 1)]
+    events = []
+    for schedule in schedules:
+        materials_data = [{'id': material.id, 'type': material.get_material_type_display()}
+                          for material in schedule.materials.all()]
+        overnight = schedule.start_time > schedule.end_time
+        for day in days:
+            if day < start_date and not overnight:
+                continue
+            if schedule.is_scheduled_for_date(day):
+                events.append(_event(schedule, stand_id, materials_data, day))
+    events.sort(key=lambda event: (event['start'], event['id']))
+    return events
+
+
+def get_feed(stand_id, start_date, end_date):
+    """
+    Zdarzenia kalendarza jako gotowa odpowiedź: {'body': bajty JSON, 'etag': ...}.
+    Wynik jest cache'owany per stoisko, wersję treści i okno dat.
+    """
+    key = FEED_KEY.format(stand_id=stand_id, version=get_version(stand_id),
+                          start=start_date.isoformat(), end=end_date.isoformat())
+    feed = cache.get(key)
+    if feed is None:
+        body = json.dumps(build_events(stand_id, start_date, end_date), cls=DjangoJSONEncoder).encode('utf-8')
+        feed = {'body': body, 'etag': '"%s"' % hashlib.md5(body).hexdigest()}
+        cache.set(key, feed, FEED_MAX_AGE)
+    return feed
@@ -0,0 +1,246 @@
+"""
+Analiza konfliktów harmonogramów emisji stoiska.
+
+Harmonogramy stoiska są rozwijane na kolejne dni horyzontu (reguły dni
+liczone wektorowo przez ScheduleMatrix) na przedziały czasu, a następnie
+przeglądane miotłą (sweep-line) po punktach początku i końca przedziałów.
+Zgodnie z PlaylistResolver emitowane są materiały wszystkich aktywnych
+harmonogramów, a priorytet decyduje o kolejności i o tym, z którego
+harmonogramu pochodzi materiał. Raport obejmuje:
+
+- remisy: okna, w których co najmniej dwa harmonogramy z tym samym
+  priorytetem obowiązują jednocześnie (kolejność emisji jest wtedy przypadkowa),
+- harmonogramy przysłonięte: takie, których żaden materiał nigdy nie jest
+  emitowany z ich priorytetem, bo zawsze zapewnia go harmonogram o wyższym
+  priorytecie (lub które w horyzoncie w ogóle nie obowiązują),
+- luki: okna, w których stoisko ma harmonogramy, ale żaden nie obowiązuje
+  (odtwarzacz emituje wtedy wszystkie aktywne materiały).
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+from .models import EmissionSchedule
+from .schedule_index import DAY_MICROSECONDS, schedule_segments
+from .schedule_matrix import ScheduleMatrix
+from .store_time import to_local
+
+HORIZON_DAYS = 42
+MIN_GAP = timedelta(minutes=1)
+
+Window = namedtuple('Window', ['start', 'end', 'schedule_ids', 'priority'])
+
+
+class ConflictReport:
+    def __init__(self, ties, shadowed, never_active, gaps, names=None):
+        self.ties = ties
+        self.shadowed = shadowed
+        self.never_active = never_active
+        self.gaps = gaps
+        self.names = names or {}
+
+    def __bool__(self):
+        return bool(self.ties or self.shadowed or self.never_active or self.gaps)
+
+    def for_schedule(self, schedule_id):
+        """Problemy, w których uczestniczy dany harmonogram (remisy, przysłonięcie)."""
+        return {
+            'ties': [window for window in self.ties if schedule_id in window.schedule_ids],
+            'shadowed': schedule_id in self.shadowed,
+            'never_active': schedule_id in self.never_active,
+        }
+
+
+def _merge(windows):
+    """Scala stykające się okna z tym samym zbiorem harmonogramów i priorytetem."""
+    merged = []
+    for window in sorted(windows, key=lambda window: (window.schedule_ids, window.priority or 0, window.start)):
+        previous = merged[-1] if merged else None
+        if previous and previous.end == window.start and previous.schedule_ids == window.schedule_ids \
+                and previous.priority == window.priority:
+            merged[-1] = previous._replace(end=window.end)
+        else:
+            merged.append(window)
+    merged.sort(key=lambda window: (window.start, window.schedule_ids))
+    return merged
+
+
+def _sweep_day(day_keys, segments, priorities, schedule_materials, material_schedules, shadows, seen, effective):
+    """
+    Przegląd jednego dnia: zwraca remisy i luki jako okna w mikrosekundach doby
+    (start, koniec, harmonogramy, priorytet); uzupełnia seen i effective.
+    """
+    changes = {0: [], DAY_MICROSECONDS: []}
+    for key in day_keys:
+        for start, end in segments[key]:
+            changes.setdefault(start, []).append((1, key))
+            changes.setdefault(end, []).append((-1, key))
+
+    ties, gaps = [], []
+    open_ties = {}
+    points = sorted(changes)
+    active = {}
+    active_count = 0
+    by_priority = {}
+    tied_groups = {}
+    for point, next_point in zip(points, points[1:]):
+        touched = set()
+        for delta, key in changes[point]:
+            previous = active.get(key, 0)
+            count = active[key] = previous + delta
+            if (previous > 0) != (count > 0):
+                active_count += 1 if count > 0 else -1
+                group = by_priority.setdefault(priorities[key], set())
+                if count > 0:
+                    group.add(key)
+                    seen.add(key)
+                else:
+                    group.discard(key)
+                touched.add(priorities[key])
+        for priority in touched:
+            group = by_priority[priority]
+            if len(group) > 1:
+                tied_groups[priority] = tuple(sorted(group))
+            else:
+                tied_groups.pop(priority, None)
+
+        if not active_count:
+            if gaps and gaps[-1][1] == point:
+                gaps[-1] = (gaps[-1][0], next_point, (), None)
+            else:
+                gaps.append((point, next_point, (), None))
+            continue
+
+        for priority, schedule_ids in tied_groups.items():
+            previous = open_ties.get((schedule_ids, priority))
+            if previous is not None and ties[previous][1] == point:
+                ties[previous] = (ties[previous][0], next_point, schedule_ids, priority)
+            else:
+                open_ties[(schedule_ids, priority)] = len(ties)
+                ties.append((point, next_point, schedule_ids, priority))
+
+        # Materiał jest emitowany z priorytetem najwyższego harmonogramu, który go zawiera -
+        # harmonogram jest skuteczny, jeśli któregoś jego materiału nie ma w aktywnym
+        # harmonogramie o wyższym priorytecie. Sprawdzamy tylko harmonogramy, których
+        # sytuacja mogła się zmienić: właśnie włączone i przysłaniane przez właśnie wyłączone.
+        candidates = set()
+        for delta, key in changes[point]:
+            candidates.update((key,) if delta > 0 else shadows[key])
+        for key in candidates:
+            if key in effective or active.get(key, 0) <= 0:
+                continue
+            priority = priorities[key]
+            for material_id in schedule_materials.get(key, ()):
+                if not any(active.get(other, 0) > 0 and priorities[other] > priority
+                           for other in material_schedules[material_id]):
+                    effective.add(key)
+                    break
+    return ties, gaps
+
+
+def _overlaps(segments, other):
+    return any(start < other_end and other_start < end
+               for start, end in segments for other_start, other_end in other)
+
+
+def analyse(schedules, schedule_materials, start_date, days=HORIZON_DAYS, focus=None):
+    """
+    Analizuje harmonogramy jednego stoiska w dniach [start_date, start_date + days).
+
+    schedule_materials: {klucz harmonogramu: zbiór id materiałów stoiska};
+    kluczem jest pk (lub 0 dla niezapisanego harmonogramu). Dni z tym samym
+    zbiorem obowiązujących harmonogramów są przeglądane tylko raz.
+
+    focus (klucz harmonogramu) zawęża analizę do problemów tego harmonogramu:
+    pomijane są harmonogramy o rozłącznych oknach godzinowych i dni, w które
+    on nie obowiązuje (luki nie są wtedy raportowane).
+    """
+    schedules = [schedule for schedule in schedules if schedule.is_active]
+    segments = {schedule.pk or 0: schedule_segments(schedule) for schedule in schedules}
+    if focus is not None:
+        if focus not in segments:
+            return ConflictReport([], [], [], [])
+        schedules = [schedule for schedule in schedules
+                     if _overlaps(segments[schedule.pk or 0], segments[focus])]
+    keys = [schedule.pk or 0 for schedule in schedules]
+    priorities = {key: schedule.priority for key, schedule in zip(keys, schedules)}
+    material_schedules = {}
+    for key in keys:
+        for material_id in schedule_materials.get(key, ()):
+            material_schedules.setdefault(material_id, []).append(key)
+    # Harmonogramy, które dany harmonogram może przysłaniać (wspólny materiał, niższy priorytet)
+    shadows = {key: {other for material_id in schedule_materials.get(key, ())
+                     for other in material_schedules[material_id] if priorities[other] < priorities[key]}
+               for key in keys}
+
+    dates = [start_date + timedelta(days=offset) for offset in range(days)]
+    scheduled = ScheduleMatrix(schedules).days(dates) if schedules else None
+
+    ties, gaps = [], []
+    seen, effective = set(), set()
+    day_results = {}
+    focus_row = keys.index(focus) if focus is not None else None
+    for column, day in enumerate(dates):
+        if focus_row is not None and not scheduled[focus_row, column]:
+            continue
+        pattern = scheduled[:, column].tobytes() if keys else b''
+        result = day_results.get(pattern)
+        if result is None:
+            day_keys = [key for row, key in enumerate(keys) if scheduled[row, column]]
+            result = day_results[pattern] = _sweep_day(
+                day_keys, segments, priorities, schedule_materials, material_schedules, shadows, seen, effective,
+            )
+        day_ties, day_gaps = result
+
+        day_start = datetime.combine(day, datetime.min.time())
+        for windows, day_windows in ((ties, day_ties), (gaps, day_gaps)):
+            for start, end, schedule_ids, priority in day_windows:
+                windows.append(Window(day_start + timedelta(microseconds=start),
+                                      day_start + timedelta(microseconds=end), schedule_ids, priority))
+
+    never_active = [key for key in keys if key not in seen]
+    shadowed = [key for key in keys if key in seen and key not in effective]
+    # Luki ma sens raportować tylko, gdy stoisko ma jakiekolwiek harmonogramy; pomijamy
+    # też krótsze niż minuta (np. 23:59:00-24:00 przy włącznym końcu okna)
+    gaps = [window for window in _merge(gaps) if window.end - window.start >= MIN_GAP] if keys and focus is None else []
+    names = {key: schedule.name for key, schedule in zip(keys, schedules)}
+    return ConflictReport(_merge(ties), shadowed, never_active, gaps, names)
+
+
+def analyse_stand(stand, candidate=None, candidate_material_ids=None, start_date=None, days=HORIZON_DAYS):
+    """
+    Analiza harmonogramów stoiska; candidate (np. niezapisany harmonogram
+    z formularza) zastępuje zapisaną wersję o tym samym pk i analiza dotyczy
+    tylko jego problemów. Dwa zapytania.
+    """
+    links = EmissionSchedule.materials.through.objects.filter(
+        advertisementmaterial__stand=stand,
+        emissionschedule__is_active=True,
+    ).values_list('emissionschedule_id', 'advertisementmaterial_id')
+    schedule_materials = {}
+    for schedule_id, material_id in links:
+        schedule_materials.setdefault(schedule_id, set()).add(material_id)
+
+    schedules = list(EmissionSchedule.objects.filter(id__in=schedule_materials))
+    if candidate is not None:
+        key = candidate.pk or 0
+        schedules = [schedule for schedule in schedules if schedule.pk != candidate.pk]
+        schedules.append(candidate)
+        schedule_materials[key] = set(candidate_material_ids or ())
+
+    if start_date is None:
+        # Dzień bieżący w strefie sklepu stoiska, jak w pozostałych ewaluatorach harmonogramów
+        start_date = to_local(stand.department.store.timezone, timezone.now()).date()
+        if candidate is not None and candidate.start_date and candidate.start_date > start_date:
+            start_date = candidate.start_date
+    focus = (candidate.pk or 0) if candidate is not None else None
+    return analyse(schedules, schedule_materials, start_date, days, focus)
+
+
+def describe_window(window):
+    """Okno jako tekst, np. '2025-06-02 08:00-12:00' (koniec okna jest włączny)."""
+    end = window.end - timedelta(microseconds=1)
+    if end.date() == window.start.date():
+        return f"{window.start:%Y-%m-%d %H:%M}-{end:%H:%M}"
+    return f"{window.start:%Y-%m-%d %H:%M} - {end:%Y-%m-%d %H:%M}"
@@ -0,0 +1,205 @@
+"""
+Bezpośrednia wysyłka plików materiałów z przeglądarki do Cloudinary.
+
+Serwer tylko podpisuje parametry wysyłki (sign_upload) - przeglądarka
+wysyła plik kawałkami po CHUNK_SIZE prosto do Cloudinary (nagłówki
+Content-Range i X-Unique-Upload-Id, jak cloudinary.uploader.upload_large),
+a na końcu przekazuje wynik do complete(), które sprawdza podpis odpowiedzi
+Cloudinary i tworzy AdvertisementMaterial. Bajty pliku w ogóle nie
+przechodzą przez Django.
+
+Plik każdego zadania ma z góry ustalony public_id (public_id(), na podstawie
+upload_id) objęty podpisem - complete() przyjmuje tylko wynik z tym
+public_id, więc nie da się podpiąć pod zadanie cudzego pliku ani ponownie
+użyć wyniku innej wysyłki.
+
+Identyfikator wysyłki (UploadJob.upload_id) jest stały dla zadania, więc
+przerwaną wysyłkę można wznowić od ostatniego potwierdzonego kawałka -
+po ponownym podpisaniu parametrów, jeśli poprzedni podpis wygasł
+(Cloudinary przyjmuje podpis przez godzinę od timestamp).
+
+Przeglądarka może podać skrót SHA-256 pliku - jeśli ta treść jest już
+w rejestrze MediaAsset, materiał powstaje od razu i nic nie jest wysyłane.
+Plik wysłany bezpośrednio do Cloudinary trafia do rejestru bez skrótu
+(serwer nie widzi jego bajtów, a skrótowi z przeglądarki nie można ufać),
+więc jest liczony jako odwołanie, ale nie służy do deduplikacji.
+
+Backend 'local' (DIRECT_UPLOAD_BACKEND) zastępuje Cloudinary w testach
+i środowisku deweloperskim: kawałki przyjmuje widok direct_upload_local
+i składa je w katalogu kolejki wysyłek (tu skrót liczy serwer).
+"""
+import logging
+import os
+import re
+import time
+
+import cloudinary
+from cloudinary import utils as cloudinary_utils
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.utils.crypto import constant_time_compare
+
+from . import assets, media
+from .models import UploadJob
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = media.CHUNK_SIZE
+# Ważność podpisu backendu lokalnego (Cloudinary ma własny limit - godzinę)
+SIGNATURE_MAX_AGE = 15 * 60
+SIGNING_SALT = 'advertisements.direct_upload'
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class DirectUploadError(ValueError):
+    """Niepoprawny kawałek, podpis lub wynik wysyłki"""
+
+
+def backend():
+    return getattr(settings, 'DIRECT_UPLOAD_BACKEND', 'cloudinary')
+
+
+def available():
+    """Czy można podpisywać wysyłki (backend lokalny albo skonfigurowany klucz Cloudinary)."""
+    config = cloudinary.config()
+    return backend() == 'local' or bool(config.api_key and config.api_secret)
+
+
+def start(serializer, user):
+    """
+    Tworzy zadanie wysyłki bezpośredniej z poprawnego DirectUploadSerializer.
+    Jeśli plik o zgłoszonym skrócie jest już w Cloudinary, zadanie jest od razu
+    zakończone (state 'done') z gotowym materiałem.
+    """
+    sha256 = serializer.validated_data.pop('sha256', '')
+    with transaction.atomic():
+        job = serializer.save(
+            created_by=user if user.is_authenticated else None,
+            state='direct',
+            upload_id=cloudinary_utils.random_public_id(),
+        )
+        reused = media.reuse_existing(job, sha256)
+    if reused:
+        job.refresh_from_db()
+    return job
+
+
+def public_id(job):
+    """public_id, pod którym plik zadania musi trafić do Cloudinary."""
+    folder = (media.upload_options(job.material_type).get('folder') or '').strip('/')
+    return f'{folder}/{job.upload_id}' if folder else job.upload_id
+
+
+def sign_upload(job, local_url=None):
+    """
+    Parametry wysyłki dla przeglądarki: adres, podpisane pola formularza,
+    identyfikator wysyłki i rozmiar kawałka. local_url - adres widoku
+    direct_upload_local (tylko backend lokalny).
+    """
+    if backend() == 'local':
+        params = {'signature': signing.dumps({'job': job.pk, 'upload_id': job.upload_id}, salt=SIGNING_SALT)}
+        upload_url = local_url
+    else:
+        options = media.upload_options(job.material_type)
+        resource_type = options.pop('resource_type')
+        for key in ('folder', 'use_filename', 'unique_filename'):
+            options.pop(key, None)
+        options['public_id'] = public_id(job)
+        params = cloudinary_utils.sign_request(cloudinary_utils.build_upload_params(**options), {})
+        upload_url = cloudinary_utils.cloudinary_api_url('upload', resource_type=resource_type)
+    return {
+        'upload_url': upload_url,
+        'params': params,
+        'upload_id': job.upload_id,
+        'chunk_size': CHUNK_SIZE,
+    }
+
+
+def _local_dir():
+    path = os.path.join(media.spool_dir(), 'direct')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _local_signature(public_id, version):
+    return signing.Signer(salt=SIGNING_SALT).signature(f'{public_id}:{version}')
+
+
+def receive_chunk(job, signature, content_range, chunk):
+    """
+    Backend lokalny: zapisuje kawałek pliku (jak Cloudinary przy wysyłce
+    kawałkami). Zwraca {'done': False, 'bytes_received': ...} albo, po
+    ostatnim kawałku, wynik wysyłki w formacie Cloudinary.
+    """
+    try:
+        payload = signing.loads(signature, salt=SIGNING_SALT, max_age=SIGNATURE_MAX_AGE)
+    except signing.BadSignature:
+        raise DirectUploadError("Niepoprawny lub wygasły podpis wysyłki")
+    if payload != {'job': job.pk, 'upload_id': job.upload_id} or job.state != 'direct':
+        raise DirectUploadError("Podpis nie dotyczy tej wysyłki")
+
+    match = CONTENT_RANGE.match(content_range or '')
+    if match is None:
+        raise DirectUploadError("Brak lub niepoprawny nagłówek Content-Range")
+    first, last, total = (int(value) for value in match.groups())
+    path = os.path.join(_local_dir(), f'{job.upload_id}.part')
+    received = os.path.getsize(path) if os.path.exists(path) else 0
+    if total != job.total_bytes or first > received or last - first + 1 != chunk.size:
+        raise DirectUploadError(f"Niepoprawny zakres kawałka (odebrano {received} bajtów)")
+
+    # Ponownie wysłany kawałek (wznowienie) nadpisuje ten sam zakres
+    with open(path, 'r+b' if received else 'wb') as destination:
+        destination.seek(first)
+        for part in chunk.chunks():
+            destination.write(part)
+    received = max(received, last + 1)
+    if received < total:
+        return {'done': False, 'bytes_received': received}
+
+    extension = os.path.splitext(job.original_name)[1].lower()
+    destination = os.path.join(_local_dir(), f'{job.upload_id}{extension}')
+    os.replace(path, destination)
+    UploadJob.objects.filter(pk=job.pk).update(sha256=assets.file_sha256(destination))
+    version = int(time.time())
+    file_id = public_id(job)
+    return {
+        'public_id': file_id,
+        'version': version,
+        'signature': _local_signature(file_id, version),
+        'format': extension[1:],
+        'resource_type': 'video' if job.material_type == 'video' else 'image',
+        'type': 'upload',
+        'bytes': total,
+    }
+
+
+def _verify(job, result):
+    file_id, version, signature = result.get('public_id'), result.get('version'), result.get('signature')
+    if not file_id or not version or not signature:
+        raise DirectUploadError("Niepełny wynik wysyłki")
+    if backend() == 'local':
+        valid = constant_time_compare(signature, _local_signature(file_id, version))
+    else:
+        valid = cloudinary_utils.verify_api_response_signature(file_id, version, signature)
+    if not valid:
+        raise DirectUploadError("Niepoprawny podpis wyniku wysyłki")
+    if file_id != public_id(job):
+        raise DirectUploadError("Wynik wysyłki dotyczy innego pliku")
+
+
+def complete(job, result):
+    """Rejestruje wynik wysyłki bezpośredniej jako materiał (ponowne wywołanie zwraca ten sam materiał)."""
+    if job.state == 'direct':
+        _verify(job, result)
+        # Przejęcie zadania chroni przed podwójnym materiałem przy równoległych wywołaniach
+        with transaction.atomic():
+            if UploadJob.objects.filter(pk=job.pk, state='direct').update(state='uploading'):
+                material = media.store_result(job, result, job.sha256)
+                logger.info(f'Wysłano bezpośrednio plik {job.original_name} jako materiał {material.pk} '
+                            f'(zadanie {job.pk})')
+                return material
+        job.refresh_from_db()
+    if job.state == 'done' and job.material_id:
+        return job.material
+    raise DirectUploadError("Zadanie nie jest wysyłką bezpośrednią")
@@ -0,0 +1,102 @@
+"""
+Rozsyłanie jednego materiału na wiele stoisk (np. kampania we wszystkich sklepach).
+
+Nowe materiały wskazują na ten sam plik w Cloudinary (MediaAsset, patrz
+assets.py), więc nic nie jest wysyłane ponownie. Niezależnie od liczby
+stoisk operacja wykonuje stałą liczbę zapytań: stoiska docelowe, jedno
+zapytanie agregujące o największy 'order' na każdym stoisku i bulk_create
+(po BATCH_SIZE wierszy), a wersje playlist są podbijane jednym set_many.
+bulk_create nie wysyła sygnałów post_save - nowe materiały nie mają jeszcze
+harmonogramów, więc jedynym skutkiem ubocznym jest unieważnienie playlist.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import Max
+
+from . import assets
+from .models import AdvertisementMaterial, MediaAsset, Stand
+from .playlist import invalidate_stands
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def target_stands(user, store=None, departments=None, stands=None):
+    """
+    Stoiska docelowe w zakresie uprawnień użytkownika: sklepu, działów, podanych
+    stoisk albo (bez żadnego z nich) wszystkie dostępne.
+    """
+    queryset = Stand.objects.all()
+    if not user.is_superadmin():
+        queryset = queryset.filter(department__store_id=user.managed_store_id)
+    if store is not None:
+        queryset = queryset.filter(department__store=store)
+    if departments is not None:
+        queryset = queryset.filter(department__in=departments)
+    if stands is not None:
+        queryset = queryset.filter(pk__in=stands)
+    return queryset
+
+
+def shared_asset(material):
+    """
+    Plik materiału jako zasób rejestru. Materiał sprzed deduplikacji (razem
+    z innymi materiałami z tym samym plikiem) dostaje zasób teraz - inaczej
+    usunięcie go skasowałoby plik używany przez kopie.
+    """
+    if material.asset_id:
+        return material.asset
+    public_id = getattr(material.file, 'public_id', None)
+    if not public_id:
+        raise ValueError("Materiał nie ma pliku")
+    asset, _ = MediaAsset.objects.get_or_create(public_id=public_id, defaults={
+        'resource_type': material.file.resource_type or ('video' if material.material_type == 'video' else 'image'),
+        'format': material.file.format or '',
+        'version': str(material.file.version or ''),
+        'file_size': material.file_size,
+    })
+    AdvertisementMaterial.objects.filter(pk=material.pk).update(asset=asset)
+    assets.adopt_legacy(asset)
+    material.asset = asset
+    return asset
+
+
+def distribute(material, stands, status, duration, expires_at=None, skip_existing=True):
+    """
+    Tworzy kopię materiału (ten sam plik) na końcu playlisty każdego ze stoisk
+    (queryset). skip_existing pomija stoiska, które już mają materiał z tym
+    plikiem. Zwraca listę identyfikatorów stoisk, na które trafił materiał.
+    """
+    with transaction.atomic():
+        asset = shared_asset(material)
+        if skip_existing:
+            stands = stands.exclude(materials__asset=asset)
+        stand_ids = list(stands.values_list('id', flat=True))
+        if not stand_ids:
+            return []
+
+        last_orders = dict(
+            AdvertisementMaterial.objects.filter(stand__in=stands).order_by()
+            .values('stand_id').annotate(last=Max('order')).values_list('stand_id', 'last')
+        )
+        file = asset.resource()
+        AdvertisementMaterial.objects.bulk_create([
+            AdvertisementMaterial(
+                stand_id=stand_id,
+                material_type=material.material_type,
+                file=file,
+                asset=asset,
+                status=status,
+                duration=duration,
+                expires_at=expires_at,
+                file_size=asset.file_size or material.file_size,
+                order=last_orders[stand_id] + 1 if stand_id in last_orders else 0,
+            )
+            for stand_id in stand_ids
+        ], batch_size=BATCH_SIZE)
+        transaction.on_commit(lambda: invalidate_stands(stand_ids))
+
+    logger.info(f'Materiał {material.pk} (plik {asset.public_id}) rozesłano na {len(stand_ids)} stoisk')
+    return stand_ids
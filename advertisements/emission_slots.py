@@ -0,0 +1,177 @@
+"""
+Materializowane wystąpienia emisji (EmissionSlot).
+
+Harmonogramy są rozwijane na konkretne przedziały emisji (stoisko, materiał,
+harmonogram, priorytet, początek, koniec) na kroczący horyzont
+SLOT_HORIZON_DAYS dni - kalendarze, raporty i uzgadnianie proof-of-play
+pytają wtedy o przedział czasu jednym zapytaniem po indeksie (stand, start)
+zamiast rozwijać reguły powtarzania.
+
+Rozwijanie odbywa się w czasie lokalnym sklepu (tak jak PlaylistResolver),
+a granice przedziałów są zapisywane w UTC. Okno nocne jest zapisywane jako
+jeden przedział, gdy harmonogram obowiązuje w dwóch kolejnych dniach -
+dzięki temu żaden przedział nie jest dłuższy niż MAX_SLOT_LENGTH i zapytanie
+o nakładanie się przedziałów ma ograniczony zakres po start.
+
+Po zmianie harmonogramu (lub jego materiałów) regenerowane są tylko jego
+przyszłe i trwające wystąpienia; minione zostają jako historia emisji do
+czasu prune(). Trwające wystąpienie nie jest usuwane - jeśli po zmianie
+wygląda tak samo, zostaje, a w przeciwnym razie kończy się w chwili zmiany
+(część już wyemitowana zostaje w historii), a nowe zaczyna się od tej chwili.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import EmissionSchedule, EmissionSlot
+from .schedule_index import schedule_segments
+from .store_time import from_local, to_local
+
+logger = logging.getLogger(__name__)
+
+SLOT_HORIZON_DAYS = 7
+# Najdłuższy możliwy przedział: okno nocne z dwóch kolejnych dni (plus doba ze zmianą czasu)
+MAX_SLOT_LENGTH = timedelta(hours=25)
+BATCH_SIZE = 1000
+# Najdłuższe okno zapytania o wystąpienia w API
+MAX_WINDOW_DAYS = 31
+
+
+def _local_windows(schedule, first_day, last_day):
+    """Przedziały emisji harmonogramu (naiwny czas ścienny, koniec wyłączny) w dniach [first_day, last_day]."""
+    segments = schedule_segments(schedule)
+    overnight = schedule.start_time > schedule.end_time
+    windows = []
+    day = first_day
+    while day <= last_day:
+        if schedule.is_scheduled_for_date(day):
+            midnight = datetime.combine(day, datetime.min.time())
+            for start, end in segments:
+                start = midnight + timedelta(microseconds=start)
+                end = midnight + timedelta(microseconds=end)
+                # Poranna część okna nocnego kontynuuje wieczorną część z poprzedniego dnia
+                if overnight and windows and windows[-1][1] == start:
+                    windows[-1] = (windows[-1][0], end)
+                elif end > start:
+                    windows.append((start, end))
+        day += timedelta(days=1)
+    return windows
+
+
+def _utc_windows(schedule, zone, now, horizon_end):
+    """Przedziały emisji harmonogramu w strefie sklepu jako chwile UTC nachodzące na [now, horizon_end)."""
+    today = to_local(zone, now).date()
+    windows = []
+    for local_start, local_end in _local_windows(schedule, today - timedelta(days=1),
+                                                 today + timedelta(days=SLOT_HORIZON_DAYS)):
+        start = from_local(zone, local_start)
+        end = from_local(zone, local_end, after=start)
+        if end > now and start < horizon_end:
+            windows.append((start, end))
+    return windows
+
+
+def _schedule_links(schedule_ids):
+    """{id harmonogramu: {strefa sklepu: [(id materiału, id stoiska)]}} (jedno zapytanie)."""
+    links = EmissionSchedule.materials.through.objects.values_list(
+        'emissionschedule_id', 'advertisementmaterial_id', 'advertisementmaterial__stand_id',
+        'advertisementmaterial__stand__department__store__timezone',
+    )
+    if schedule_ids is not None:
+        links = links.filter(emissionschedule_id__in=schedule_ids)
+    result = {}
+    for schedule_id, material_id, stand_id, zone in links:
+        result.setdefault(schedule_id, {}).setdefault(zone, []).append((material_id, stand_id))
+    return result
+
+
+def _close(slots, now):
+    """Kończy trwające wystąpienia w chwili now i usuwa przyszłe. Zwraca liczbę usuniętych."""
+    slots.filter(start__lt=now, end__gt=now).update(end=now)
+    deleted, _ = slots.filter(start__gte=now).delete()
+    return deleted
+
+
+def regenerate(schedule_ids=None, now=None):
+    """
+    Przelicza przyszłe i trwające wystąpienia podanych harmonogramów (None -
+    wszystkich) na horyzont SLOT_HORIZON_DAYS dni. Zwraca liczbę zapisanych wystąpień.
+    """
+    now = now or timezone.now()
+    horizon_end = now + timedelta(days=SLOT_HORIZON_DAYS)
+    if schedule_ids is not None:
+        schedule_ids = set(schedule_ids)
+
+    stale = EmissionSlot.objects.filter(end__gt=now)
+    if schedule_ids is not None:
+        stale = stale.filter(schedule_id__in=schedule_ids)
+    # Trwające wystąpienia: (stoisko, materiał, harmonogram, koniec, priorytet) -> (id, początek); początek
+    # mógł zostać przycięty przy wcześniejszej regeneracji, więc nie jest częścią klucza
+    running = {(stand_id, material_id, schedule_id, end, priority): (slot_id, start)
+               for slot_id, stand_id, material_id, schedule_id, start, end, priority
+               in stale.filter(start__lt=now).values_list(
+                   'id', 'stand_id', 'material_id', 'schedule_id', 'start', 'end', 'priority')}
+    kept = set()
+
+    links = _schedule_links(schedule_ids)
+    schedules = EmissionSchedule.objects.filter(is_active=True, id__in=links)
+    slots = []
+    for schedule in schedules.iterator(chunk_size=BATCH_SIZE):
+        for zone, materials in links[schedule.id].items():
+            for start, end in _utc_windows(schedule, zone, now, horizon_end):
+                for material_id, stand_id in materials:
+                    if start < now:
+                        slot_id, slot_start = running.get((stand_id, material_id, schedule.id, end, schedule.priority),
+                                                          (None, None))
+                        if slot_id is not None and slot_start >= start:
+                            kept.add(slot_id)
+                            continue
+                    slots.append(EmissionSlot(stand_id=stand_id, material_id=material_id, schedule_id=schedule.id,
+                                              start=max(start, now), end=end, priority=schedule.priority))
+
+    with transaction.atomic():
+        _close(stale.exclude(id__in=kept), now)
+        EmissionSlot.objects.bulk_create(slots, batch_size=BATCH_SIZE)
+    if schedule_ids is None:
+        logger.info(f'Wystąpienia emisji: zapisano {len(slots)} na {SLOT_HORIZON_DAYS} dni')
+    return len(slots)
+
+
+def discard_future(schedule_ids, now=None):
+    """Kończy trwające i usuwa przyszłe wystąpienia harmonogramów (np. przed ich usunięciem)."""
+    now = now or timezone.now()
+    return _close(EmissionSlot.objects.filter(schedule_id__in=schedule_ids, end__gt=now), now)
+
+
+def discard_material(material_ids, now=None):
+    """Kończy trwające i usuwa przyszłe wystąpienia materiałów (przed ich usunięciem)."""
+    now = now or timezone.now()
+    return _close(EmissionSlot.objects.filter(material_id__in=material_ids, end__gt=now), now)
+
+
+def regenerate_on_commit(schedule_ids):
+    """Regeneracja wystąpień po zatwierdzeniu bieżącej transakcji (dla sygnałów)."""
+    schedule_ids = set(schedule_ids)
+    if schedule_ids:
+        transaction.on_commit(lambda: regenerate(schedule_ids))
+
+
+def prune(now=None, retention_days=None):
+    """Usuwa wystąpienia zakończone dawniej niż retention_days dni temu. Zwraca ich liczbę."""
+    now = now or timezone.now()
+    if retention_days is None:
+        retention_days = getattr(settings, 'EMISSION_SLOT_RETENTION_DAYS', 90)
+    deleted, _ = EmissionSlot.objects.filter(end__lt=now - timedelta(days=retention_days)).delete()
+    return deleted
+
+
+def slots_between(start, end):
+    """
+    Wystąpienia nachodzące na [start, end). Dolne ograniczenie start wynika
+    z MAX_SLOT_LENGTH, więc zapytanie jest zakresem po indeksie; dalsze
+    zawężenie (stand, stand__department, stand__department__store) robi wywołujący.
+    """
+    return EmissionSlot.objects.filter(start__lt=end, start__gt=start - MAX_SLOT_LENGTH, end__gt=start)
@@ -1,5 +1,7 @@
 from django import forms
 from .models import Store, Department, Stand, AdvertisementMaterial, EmissionSchedule
+from .conflicts import analyse_stand, describe_window
+from .distribution import target_stands
 import datetime
 
 
@@ -84,10 +86,19 @@ class EmissionScheduleForm(forms.ModelForm):
         help_text="Zaznacz, jeśli harmonogram trwa przez północ (np. od 22:00 do 06:00)"
     )
 
+    ignore_conflicts = forms.BooleanField(
+        required=False,
+        label="Zapisz mimo konfliktów",
+        help_text="Harmonogram nakłada się z innym o tym samym priorytecie lub nigdy nie wpływa na emisję"
+    )
+
+    # Ile okien konfliktu pokazywać w komunikacie błędu
+    MAX_REPORTED_WINDOWS = 3
+
     class Meta:
         model = EmissionSchedule
         fields = ['name', 'start_date', 'end_date', 'start_time', 'end_time',
-                  'repeat_type', 'priority', 'is_active']
+                  'repeat_type', 'recurrence_rule', 'priority', 'is_active']
         widgets = {
             'name': forms.TextInput(attrs={'class': 'form-control'}),
             'start_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
@@ -95,11 +106,17 @@ class EmissionScheduleForm(forms.ModelForm):
             'start_time': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}),
             'end_time': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}),
             'repeat_type': forms.Select(attrs={'class': 'form-select'}),
+            'recurrence_rule': forms.Textarea(attrs={'class': 'form-control font-monospace', 'rows': 2}),
             'priority': forms.NumberInput(attrs={'class': 'form-control', 'min': '1', 'max': '10'}),
         }
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, stand=None, material_ids=None, **kwargs):
         super().__init__(*args, **kwargs)
+        # Stoisko i materiały harmonogramu - potrzebne do analizy konfliktów
+        self.stand = stand
+        self.material_ids = material_ids or []
+        self.conflict_report = None
+        self.conflict_warnings = []
         
         # Ustaw początkowe wartości dla dni tygodnia (jeśli jest to edycja)
         if self.instance.pk and self.instance.repeat_days:
@@ -122,6 +139,14 @@ class EmissionScheduleForm(forms.ModelForm):
         if repeat_type == 'weekly' and not repeat_days:
             self.add_error('repeat_days_display', 'Wybierz co najmniej jeden dzień tygodnia')
 
+        recurrence_rule = (cleaned_data.get('recurrence_rule') or '').strip()
+        if repeat_type != 'custom':
+            recurrence_rule = ''
+        elif not recurrence_rule:
+            self.add_error('recurrence_rule', 'Podaj regułę powtarzania, np. FREQ=MONTHLY;BYDAY=2SA')
+        # Poprawność reguły sprawdza EmissionSchedule.clean()
+        cleaned_data['recurrence_rule'] = recurrence_rule
+
         if not is_overnight and start_time and end_time and start_time >= end_time:
             self.add_error('end_time', 'Godzina zakończenia musi być późniejsza niż godzina rozpoczęcia')
             
@@ -130,7 +155,43 @@ class EmissionScheduleForm(forms.ModelForm):
         else:
             cleaned_data['repeat_days'] = []
 
+        if self.stand is not None and not self.errors:
+            self.check_conflicts(cleaned_data)
+
         return cleaned_data
+
+    def check_conflicts(self, cleaned_data):
+        """Analiza konfliktów z pozostałymi harmonogramami stoiska."""
+        candidate = EmissionSchedule(
+            pk=self.instance.pk,
+            repeat_days=cleaned_data['repeat_days'],
+            **{field: cleaned_data.get(field) for field in self.Meta.fields},
+        )
+        report = analyse_stand(self.stand, candidate, self.material_ids)
+        self.conflict_report = report
+        problems = report.for_schedule(candidate.pk or 0)
+
+        errors = []
+        if problems['ties']:
+            names = sorted({report.names[key] for window in problems['ties']
+                            for key in window.schedule_ids if key != (candidate.pk or 0)})
+            windows = [describe_window(window) for window in problems['ties'][:self.MAX_REPORTED_WINDOWS]]
+            more = len(problems['ties']) - len(windows)
+            errors.append(
+                f"Harmonogram nakłada się z: {', '.join(names)} przy tym samym priorytecie "
+                f"({candidate.priority}) w oknach: {', '.join(windows)}"
+                + (f" i {more} innych" if more > 0 else "")
+            )
+        if problems['shadowed']:
+            errors.append("Wszystkie materiały harmonogramu są zawsze emitowane z harmonogramów "
+                          "o wyższym priorytecie - harmonogram nie ma wpływu na emisję")
+        if problems['never_active'] and candidate.is_active:
+            self.conflict_warnings.append("Harmonogram nie obowiązuje w żadnym dniu najbliższych tygodni")
+
+        if errors and not cleaned_data.get('ignore_conflicts'):
+            for error in errors:
+                self.add_error(None, error)
+            self.add_error(None, "Popraw harmonogram lub zaznacz \"Zapisz mimo konfliktów\".")
     
     
 # Dodaj nową klasę formularza na końcu pliku
@@ -214,3 +275,101 @@ class MaterialReportForm(forms.Form):
                 self.fields['store'].queryset = Store.objects.filter(departments__stands=user.managed_stand)
                 self.fields['department'].queryset = Department.objects.filter(stands=user.managed_stand)
                 self.fields['stand'].queryset = Stand.objects.filter(id=user.managed_stand.id)
+
+
+class MaterialDistributionForm(forms.Form):
+    """Rozesłanie materiału (tego samego pliku) na wiele stoisk naraz"""
+    TARGET_CHOICES = (
+        ('store', 'Wszystkie stoiska sklepu'),
+        ('departments', 'Wybrane działy'),
+        ('stands', 'Wybrane stoiska'),
+        ('all', 'Wszystkie dostępne stoiska'),
+    )
+
+    target = forms.ChoiceField(
+        choices=TARGET_CHOICES,
+        initial='store',
+        label="Gdzie rozesłać",
+        widget=forms.RadioSelect(attrs={'class': 'form-check-input'})
+    )
+    store = forms.ModelChoiceField(
+        queryset=Store.objects.all(),
+        required=False,
+        label="Sklep",
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    departments = forms.ModelMultipleChoiceField(
+        queryset=Department.objects.select_related('store'),
+        required=False,
+        label="Działy",
+        widget=forms.SelectMultiple(attrs={'class': 'form-select', 'size': 8})
+    )
+    stands = forms.ModelMultipleChoiceField(
+        queryset=Stand.objects.select_related('department__store'),
+        required=False,
+        label="Stoiska",
+        widget=forms.SelectMultiple(attrs={'class': 'form-select', 'size': 12})
+    )
+    status = forms.ChoiceField(
+        choices=AdvertisementMaterial.STATUS_CHOICES,
+        label="Status",
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    duration = forms.IntegerField(
+        min_value=1,
+        label="Czas wyświetlania (sekundy)",
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'min': 1})
+    )
+    never_expires = forms.BooleanField(
+        label="Bezterminowy",
+        required=False,
+        initial=True,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+    expires_at = forms.DateTimeField(
+        required=False,
+        label="Data wygaśnięcia",
+        widget=forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M')
+    )
+    skip_existing = forms.BooleanField(
+        label="Pomiń stoiska, które już mają ten plik",
+        required=False,
+        initial=True,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+
+        # Admin sklepu rozsyła tylko w obrębie swojego sklepu
+        if user and not user.is_superadmin():
+            self.fields['store'].queryset = Store.objects.filter(id=user.managed_store_id)
+            self.fields['departments'].queryset = self.fields['departments'].queryset.filter(store_id=user.managed_store_id)
+            self.fields['stands'].queryset = self.fields['stands'].queryset.filter(department__store_id=user.managed_store_id)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        target = cleaned_data.get('target')
+
+        required = {'store': 'store', 'departments': 'departments', 'stands': 'stands'}.get(target)
+        if required and not cleaned_data.get(required) and required not in self.errors:
+            self.add_error(required, 'To pole jest wymagane dla wybranego celu')
+
+        if cleaned_data.get('never_expires'):
+            cleaned_data['expires_at'] = None
+        elif not cleaned_data.get('expires_at'):
+            self.add_error('expires_at', 'Wybierz datę wygaśnięcia lub zaznacz "Bezterminowy"')
+
+        return cleaned_data
+
+    def target_stands(self):
+        """Stoiska docelowe (queryset) według wybranego celu."""
+        data = self.cleaned_data
+        target = data['target']
+        return target_stands(
+            self.user,
+            store=data['store'] if target == 'store' else None,
+            departments=data['departments'] if target == 'departments' else None,
+            stands=data['stands'] if target == 'stands' else None,
+        )
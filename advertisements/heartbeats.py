@@ -0,0 +1,395 @@
+"""
+Buforowanie heartbeatów odtwarzaczy.
+
+Zamiast get_or_create + save() przy każdym heartbeacie dane trafiają do
+bufora w pamięci procesu (jeden wpis na stoisko - nowszy nadpisuje starszy)
+i są co HEARTBEAT_FLUSH_INTERVAL sekund zapisywane zbiorczo: INSERT pomijający
+istniejące wiersze i jeden UPDATE, który nadpisuje status tylko nowszym
+last_seen (przy kilku procesach spóźniony zapis nie cofa statusu stoiska).
+Zapis wykonuje wątek w tle uruchamiany w każdym procesie przy pierwszym
+heartbeacie, więc bufor jest opróżniany niezależnie od ruchu - heartbeat
+czeka na zapis najwyżej jeden interwał (dłużej tylko przy błędzie bazy -
+wtedy bufor jest ograniczony, patrz _requeue).
+Interwał musi być wyraźnie krótszy od progu uznania odtwarzacza za offline.
+
+Każdy heartbeat jest też dopisywany do historii (PlayerHeartbeat), którą
+rollup() kompresuje do okresów pracy i godzinowych podsumowań; zapytania
+o dostępność czytają już tylko podsumowania. Heartbeaty są oznaczane jako
+przetworzone (rolled_up), więc spóźniony heartbeat jest scalany z okresami
+pracy, a nie pomijany.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import BooleanField, Case, F, Q, Value, When
+from django.utils import timezone
+
+from . import renditions
+from .models import PlayerStatus, PlayerHeartbeat, PlayerUptimeInterval, PlayerUptimeHourly
+from .playlist import invalidate_stands
+
+logger = logging.getLogger(__name__)
+
+# Pola zapisywane zawsze oraz pola aktualizowane tylko, gdy odtwarzacz je przesłał
+BASE_FIELDS = ('last_seen', 'is_online', 'ip_address', 'user_agent')
+OPTIONAL_FIELDS = ('screen_resolution', 'version', 'errors')
+
+# Ile heartbeatów przetwarza jedna partia rollupu i ile wierszy zapisuje jedno zapytanie
+ROLLUP_BATCH = 50000
+BATCH_SIZE = 1000
+
+_buffer = {}
+_beats = []
+_lock = threading.Lock()
+_flusher = None
+
+
+def flush_interval():
+    return getattr(settings, 'HEARTBEAT_FLUSH_INTERVAL', 15)
+
+
+def retry_limit():
+    """Ile niezapisanych heartbeatów historii trzymać w buforze przy awarii bazy."""
+    return getattr(settings, 'HEARTBEAT_RETRY_LIMIT', 100000)
+
+
+def online_timeout():
+    """Po ilu sekundach bez heartbeatu odtwarzacz jest uznawany za offline."""
+    return getattr(settings, 'PLAYER_ONLINE_TIMEOUT', 90)
+
+
+def is_online(last_seen, now=None):
+    """Czy odtwarzacz z podanym czasem ostatniej aktywności jest online."""
+    if last_seen is None:
+        return False
+    return (now or timezone.now()) - last_seen <= timedelta(seconds=online_timeout())
+
+
+def fleet_status(stands, now=None):
+    """
+    Statusy odtwarzaczy podanych stoisk (queryset Stand) jednym zapytaniem.
+
+    Stan online jest liczony w bazie przez porównanie last_seen z progiem
+    PLAYER_ONLINE_TIMEOUT - zapisane pole is_online nie jest ani czytane,
+    ani aktualizowane.
+    """
+    threshold = (now or timezone.now()) - timedelta(seconds=online_timeout())
+    return stands.order_by('department__store__name', 'department__name', 'name').values(
+        'id', 'name',
+        department_name=F('department__name'),
+        store_id=F('department__store_id'),
+        store_name=F('department__store__name'),
+        last_seen=F('player_status__last_seen'),
+        version=F('player_status__version'),
+        screen_resolution=F('player_status__screen_resolution'),
+        is_online=Case(
+            When(player_status__last_seen__gte=threshold, then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        ),
+    )
+
+
+def record_heartbeat(stand_id, ip_address=None, user_agent='', **optional):
+    """Dodaje heartbeat do bufora i w razie potrzeby opróżnia bufor."""
+    entry = {
+        'last_seen': timezone.now(),
+        'is_online': True,
+        'ip_address': ip_address,
+        'user_agent': user_agent,
+    }
+    entry.update({field: value for field, value in optional.items() if field in OPTIONAL_FIELDS})
+
+    with _lock:
+        _buffer.setdefault(stand_id, {}).update(entry)
+        _beats.append(PlayerHeartbeat(stand_id=stand_id, timestamp=entry['last_seen']))
+        _start_flusher()
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(flush_interval())
+        try:
+            flush()
+        except Exception as e:
+            logger.error(f"Błąd okresowego zapisu heartbeatów: {e}")
+        finally:
+            # Wątek żyje tak długo jak proces - nie trzymaj zerwanych połączeń z bazą
+            close_old_connections()
+
+
+def _start_flusher():
+    """Uruchamia wątek zapisu (wywoływane pod _lock; po fork wątku rodzica już nie ma)."""
+    global _flusher
+    if _flusher is None or not _flusher.is_alive():
+        _flusher = threading.Thread(target=_flush_periodically, name='heartbeat-flush', daemon=True)
+        _flusher.start()
+
+
+def pending(stand_id):
+    """Niezapisany jeszcze heartbeat stoiska (z tego procesu) lub None."""
+    with _lock:
+        entry = _buffer.get(stand_id)
+        return dict(entry) if entry else None
+
+
+def flush():
+    """
+    Zapisuje zbuforowane heartbeaty zbiorczo (statusy tylko z nowszym
+    last_seen) i dopisuje je do historii (PlayerHeartbeat). Zwraca liczbę stoisk.
+    """
+    global _buffer, _beats
+    with _lock:
+        entries, _buffer = _buffer, {}
+        beats, _beats = _beats, []
+    if not entries:
+        return 0
+
+    # Jedno zapytanie na każdy zestaw przesłanych pól opcjonalnych (zwykle jeden)
+    groups = {}
+    for stand_id, entry in entries.items():
+        fields = tuple(field for field in OPTIONAL_FIELDS if field in entry)
+        groups.setdefault(fields, []).append(stand_id)
+
+    # Zmiana rozdzielczości ekranu może zmienić wersję plików (renditions) w playliście stoiska
+    reported = {stand_id: entry['screen_resolution'] for stand_id, entry in entries.items()
+                if 'screen_resolution' in entry}
+    previous = dict(PlayerStatus.objects.filter(stand_id__in=reported).values_list('stand_id', 'screen_resolution')) \
+        if reported else {}
+    changed = [stand_id for stand_id, resolution in reported.items()
+               if renditions.select(resolution) != renditions.select(previous.get(stand_id))]
+
+    try:
+        with transaction.atomic():
+            # Nowe stoiska - istniejące wiersze są pomijane i aktualizowane niżej
+            PlayerStatus.objects.bulk_create(
+                [PlayerStatus(stand_id=stand_id, **entry) for stand_id, entry in entries.items()],
+                ignore_conflicts=True,
+                batch_size=BATCH_SIZE,
+            )
+            for fields, stand_ids in groups.items():
+                for position in range(0, len(stand_ids), BATCH_SIZE):
+                    _update_newer({stand_id: entries[stand_id] for stand_id in stand_ids[position:position + BATCH_SIZE]},
+                                  BASE_FIELDS + fields)
+            PlayerHeartbeat.objects.bulk_create(beats, batch_size=BATCH_SIZE)
+    except Exception as e:
+        logger.error(f"Błąd zapisu heartbeatów ({len(entries)} stoisk): {e}")
+        _requeue(entries, beats)
+        return 0
+
+    if changed:
+        invalidate_stands(changed)
+    logger.debug(f"Zapisano heartbeaty {len(entries)} stoisk")
+    return len(entries)
+
+
+def _update_newer(entries, fields):
+    """
+    Aktualizuje statusy stoisk jednym zapytaniem, ale tylko wiersze ze starszym
+    last_seen - nowszego statusu zapisanego przez inny proces nie nadpisuje.
+    """
+    newer = Q()
+    for stand_id, entry in entries.items():
+        newer |= Q(stand_id=stand_id) & (Q(last_seen__lt=entry['last_seen']) | Q(last_seen__isnull=True))
+    values = {}
+    for name in fields:
+        field = PlayerStatus._meta.get_field(name)
+        values[name] = Case(
+            *(When(stand_id=stand_id, then=Value(entry[name], output_field=field)) for stand_id, entry in entries.items()),
+            output_field=field,
+        )
+    PlayerStatus.objects.filter(newer).update(**values)
+
+
+def _requeue(entries, beats):
+    """
+    Zwraca niezapisane heartbeaty do bufora (nowsze wpisy mają pierwszeństwo).
+
+    Przy dłuższej awarii bazy bufor nie rośnie bez końca: statusy starsze niż
+    PLAYER_ONLINE_TIMEOUT są odrzucane (odtwarzacz i tak byłby offline),
+    a z historii zostaje najwyżej HEARTBEAT_RETRY_LIMIT najnowszych heartbeatów.
+    """
+    threshold = timezone.now() - timedelta(seconds=online_timeout())
+    with _lock:
+        for stand_id, entry in entries.items():
+            if entry['last_seen'] >= threshold:
+                _buffer[stand_id] = {**entry, **_buffer.get(stand_id, {})}
+        _beats[:0] = beats
+        dropped = len(_beats) - retry_limit()
+        if dropped > 0:
+            del _beats[:dropped]
+    if dropped > 0:
+        logger.warning(f"Bufor heartbeatów pełny - odrzucono {dropped} najstarszych heartbeatów historii")
+
+
+atexit.register(flush)
+
+
+def _hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _add_online(hourly, start, end, sign=1):
+    """Dolicza (sign=-1: odlicza) okres [start, end] do godzinowych kubełków."""
+    while start < end:
+        hour = _hour(start)
+        chunk_end = min(end, hour + timedelta(hours=1))
+        hourly.setdefault(hour, [0, 0])[0] += sign * int((chunk_end - start).total_seconds())
+        start = chunk_end
+
+
+def _merge(intervals, timestamps, gap, hourly):
+    """
+    Scala istniejące okresy pracy stoiska (posortowane, rozłączne) z nowymi
+    heartbeatami (posortowane). Heartbeat może być starszy niż koniec ostatniego
+    okresu (spóźniony zapis) - wtedy wydłuża lub łączy wcześniejsze okresy.
+    Czas online dopisany przez scalenie trafia do hourly. Zwraca listę
+    (okres, [pochłonięte okresy]) dla okresów, które się zmieniły lub są nowe.
+    """
+    segments = sorted([(interval.started_at, interval.ended_at, interval) for interval in intervals] +
+                      [(timestamp, timestamp, None) for timestamp in timestamps], key=lambda segment: segment[:2])
+    groups = []
+    for start, end, interval in segments:
+        if groups and start - groups[-1][1] <= gap:
+            group = groups[-1]
+            group[1] = max(group[1], end)
+        else:
+            group = [start, end, [], False]
+            groups.append(group)
+        if interval is None:
+            group[3] = True
+        else:
+            group[2].append(interval)
+
+    changed = []
+    for start, end, absorbed, has_new in groups:
+        if not has_new:
+            continue
+        # Nowy czas online = pokrycie scalonego okresu minus pokrycie okresów, które już były policzone
+        _add_online(hourly, start, end)
+        for interval in absorbed:
+            _add_online(hourly, interval.started_at, interval.ended_at, sign=-1)
+        if absorbed:
+            kept, absorbed = absorbed[0], absorbed[1:]
+            kept.started_at, kept.ended_at = start, end
+        else:
+            kept = PlayerUptimeInterval(stand_id=None, started_at=start, ended_at=end)
+        changed.append((kept, absorbed))
+    return changed
+
+
+def rollup_beats(beats, gap):
+    """
+    Kompresuje heartbeaty [(id, stand_id, timestamp)] (posortowane po stoisku
+    i czasie) do okresów pracy i kubełków godzinowych - stałą liczbą zapytań
+    niezależnie od liczby stoisk - i oznacza je jako przetworzone.
+    """
+    by_stand = {}
+    for _, stand_id, timestamp in beats:
+        by_stand.setdefault(stand_id, []).append(timestamp)
+    first = min(timestamps[0] for timestamps in by_stand.values())
+    last = max(timestamps[-1] for timestamps in by_stand.values())
+
+    # Okresy, z którymi heartbeaty mogą się scalić (jedno zapytanie dla wszystkich stoisk)
+    intervals = {}
+    for interval in PlayerUptimeInterval.objects.filter(
+            stand_id__in=list(by_stand), ended_at__gte=first - gap, started_at__lte=last + gap,
+    ).order_by('stand_id', 'started_at'):
+        intervals.setdefault(interval.stand_id, []).append(interval)
+
+    to_save, to_create, to_delete = [], [], []
+    hourly = {}
+    for stand_id, timestamps in by_stand.items():
+        stand_hourly = {}
+        for timestamp in timestamps:
+            stand_hourly.setdefault(_hour(timestamp), [0, 0])[1] += 1
+        for interval, absorbed in _merge(intervals.get(stand_id, []), timestamps, gap, stand_hourly):
+            if interval.pk:
+                to_save.append(interval)
+            else:
+                interval.stand_id = stand_id
+                to_create.append(interval)
+            to_delete.extend(item.pk for item in absorbed)
+        # Godziny w całości pokryte już wcześniej dają zerowy przyrost
+        hourly.update(((stand_id, hour), values) for hour, values in stand_hourly.items() if values != [0, 0])
+
+    with transaction.atomic():
+        PlayerUptimeInterval.objects.filter(pk__in=to_delete).delete()
+        PlayerUptimeInterval.objects.bulk_update(to_save, ['started_at', 'ended_at'], batch_size=BATCH_SIZE)
+        PlayerUptimeInterval.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+
+        hours = [hour for _, hour in hourly]
+        existing = {
+            (row.stand_id, row.hour): row for row in PlayerUptimeHourly.objects.filter(
+                stand_id__in=list(by_stand), hour__gte=min(hours), hour__lte=max(hours),
+            )
+        }
+        to_create_hourly, to_update_hourly = [], []
+        for (stand_id, hour), (seconds, count) in hourly.items():
+            row = existing.get((stand_id, hour))
+            if row is None:
+                to_create_hourly.append(PlayerUptimeHourly(stand_id=stand_id, hour=hour,
+                                                           online_seconds=max(0, min(3600, seconds)), heartbeats=count))
+            else:
+                row.online_seconds = max(0, min(3600, row.online_seconds + seconds))
+                row.heartbeats += count
+                to_update_hourly.append(row)
+        PlayerUptimeHourly.objects.bulk_create(to_create_hourly, batch_size=BATCH_SIZE)
+        PlayerUptimeHourly.objects.bulk_update(to_update_hourly, ['online_seconds', 'heartbeats'], batch_size=BATCH_SIZE)
+
+        ids = [beat_id for beat_id, _, _ in beats]
+        for position in range(0, len(ids), BATCH_SIZE):
+            PlayerHeartbeat.objects.filter(pk__in=ids[position:position + BATCH_SIZE]).update(rolled_up=True)
+    return len(beats)
+
+
+def rollup(now=None, retention_days=None):
+    """
+    Rollup nieprzetworzonych heartbeatów wszystkich stoisk (partiami po
+    ROLLUP_BATCH heartbeatów) oraz usunięcie surowych heartbeatów starszych
+    niż okres retencji. Zwraca (przetworzone, usunięte).
+
+    Przetwarzane są wszystkie zapisane, a nieprzetworzone heartbeaty - także
+    spóźnione (np. zapisane po chwilowej awarii bazy), które trafiają do
+    właściwych okresów pracy zamiast przepadać.
+    """
+    now = now or timezone.now()
+    gap = timedelta(seconds=online_timeout())
+
+    processed = 0
+    while True:
+        pending_ids = PlayerHeartbeat.objects.filter(rolled_up=False).order_by('id').values_list('id', flat=True)
+        ids = list(pending_ids[:ROLLUP_BATCH])
+        if not ids:
+            break
+        beats = list(PlayerHeartbeat.objects.filter(pk__in=ids).order_by('stand_id', 'timestamp')
+                     .values_list('id', 'stand_id', 'timestamp'))
+        processed += rollup_beats(beats, gap)
+
+    if retention_days is None:
+        retention_days = getattr(settings, 'HEARTBEAT_RETENTION_DAYS', 7)
+    deleted, _ = PlayerHeartbeat.objects.filter(timestamp__lt=now - timedelta(days=retention_days)).delete()
+    return processed, deleted
+
+
+def stand_uptime(stand_id, start, end):
+    """
+    Dostępność stoiska w przedziale [start, end) na podstawie rollupów:
+    czas online (sekundy), okresy pracy przycięte do przedziału oraz kubełki godzinowe.
+    """
+    intervals = [
+        (max(interval.started_at, start), min(interval.ended_at, end))
+        for interval in PlayerUptimeInterval.objects.filter(
+            stand_id=stand_id, started_at__lt=end, ended_at__gte=start,
+        ).order_by('started_at')
+    ]
+    hourly = list(PlayerUptimeHourly.objects.filter(
+        stand_id=stand_id, hour__gte=_hour(start), hour__lt=end,
+    ).order_by('hour').values('hour', 'online_seconds', 'heartbeats'))
+    online = sum(int((interval_end - interval_start).total_seconds()) for interval_start, interval_end in intervals)
+    return {'online_seconds': online, 'intervals': intervals, 'hourly': hourly}
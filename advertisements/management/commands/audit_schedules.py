@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from advertisements.conflicts import HORIZON_DAYS, analyse_stand, describe_window
+from advertisements.models import Stand
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Wyszukuje konflikty harmonogramów emisji (remisy priorytetów, przysłonięte harmonogramy, luki)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', type=int, help='Tylko stoiska danego sklepu')
+        parser.add_argument('--days', type=int, default=HORIZON_DAYS, help=f'Horyzont w dniach (domyślnie {HORIZON_DAYS})')
+        parser.add_argument('--gaps', action='store_true', help='Wypisz także luki bez harmonogramów')
+
+    def handle(self, *args, **options):
+        stands = Stand.objects.select_related('department__store').order_by('id')
+        if options['store']:
+            stands = stands.filter(department__store_id=options['store'])
+
+        stands_with_conflicts = 0
+        for stand in stands.iterator():
+            report = analyse_stand(stand, days=options['days'])
+            if not (report.ties or report.shadowed or report.never_active or (options['gaps'] and report.gaps)):
+                continue
+            stands_with_conflicts += 1
+
+            self.stdout.write(self.style.WARNING(
+                f'{stand.department.store.name} / {stand.department.name} / {stand.name} (id {stand.id})'
+            ))
+            for window in report.ties:
+                names = ', '.join(report.names[key] for key in window.schedule_ids)
+                self.stdout.write(f'  remis priorytetu {window.priority}: {names} - {describe_window(window)}')
+            for key in report.shadowed:
+                self.stdout.write(f'  przysłonięty: {report.names[key]} (id {key})')
+            for key in report.never_active:
+                self.stdout.write(f'  nie obowiązuje w horyzoncie: {report.names[key]} (id {key})')
+            if options['gaps']:
+                for window in report.gaps:
+                    self.stdout.write(f'  luka: {describe_window(window)}')
+
+        self.stdout.write(self.style.SUCCESS(f'Stoiska z konfliktami: {stands_with_conflicts}'))
+        logger.info(f'Audyt harmonogramów: {stands_with_conflicts} stoisk z konfliktami')
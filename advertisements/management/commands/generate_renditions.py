@@ -0,0 +1,43 @@
+import cloudinary.uploader
+from django.core.management.base import BaseCommand
+from advertisements import renditions
+from advertisements.models import AdvertisementMaterial
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Zleca w Cloudinary wygenerowanie drabinki wersji (renditions) dla istniejących materiałów wideo'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stand',
+            type=int,
+            default=None,
+            help='Tylko materiały wybranego stoiska',
+        )
+
+    def handle(self, *args, **options):
+        materials = AdvertisementMaterial.objects.filter(material_type='video').exclude(file='')
+        if options['stand']:
+            materials = materials.filter(stand_id=options['stand'])
+
+        eager = renditions.eager_transformations('video')
+        requested = failed = 0
+        for material in materials.iterator():
+            public_id = getattr(material.file, 'public_id', None)
+            if not public_id:
+                continue
+            try:
+                cloudinary.uploader.explicit(public_id, type='upload', resource_type='video',
+                                             eager=eager, eager_async=True)
+                requested += 1
+            except Exception as e:
+                failed += 1
+                logger.error(f'Błąd zlecania wersji materiału ID={material.id}: {e}')
+                self.stderr.write(f'- Błąd dla materiału ID={material.id}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Zlecono wersje dla {requested} materiałów wideo ({len(eager)} wersji na materiał), błędy: {failed}'
+        ))
+        logger.info(f'Zlecono wersje dla {requested} materiałów wideo, błędy: {failed}')
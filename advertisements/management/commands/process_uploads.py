@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from advertisements import media
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Wysyła do Cloudinary pliki materiałów oczekujące w kolejce (UploadJob)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--daemon',
+            action='store_true',
+            help='Działaj w tle i sprawdzaj kolejkę co --interval sekund',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2,
+            help='Odstęp między sprawdzeniami kolejki w trybie --daemon (sekundy, domyślnie 2)',
+        )
+
+    def handle(self, *args, **options):
+        if not options['daemon']:
+            self.process()
+            return
+
+        self.stdout.write(f'Tryb daemon: kolejka wysyłek sprawdzana co {options["interval"]} s (Ctrl+C kończy)')
+        try:
+            while True:
+                # Proces żyje długo - zamykamy zerwane/przeterminowane połączenia z bazą
+                close_old_connections()
+                try:
+                    self.process()
+                except Exception as e:
+                    logger.error(f'Błąd przetwarzania kolejki wysyłek: {e}')
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+    def process(self):
+        done, failed = media.run_pending()
+        if done or failed:
+            self.stdout.write(self.style.SUCCESS(f'Wysłano {done} plików, nieudanych prób: {failed}'))
+            logger.info(f'Kolejka wysyłek: wysłano {done}, nieudanych prób {failed}')
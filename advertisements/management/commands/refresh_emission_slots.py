@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from advertisements import emission_slots
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Przelicza wystąpienia emisji na kolejne dni i usuwa stare wystąpienia'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=None,
+            help='Ile dni przechowywać minione wystąpienia (domyślnie EMISSION_SLOT_RETENTION_DAYS)',
+        )
+
+    def handle(self, *args, **options):
+        created = emission_slots.regenerate()
+        deleted = emission_slots.prune(retention_days=options['retention_days'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Zapisano {created} wystąpień emisji na {emission_slots.SLOT_HORIZON_DAYS} dni, usunięto {deleted} starych'
+        ))
+        logger.info(f'Wystąpienia emisji: zapisano {created}, usunięto {deleted}')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from advertisements import heartbeats
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Kompresuje historię heartbeatów do okresów pracy i podsumowań godzinowych oraz usuwa stare heartbeaty'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=None,
+            help='Ile dni przechowywać surowe heartbeaty (domyślnie HEARTBEAT_RETENTION_DAYS)',
+        )
+
+    def handle(self, *args, **options):
+        processed, deleted = heartbeats.rollup(retention_days=options['retention_days'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Przetworzono {processed} heartbeatów, usunięto {deleted} starych heartbeatów'
+        ))
+        logger.info(f'Rollup heartbeatów: przetworzono {processed}, usunięto {deleted}')
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from advertisements.transitions import TransitionEngine, POLL_INTERVAL, RESYNC_INTERVAL
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Uruchamia silnik przejść harmonogramów (budzi się tylko przy zmianie stanu harmonogramu)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=POLL_INTERVAL,
+            help='Co ile sekund sprawdzać kanał zmian harmonogramów',
+        )
+        parser.add_argument(
+            '--resync-interval',
+            type=int,
+            default=RESYNC_INTERVAL,
+            help='Co ile sekund przebudować kolejkę od zera',
+        )
+
+    def handle(self, *args, **options):
+        engine = TransitionEngine()
+        self.stdout.write('Silnik przejść harmonogramów uruchomiony (Ctrl+C kończy)')
+        logger.info('Silnik przejść harmonogramów uruchomiony')
+        try:
+            engine.run_forever(options['poll_interval'], options['resync_interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from advertisements.models import Stand
+from advertisements.schedule_matrix import stand_activity
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Prognoza emisji harmonogramów stoisk na siatce czasu (wektorowo, NumPy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Pierwszy dzień prognozy RRRR-MM-DD (domyślnie dziś)')
+        parser.add_argument('--days', type=int, default=7, help='Liczba dni (domyślnie 7)')
+        parser.add_argument('--step', type=int, default=15, help='Krok siatki w minutach (domyślnie 15)')
+        parser.add_argument('--store', type=int, help='Tylko stoiska danego sklepu')
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Porównaj wynik z metodami modelu (is_scheduled_for_date, is_within_time_window)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            day = datetime.strptime(options['start'], '%Y-%m-%d').date() if options['start'] else timezone.localdate()
+        except ValueError:
+            raise CommandError('Parametr --start musi mieć format RRRR-MM-DD')
+        if options['days'] < 1 or options['step'] < 1:
+            raise CommandError('--days i --step muszą być dodatnie')
+
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=options['days'])
+        step = timedelta(minutes=options['step'])
+
+        stands = Stand.objects.order_by('id')
+        if options['store']:
+            stands = stands.filter(department__store_id=options['store'])
+        stand_names = dict(stands.values_list('id', 'name'))
+
+        moments, activity = stand_activity(list(stand_names), start, end, step)
+        hours_per_cell = options['step'] / 60
+
+        self.stdout.write('stoisko;nazwa;godziny_harmonogramow;udzial_procent;max_priorytet')
+        for stand_id, (active, priority) in activity.items():
+            hours = active.sum() * hours_per_cell
+            share = 100.0 * active.mean() if len(active) else 0.0
+            top = '' if not active.any() else int(priority[active].max())
+            self.stdout.write(f'{stand_id};{stand_names[stand_id]};{hours:.2f};{share:.1f};{top}')
+
+        if options['verify']:
+            self.verify(list(stand_names), moments, activity)
+
+    def verify(self, stand_ids, moments, activity):
+        from advertisements.schedule_matrix import stand_schedules
+
+        schedules, rows = stand_schedules(stand_ids)
+        mismatches = 0
+        for stand_id in stand_ids:
+            stand_rules = [schedules[row] for row in rows[stand_id]]
+            active, priority = activity[stand_id]
+            for position, moment in enumerate(moments):
+                matching = [schedule.priority for schedule in stand_rules
+                            if schedule.is_active
+                            and schedule.is_scheduled_for_date(moment.date())
+                            and schedule.is_within_time_window(moment.time())]
+                expected_priority = max(matching) if matching else None
+                actual_priority = int(priority[position]) if active[position] else None
+                if bool(matching) != bool(active[position]) or expected_priority != actual_priority:
+                    mismatches += 1
+
+        if mismatches:
+            logger.error(f'Prognoza harmonogramów: {mismatches} niezgodności z metodami modelu')
+            raise CommandError(f'{mismatches} niezgodności z metodami modelu')
+        self.stdout.write(self.style.SUCCESS('Wynik zgodny z metodami modelu'))
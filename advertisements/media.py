@@ -0,0 +1,228 @@
+"""
+Wysyłanie plików materiałów do Cloudinary w tle.
+
+Widok formularza tylko zapisuje przesłany plik na dysk (UPLOAD_SPOOL_DIR)
+i tworzy UploadJob - żądanie kończy się od razu, a worker (komenda
+process_uploads) wysyła plik kawałkami po CHUNK_SIZE, zapisując postęp po
+każdym kawałku, i dopiero na końcu tworzy AdvertisementMaterial. Procesy
+webowe nigdy nie czekają na transfer do Cloudinary.
+
+Plik o treści, która jest już w Cloudinary (ten sam skrót SHA-256 w rejestrze
+MediaAsset, patrz assets.py), nie jest wysyłany ponownie - materiał powstaje
+od razu z istniejącym public_id.
+
+Zadania są przejmowane warunkowym UPDATE (pending -> uploading), więc
+można uruchomić kilka workerów; katalog UPLOAD_SPOOL_DIR musi być wtedy
+wspólny dla procesów webowych i workerów.
+"""
+import hashlib
+import logging
+import os
+import uuid
+from datetime import timedelta
+
+import cloudinary.uploader
+from cloudinary import utils as cloudinary_utils
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import assets
+from .models import AdvertisementMaterial, UploadJob
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 6 * 1024 * 1024
+MAX_ATTEMPTS = 3
+# Po takim czasie bez postępu zadanie w stanie 'uploading' uznajemy za porzucone (worker padł)
+STALE_AFTER = timedelta(minutes=30)
+
+
+def spool_dir():
+    path = getattr(settings, 'UPLOAD_SPOOL_DIR', None) or os.path.join(settings.BASE_DIR, 'upload_spool')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def spool(uploaded_file):
+    """Zapisuje przesłany plik w katalogu kolejki. Zwraca jego ścieżkę i skrót SHA-256 treści."""
+    extension = os.path.splitext(uploaded_file.name)[1].lower()
+    path = os.path.join(spool_dir(), f'{uuid.uuid4().hex}{extension}')
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        # Duży plik Django trzyma już na dysku - wystarczy go przenieść
+        file_move_safe(uploaded_file.temporary_file_path(), path)
+        return path, assets.file_sha256(path)
+    digest = hashlib.sha256()
+    with open(path, 'wb') as destination:
+        for chunk in uploaded_file.chunks():
+            digest.update(chunk)
+            destination.write(chunk)
+    return path, digest.hexdigest()
+
+
+def enqueue(form, user=None):
+    """Tworzy zadanie wysyłki z poprawnego formularza AdvertisementMaterialForm."""
+    data = form.cleaned_data
+    uploaded_file = data['file']
+    path, sha256 = spool(uploaded_file)
+    # Zadanie z plikiem, który już jest w Cloudinary, staje się widoczne dla workerów jako zakończone
+    with transaction.atomic():
+        job = UploadJob.objects.create(
+            stand=data['stand'],
+            created_by=user if user is not None and user.is_authenticated else None,
+            material_type=data['material_type'],
+            material_status=data['status'],
+            duration=data['duration'],
+            expires_at=data.get('expires_at'),
+            spool_path=path,
+            sha256=sha256,
+            original_name=uploaded_file.name,
+            total_bytes=uploaded_file.size,
+        )
+        reused = reuse_existing(job, sha256)
+    if reused:
+        job.refresh_from_db()
+    return job
+
+
+def upload_options(material_type):
+    """Opcje wysyłki takie jak przy zapisie przez CloudinaryField (folder, transformacje, eager)."""
+    field = AdvertisementMaterial._meta.get_field('file')
+    material = AdvertisementMaterial(material_type=material_type)
+    options = {key: value(material) if callable(value) else value for key, value in field.options.items()}
+    options.update(resource_type=field.resource_type, type=field.type, use_filename=True, unique_filename=True)
+    return options
+
+
+def upload_file(path, filename, progress=None, **options):
+    """
+    Wysyła plik do Cloudinary kawałkami (jak cloudinary.uploader.upload_large),
+    wywołując progress(wysłane bajty) po każdym kawałku. Zwraca wynik ostatniego kawałka.
+    """
+    total = os.path.getsize(path)
+    upload_id = cloudinary_utils.random_public_id()
+    result = None
+    sent = 0
+    with open(path, 'rb') as source:
+        chunk = source.read(CHUNK_SIZE)
+        while chunk:
+            headers = {
+                'Content-Range': f'bytes {sent}-{sent + len(chunk) - 1}/{total}',
+                'X-Unique-Upload-Id': upload_id,
+            }
+            result = cloudinary.uploader.upload_large_part((filename, chunk), http_headers=headers, **options)
+            options['public_id'] = result.get('public_id')
+            sent += len(chunk)
+            if progress is not None:
+                progress(sent)
+            chunk = source.read(CHUNK_SIZE)
+    return result
+
+
+def create_material(job, asset):
+    """Tworzy materiał zadania wskazujący na plik z rejestru i oznacza zadanie jako zakończone."""
+    material = AdvertisementMaterial.objects.create(
+        stand_id=job.stand_id,
+        material_type=job.material_type,
+        file=asset.resource(),
+        asset=asset,
+        status=job.material_status,
+        duration=job.duration,
+        expires_at=job.expires_at,
+        file_size=asset.file_size or job.total_bytes,
+    )
+    UploadJob.objects.filter(pk=job.pk).update(
+        state='done', material=material, uploaded_bytes=job.total_bytes, error='', updated_at=timezone.now(),
+    )
+    return material
+
+
+def store_result(job, result, sha256=''):
+    """Rejestruje plik wysłany do Cloudinary i tworzy z nim materiał zadania."""
+    with transaction.atomic():
+        return create_material(job, assets.register(sha256, result))
+
+
+def _discard_spool(job):
+    if not job.spool_path:
+        return
+    try:
+        os.remove(job.spool_path)
+    except FileNotFoundError:
+        pass
+
+
+def reuse_existing(job, sha256):
+    """
+    Jeśli plik o tej treści jest już w Cloudinary, tworzy materiał zadania bez
+    wysyłania pliku. Zwraca materiał albo None.
+    """
+    with transaction.atomic():
+        asset = assets.lookup(sha256)
+        if asset is None:
+            return None
+        material = create_material(job, asset)
+    _discard_spool(job)
+    logger.info(f'Plik {job.original_name} jest już w Cloudinary jako {asset.public_id} - '
+                f'materiał {material.pk} bez wysyłania (zadanie {job.pk})')
+    return material
+
+
+def process(job):
+    """Wysyła plik przejętego zadania i tworzy materiał. Zwraca True, jeśli się udało."""
+    def progress(sent):
+        UploadJob.objects.filter(pk=job.pk).update(uploaded_bytes=sent, updated_at=timezone.now())
+
+    # Ten sam plik mógł zostać wysłany przez inne zadanie, gdy to czekało w kolejce
+    if reuse_existing(job, job.sha256):
+        return True
+    try:
+        result = upload_file(job.spool_path, job.original_name, progress, **upload_options(job.material_type))
+    except Exception as e:
+        failed = job.attempts >= MAX_ATTEMPTS
+        logger.error(f'Błąd wysyłki pliku {job.original_name} (zadanie {job.pk}, próba {job.attempts}): {e}')
+        UploadJob.objects.filter(pk=job.pk).update(
+            state='failed' if failed else 'pending', error=str(e), uploaded_bytes=0, updated_at=timezone.now(),
+        )
+        if failed:
+            _discard_spool(job)
+        return False
+
+    material = store_result(job, result, job.sha256)
+    _discard_spool(job)
+    logger.info(f'Wysłano plik {job.original_name} jako materiał {material.pk} (zadanie {job.pk})')
+    return True
+
+
+def claim(job_id):
+    """Przejmuje zadanie dla bieżącego workera; None, jeśli przejął je już inny."""
+    claimed = UploadJob.objects.filter(pk=job_id, state='pending').update(
+        state='uploading', attempts=F('attempts') + 1, updated_at=timezone.now(),
+    )
+    return UploadJob.objects.get(pk=job_id) if claimed else None
+
+
+def requeue_stale(now=None):
+    """Przywraca do kolejki zadania porzucone przez worker, który przestał działać."""
+    now = now or timezone.now()
+    return UploadJob.objects.filter(state='uploading', updated_at__lt=now - STALE_AFTER).update(
+        state='pending', uploaded_bytes=0,
+    )
+
+
+def run_pending(limit=None):
+    """Przetwarza oczekujące zadania (od najstarszych). Zwraca (wysłane, nieudane)."""
+    requeue_stale()
+    done = failed = 0
+    pending = UploadJob.objects.filter(state='pending').order_by('created_at').values_list('id', flat=True)
+    for job_id in pending[:limit] if limit else pending:
+        job = claim(job_id)
+        if job is None:
+            continue
+        if process(job):
+            done += 1
+        else:
+            failed += 1
+    return done, failed
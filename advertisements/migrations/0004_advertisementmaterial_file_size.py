@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advertisements', '0003_remove_advertisementmaterial_cos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advertisementmaterial',
+            name='file_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Rozmiar pliku (bajty)'),
+        ),
+    ]
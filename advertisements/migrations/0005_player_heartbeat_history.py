@@ -0,0 +1,56 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advertisements', '0004_advertisementmaterial_file_size'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerHeartbeat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(verbose_name='Czas')),
+                ('stand', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='heartbeats', to='advertisements.stand', verbose_name='Stoisko')),
+            ],
+            options={
+                'verbose_name': 'Heartbeat odtwarzacza',
+                'verbose_name_plural': 'Heartbeaty odtwarzaczy',
+                'indexes': [models.Index(fields=['stand', 'timestamp'], name='heartbeat_stand_ts_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PlayerUptimeHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(verbose_name='Godzina')),
+                ('online_seconds', models.PositiveIntegerField(default=0, verbose_name='Czas online (sekundy)')),
+                ('heartbeats', models.PositiveIntegerField(default=0, verbose_name='Liczba heartbeatów')),
+                ('stand', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='uptime_hourly', to='advertisements.stand', verbose_name='Stoisko')),
+            ],
+            options={
+                'verbose_name': 'Godzinowy czas pracy odtwarzacza',
+                'verbose_name_plural': 'Godzinowe czasy pracy odtwarzaczy',
+                'constraints': [models.UniqueConstraint(fields=('stand', 'hour'), name='uptime_hourly_stand_hour_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PlayerUptimeInterval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(verbose_name='Początek')),
+                ('ended_at', models.DateTimeField(verbose_name='Koniec')),
+                ('stand', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='uptime_intervals', to='advertisements.stand', verbose_name='Stoisko')),
+            ],
+            options={
+                'verbose_name': 'Okres pracy odtwarzacza',
+                'verbose_name_plural': 'Okresy pracy odtwarzaczy',
+                'indexes': [models.Index(fields=['stand', 'started_at'], name='uptime_stand_start_idx')],
+            },
+        ),
+    ]
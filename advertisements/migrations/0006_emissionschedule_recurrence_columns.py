@@ -0,0 +1,93 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:42
+
+import calendar
+
+from django.db import migrations, models
+
+ALL_WEEKDAYS = 0b1111111
+
+
+def recurrence_columns(start_date, start_time, end_time, repeat_type, repeat_days):
+    """
+    Kopia advertisements.recurrence.recurrence_columns z chwili tej migracji
+    (bez typu 'custom', który wtedy nie istniał) - migracja nie może zależeć
+    od kodu aplikacji, który będzie się dalej zmieniał.
+    """
+    weekday_mask, month_day, last_day = 0, None, False
+    if repeat_type == 'none':
+        weekday_mask = 1 << start_date.weekday()
+    elif repeat_type == 'daily':
+        weekday_mask = ALL_WEEKDAYS
+    elif repeat_type == 'weekly':
+        for weekday in repeat_days or ():
+            if isinstance(weekday, int) and 0 <= weekday <= 6:
+                weekday_mask |= 1 << weekday
+    elif repeat_type == 'monthly':
+        weekday_mask = ALL_WEEKDAYS
+        if start_date.day >= 28 and start_date.day == calendar.monthrange(start_date.year, start_date.month)[1]:
+            last_day = True
+        else:
+            month_day = start_date.day
+    return {
+        'weekday_mask': weekday_mask,
+        'month_day': month_day,
+        'last_day_of_month': last_day,
+        'start_minute': start_time.hour * 60 + start_time.minute,
+        'end_minute': end_time.hour * 60 + end_time.minute,
+    }
+
+
+def fill_recurrence_columns(apps, schema_editor):
+    EmissionSchedule = apps.get_model('advertisements', 'EmissionSchedule')
+    fields = ['weekday_mask', 'month_day', 'last_day_of_month', 'start_minute', 'end_minute']
+    batch = []
+    for schedule in EmissionSchedule.objects.order_by('id').iterator(chunk_size=1000):
+        for field, value in recurrence_columns(schedule.start_date, schedule.start_time, schedule.end_time,
+                                               schedule.repeat_type, schedule.repeat_days).items():
+            setattr(schedule, field, value)
+        batch.append(schedule)
+        if len(batch) >= 1000:
+            EmissionSchedule.objects.bulk_update(batch, fields)
+            batch = []
+    if batch:
+        EmissionSchedule.objects.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advertisements', '0005_player_heartbeat_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emissionschedule',
+            name='end_minute',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Minuta zakończenia'),
+        ),
+        migrations.AddField(
+            model_name='emissionschedule',
+            name='last_day_of_month',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Ostatni dzień miesiąca'),
+        ),
+        migrations.AddField(
+            model_name='emissionschedule',
+            name='month_day',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='Dzień miesiąca'),
+        ),
+        migrations.AddField(
+            model_name='emissionschedule',
+            name='start_minute',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Minuta rozpoczęcia'),
+        ),
+        migrations.AddField(
+            model_name='emissionschedule',
+            name='weekday_mask',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Maska dni tygodnia'),
+        ),
+        migrations.AddIndex(
+            model_name='emissionschedule',
+            index=models.Index(fields=['is_active', 'weekday_mask', 'start_minute', 'end_minute'], name='schedule_recurrence_idx'),
+        ),
+        migrations.RunPython(fill_recurrence_columns, migrations.RunPython.noop),
+    ]
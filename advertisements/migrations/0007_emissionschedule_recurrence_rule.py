@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advertisements', '0006_emissionschedule_recurrence_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emissionschedule',
+            name='recurrence_rule',
+            field=models.TextField(blank=True, default='', verbose_name='Reguła powtarzania (RRULE)'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:47
+
+import advertisements.store_time
+import advertisements.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advertisements', '0007_emissionschedule_recurrence_rule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='store',
+            name='timezone',
+            field=models.CharField(default=advertisements.store_time.default_timezone, max_length=64, validators=[advertisements.validators.validate_timezone], verbose_name='Strefa czasowa'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advertisements', '0008_store_timezone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmissionSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField(verbose_name='Początek')),
+                ('end', models.DateTimeField(verbose_name='Koniec')),
+                ('priority', models.IntegerField(verbose_name='Priorytet')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='emission_slots', to='advertisements.advertisementmaterial', verbose_name='Materiał')),
+                ('schedule', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='slots', to='advertisements.emissionschedule', verbose_name='Harmonogram')),
+                ('stand', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='emission_slots', to='advertisements.stand', verbose_name='Stoisko')),
+            ],
+            options={
+                'verbose_name': 'Wystąpienie emisji',
+                'verbose_name_plural': 'Wystąpienia emisji',
+                'ordering': ['start', 'stand', '-priority'],
+                'indexes': [models.Index(fields=['stand', 'start'], name='slot_stand_start_idx'), models.Index(fields=['start'], name='slot_start_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advertisements', '0009_emission_slots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('material_type', models.CharField(choices=[('image', 'Obraz'), ('video', 'Film')], max_length=10, verbose_name='Typ materiału')),
+                ('material_status', models.CharField(choices=[('active', 'Aktywny'), ('inactive', 'Nieaktywny')], default='active', max_length=10, verbose_name='Status materiału')),
+                ('duration', models.IntegerField(default=5, verbose_name='Czas wyświetlania (sekundy)')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Data wygaśnięcia')),
+                ('spool_path', models.CharField(max_length=500, verbose_name='Plik tymczasowy')),
+                ('original_name', models.CharField(max_length=255, verbose_name='Nazwa pliku')),
+                ('total_bytes', models.PositiveBigIntegerField(default=0, verbose_name='Rozmiar (bajty)')),
+                ('uploaded_bytes', models.PositiveBigIntegerField(default=0, verbose_name='Wysłano (bajty)')),
+                ('state', models.CharField(choices=[('pending', 'Oczekuje'), ('uploading', 'Wysyłanie'), ('done', 'Gotowe'), ('failed', 'Błąd')], default='pending', max_length=10, verbose_name='Stan')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Liczba prób')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Błąd')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Dodane przez')),
+                ('material', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_jobs', to='advertisements.advertisementmaterial', verbose_name='Materiał')),
+                ('stand', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_jobs', to='advertisements.stand', verbose_name='Stoisko')),
+            ],
+            options={
+                'verbose_name': 'Wysyłka pliku',
+                'verbose_name_plural': 'Wysyłki plików',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['state', 'created_at'], name='upload_job_state_idx')],
+            },
+        ),
+    ]
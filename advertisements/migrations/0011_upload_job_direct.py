@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advertisements', '0010_upload_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadjob',
+            name='upload_id',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='Identyfikator wysyłki'),
+        ),
+        migrations.AlterField(
+            model_name='uploadjob',
+            name='spool_path',
+            field=models.CharField(blank=True, default='', max_length=500, verbose_name='Plik tymczasowy'),
+        ),
+        migrations.AlterField(
+            model_name='uploadjob',
+            name='state',
+            field=models.CharField(choices=[('pending', 'Oczekuje'), ('uploading', 'Wysyłanie'), ('direct', 'Wysyłanie z przeglądarki'), ('done', 'Gotowe'), ('failed', 'Błąd')], default='pending', max_length=10, verbose_name='Stan'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advertisements', '0011_upload_job_direct'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaAsset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='Skrót SHA-256')),
+                ('public_id', models.CharField(max_length=255, unique=True, verbose_name='Identyfikator Cloudinary')),
+                ('resource_type', models.CharField(max_length=10, verbose_name='Typ zasobu')),
+                ('format', models.CharField(blank=True, default='', max_length=10, verbose_name='Format')),
+                ('version', models.CharField(blank=True, default='', max_length=20, verbose_name='Wersja')),
+                ('file_size', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Rozmiar pliku (bajty)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Plik multimedialny',
+                'verbose_name_plural': 'Pliki multimedialne',
+            },
+        ),
+        migrations.AddField(
+            model_name='uploadjob',
+            name='sha256',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='Skrót SHA-256'),
+        ),
+        migrations.AddField(
+            model_name='advertisementmaterial',
+            name='asset',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='materials', to='advertisements.mediaasset', verbose_name='Plik multimedialny'),
+        ),
+    ]
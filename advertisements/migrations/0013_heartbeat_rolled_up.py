@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:11
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def mark_rolled_up(apps, schema_editor):
+    """Heartbeaty sprzed końca ostatniego okresu pracy stoiska zostały już przetworzone."""
+    PlayerHeartbeat = apps.get_model('advertisements', 'PlayerHeartbeat')
+    PlayerUptimeInterval = apps.get_model('advertisements', 'PlayerUptimeInterval')
+    last_end = PlayerUptimeInterval.objects.filter(stand_id=OuterRef('stand_id')).order_by('-ended_at').values('ended_at')[:1]
+    PlayerHeartbeat.objects.filter(timestamp__lte=Subquery(last_end)).update(rolled_up=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advertisements', '0012_media_assets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playerheartbeat',
+            name='rolled_up',
+            field=models.BooleanField(default=False, verbose_name='Przetworzony'),
+        ),
+        migrations.RunPython(mark_rolled_up, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='playerheartbeat',
+            index=models.Index(condition=models.Q(('rolled_up', False)), fields=['id'], name='heartbeat_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advertisements', '0013_heartbeat_rolled_up'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emissionslot',
+            name='material',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='emission_slots', to='advertisements.advertisementmaterial', verbose_name='Materiał'),
+        ),
+    ]
@@ -1,8 +1,10 @@
+from django.conf import settings
 from django.db import models
+from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator
 from cloudinary.models import CloudinaryField
 from cloudinary.utils import cloudinary_url
-from .validators import CloudinaryFileExtensionValidator
+from .validators import CloudinaryFileExtensionValidator, validate_timezone
 import cloudinary
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
@@ -10,11 +12,17 @@ from django.dispatch import receiver
 import logging
 import traceback
 from django.utils import timezone
+from .recurrence import RecurrenceRuleError, compile_rule, recurrence_columns
+from .renditions import eager_for
+from .store_time import default_timezone
 logger = logging.getLogger(__name__)
 
 class Store(models.Model):
     name = models.CharField(max_length=255, verbose_name="Nazwa sklepu")
     location = models.CharField(max_length=255, verbose_name="Lokalizacja")
+    # Harmonogramy stoisk sklepu są rozwiązywane w jego czasie lokalnym
+    timezone = models.CharField(max_length=64, default=default_timezone, validators=[validate_timezone],
+                                verbose_name="Strefa czasowa")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -61,6 +69,38 @@ class Stand(models.Model):
     def __str__(self):
         return f"{self.name} ({self.department.name}, {self.department.store.name})"
 
+class MediaAsset(models.Model):
+    """
+    Plik w Cloudinary współdzielony przez materiały o tej samej treści (rejestr
+    deduplikacji, patrz assets.py). Odwołaniami są materiały wskazujące na zasób -
+    plik jest usuwany z Cloudinary razem z ostatnim z nich.
+    """
+    # Brak skrótu: treść nie została zweryfikowana przez serwer (wysyłka bezpośrednia do Cloudinary)
+    sha256 = models.CharField(max_length=64, unique=True, null=True, blank=True, verbose_name="Skrót SHA-256")
+    public_id = models.CharField(max_length=255, unique=True, verbose_name="Identyfikator Cloudinary")
+    resource_type = models.CharField(max_length=10, verbose_name="Typ zasobu")
+    format = models.CharField(max_length=10, blank=True, default='', verbose_name="Format")
+    version = models.CharField(max_length=20, blank=True, default='', verbose_name="Wersja")
+    file_size = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="Rozmiar pliku (bajty)")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Plik multimedialny"
+        verbose_name_plural = "Pliki multimedialne"
+
+    def __str__(self):
+        return self.public_id
+
+    def resource(self):
+        """Zasób jako wartość CloudinaryField materiału."""
+        return cloudinary.CloudinaryResource(
+            self.public_id,
+            format=self.format or None,
+            version=self.version or None,
+            type='upload',
+            resource_type=self.resource_type,
+        )
+
 def advertisement_file_path(instance, filename):
     # Generate a file path for the advertisement material
     ext = filename.split('.')[-1]
@@ -90,13 +130,20 @@ class AdvertisementMaterial(models.Model):
                 {'video_codec': 'auto'},
                 {'width': 3840, 'height': 2160, 'crop': 'limit'},       # zmiana rozdzielczości
             ],
+            # Drabinka wersji wideo (rozdzielczości x kodeki) transkodowana od razu po wysłaniu
+            eager=eager_for,
+            eager_async=True,
             validators=[CloudinaryFileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'mp4', 'webm', 'mov', 'avi', 'mkv'])],
             help_text="Wybierz plik obrazu lub wideo. Obsługiwane formaty: jpg, jpeg, png, mp4, webm, mov, avi, mkv.",
         )
+    # Plik współdzielony z innymi materiałami o tej samej treści (brak dla plików wysłanych przez CloudinaryField)
+    asset = models.ForeignKey(MediaAsset, on_delete=models.PROTECT, null=True, blank=True, related_name='materials',
+                              verbose_name="Plik multimedialny")
     expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Data wygaśnięcia")
     order = models.PositiveIntegerField(default=0, verbose_name="Kolejność")
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active', verbose_name="Status")
     duration = models.IntegerField(default=5, verbose_name="Czas wyświetlania (sekundy)")
+    file_size = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="Rozmiar pliku (bajty)")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -149,6 +196,14 @@ class AdvertisementMaterial(models.Model):
             return True
         return False
         
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Po wysłaniu pliku przez CloudinaryField zapamiętaj jego rozmiar (podpowiedź dla odtwarzaczy)
+        metadata = getattr(self.file, 'metadata', None) or {}
+        if metadata.get('bytes') and metadata['bytes'] != self.file_size:
+            self.file_size = metadata['bytes']
+            AdvertisementMaterial.objects.filter(pk=self.pk).update(file_size=self.file_size)
+
     def delete(self, *args, **kwargs):
         logger.debug(f"Wywołano delete() dla AdvertisementMaterial id={self.id}")
         file_id = None
@@ -158,10 +213,17 @@ class AdvertisementMaterial(models.Model):
         else:
             logger.debug("Brak pliku do usunięcia (self.file jest None lub puste)")
 
+        # Zasób mógł zostać przypisany już po wczytaniu materiału (assets.adopt_legacy)
+        if self.pk and not self.asset_id:
+            self.asset_id = type(self).objects.filter(pk=self.pk).values_list('asset_id', flat=True).first()
+
         super().delete(*args, **kwargs)
         logger.debug("Obiekt AdvertisementMaterial usunięty z bazy")
 
-        if file_id:
+        if self.asset_id:
+            # Plik współdzielony - sygnał post_delete usunie go z Cloudinary razem z ostatnim odwołaniem
+            logger.debug(f"Plik {file_id} należy do zasobu {self.asset_id}, zwalnia go rejestr")
+        elif file_id:
             try:
                 # Ustal właściwy resource_type
                 if self.material_type == 'image':
@@ -205,6 +267,56 @@ class PlayerStatus(models.Model):
     
     def __str__(self):
         return f"Status odtwarzacza - {self.stand.name}"
+
+
+class PlayerHeartbeat(models.Model):
+    """Surowa historia heartbeatów (tylko do dopisywania, czyszczona po okresie retencji)"""
+    stand = models.ForeignKey(Stand, on_delete=models.CASCADE, related_name='heartbeats', db_index=False, verbose_name="Stoisko")
+    timestamp = models.DateTimeField(verbose_name="Czas")
+    # Czy heartbeat został już uwzględniony w okresach pracy i podsumowaniach (heartbeats.rollup)
+    rolled_up = models.BooleanField(default=False, verbose_name="Przetworzony")
+
+    class Meta:
+        verbose_name = "Heartbeat odtwarzacza"
+        verbose_name_plural = "Heartbeaty odtwarzaczy"
+        indexes = [
+            models.Index(fields=['stand', 'timestamp'], name='heartbeat_stand_ts_idx'),
+            models.Index(fields=['id'], condition=models.Q(rolled_up=False), name='heartbeat_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"Heartbeat {self.stand_id} - {self.timestamp}"
+
+
+class PlayerUptimeInterval(models.Model):
+    """Ciągły okres pracy odtwarzacza (kolejne heartbeaty bez przerwy dłuższej niż próg offline)"""
+    stand = models.ForeignKey(Stand, on_delete=models.CASCADE, related_name='uptime_intervals', db_index=False, verbose_name="Stoisko")
+    started_at = models.DateTimeField(verbose_name="Początek")
+    ended_at = models.DateTimeField(verbose_name="Koniec")
+
+    class Meta:
+        verbose_name = "Okres pracy odtwarzacza"
+        verbose_name_plural = "Okresy pracy odtwarzaczy"
+        indexes = [models.Index(fields=['stand', 'started_at'], name='uptime_stand_start_idx')]
+
+    def __str__(self):
+        return f"{self.stand_id}: {self.started_at} - {self.ended_at}"
+
+
+class PlayerUptimeHourly(models.Model):
+    """Godzinowe podsumowanie czasu pracy odtwarzacza"""
+    stand = models.ForeignKey(Stand, on_delete=models.CASCADE, related_name='uptime_hourly', db_index=False, verbose_name="Stoisko")
+    hour = models.DateTimeField(verbose_name="Godzina")
+    online_seconds = models.PositiveIntegerField(default=0, verbose_name="Czas online (sekundy)")
+    heartbeats = models.PositiveIntegerField(default=0, verbose_name="Liczba heartbeatów")
+
+    class Meta:
+        verbose_name = "Godzinowy czas pracy odtwarzacza"
+        verbose_name_plural = "Godzinowe czasy pracy odtwarzaczy"
+        constraints = [models.UniqueConstraint(fields=['stand', 'hour'], name='uptime_hourly_stand_hour_uniq')]
+
+    def __str__(self):
+        return f"{self.stand_id} {self.hour}: {self.online_seconds}s"
     
     
 class EmissionSchedule(models.Model):
@@ -238,19 +350,66 @@ class EmissionSchedule(models.Model):
     end_time = models.TimeField(verbose_name="Czas zakończenia")
     repeat_type = models.CharField(max_length=10, choices=REPEAT_CHOICES, default='none', verbose_name="Typ powtarzania")
     repeat_days = models.JSONField(null=True, blank=True, verbose_name="Dni powtarzania")
+    recurrence_rule = models.TextField(blank=True, default='', verbose_name="Reguła powtarzania (RRULE)")
     priority = models.IntegerField(default=5, verbose_name="Priorytet")
     is_active = models.BooleanField(default=True, verbose_name="Aktywny")
+    # Reguła powtarzania w postaci do filtrowania w SQL (patrz recurrence.py), liczona przy zapisie
+    weekday_mask = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="Maska dni tygodnia")
+    month_day = models.PositiveSmallIntegerField(null=True, blank=True, editable=False, verbose_name="Dzień miesiąca")
+    last_day_of_month = models.BooleanField(default=False, editable=False, verbose_name="Ostatni dzień miesiąca")
+    start_minute = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="Minuta rozpoczęcia")
+    end_minute = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="Minuta zakończenia")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Pola, z których wyliczane są kolumny reguły powtarzania
+    RECURRENCE_SOURCE_FIELDS = {'start_date', 'start_time', 'end_time', 'repeat_type', 'repeat_days', 'recurrence_rule'}
+
     class Meta:
         verbose_name = "Harmonogram emisji"
         verbose_name_plural = "Harmonogramy emisji"
         ordering = ['-priority', 'start_date', 'start_time']
+        indexes = [
+            models.Index(fields=['is_active', 'weekday_mask', 'start_minute', 'end_minute'],
+                         name='schedule_recurrence_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.start_date} - {self.end_date or 'brak końca'})"
 
+    def sync_recurrence(self):
+        """Przelicza kolumny reguły powtarzania z pól harmonogramu."""
+        columns = recurrence_columns(self.start_date, self.start_time, self.end_time,
+                                     self.repeat_type, self.repeat_days, self.recurrence_rule)
+        for field, value in columns.items():
+            setattr(self, field, value)
+        return list(columns)
+
+    def compiled_rule(self):
+        """Skompilowana reguła typu 'custom' (z cache) lub None, gdy brak lub jest niepoprawna."""
+        if self.repeat_type != 'custom' or not self.recurrence_rule:
+            return None
+        try:
+            return compile_rule(self.recurrence_rule, self.start_date)
+        except RecurrenceRuleError:
+            # Niepoprawna reguła (walidowana w clean()) - harmonogram nigdy nie obowiązuje
+            return None
+
+    def clean(self):
+        super().clean()
+        if self.repeat_type == 'custom' and self.recurrence_rule and self.start_date:
+            try:
+                compile_rule(self.recurrence_rule, self.start_date)
+            except RecurrenceRuleError as e:
+                raise ValidationError({'recurrence_rule': f'Niepoprawna reguła powtarzania: {e}'})
+
+    def save(self, *args, **kwargs):
+        fields = self.sync_recurrence()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.RECURRENCE_SOURCE_FIELDS.intersection(update_fields):
+            kwargs['update_fields'] = set(update_fields) | set(fields)
+        super().save(*args, **kwargs)
+
     def has_ended(self, current_date=None, current_time=None):
         """Sprawdza czy harmonogram się zakończył"""
         now = timezone.now()
@@ -307,8 +466,9 @@ class EmissionSchedule(models.Model):
             except:
                 return False
         elif self.repeat_type == 'custom':
-            # Implementacja dla niestandardowych powtórzeń (można rozszerzyć)
-            return False
+            # Reguła RRULE - kompilowana raz, sprawdzenie dnia w czasie stałym
+            rule = self.compiled_rule()
+            return rule is not None and rule.matches(check_date)
             
         return False
 
@@ -331,14 +491,97 @@ class EmissionSchedule(models.Model):
             return False
         
         # Sprawdź czas
+        return self.is_within_time_window(current_time)
+
+    def is_within_time_window(self, current_time):
+        """Sprawdza czy godzina mieści się w oknie emisji harmonogramu"""
         # Obsługa harmonogramów nocnych (przez północ)
         if self.start_time <= self.end_time:
             # Normalny zakres godzin (np. 8:00-20:00)
-            is_active_time = self.start_time <= current_time <= self.end_time
-        else:
-            # Zakres przez północ (np. 22:00-6:00)
-            is_active_time = self.start_time <= current_time or current_time <= self.end_time
-        
-        return is_active_time
+            return self.start_time <= current_time <= self.end_time
+        # Zakres przez północ (np. 22:00-6:00)
+        return self.start_time <= current_time or current_time <= self.end_time
+    
     
-    
\ No newline at end of file
+
+class EmissionSlot(models.Model):
+    """Konkretne wystąpienie emisji materiału na stoisku (materializowane z harmonogramów, patrz emission_slots.py)"""
+    stand = models.ForeignKey(Stand, on_delete=models.CASCADE, related_name='emission_slots', db_index=False,
+                              verbose_name="Stoisko")
+    # Po usunięciu materiału lub harmonogramu minione wystąpienia zostają jako historia emisji
+    material = models.ForeignKey(AdvertisementMaterial, on_delete=models.SET_NULL, null=True,
+                                 related_name='emission_slots', verbose_name="Materiał")
+    schedule = models.ForeignKey(EmissionSchedule, on_delete=models.SET_NULL, null=True, related_name='slots',
+                                 verbose_name="Harmonogram")
+    start = models.DateTimeField(verbose_name="Początek")
+    # Koniec wyłączny (okno harmonogramu kończy się włącznie z end_time)
+    end = models.DateTimeField(verbose_name="Koniec")
+    priority = models.IntegerField(verbose_name="Priorytet")
+
+    class Meta:
+        verbose_name = "Wystąpienie emisji"
+        verbose_name_plural = "Wystąpienia emisji"
+        ordering = ['start', 'stand', '-priority']
+        indexes = [
+            models.Index(fields=['stand', 'start'], name='slot_stand_start_idx'),
+            models.Index(fields=['start'], name='slot_start_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.stand_id} {self.material_id} {self.start} - {self.end}"
+
+
+class UploadJob(models.Model):
+    """Plik materiału czekający na wysłanie do Cloudinary przez worker (patrz media.py)"""
+    STATE_CHOICES = (
+        ('pending', 'Oczekuje'),
+        ('uploading', 'Wysyłanie'),
+        # Plik wysyła przeglądarka bezpośrednio do Cloudinary (direct_upload.py)
+        ('direct', 'Wysyłanie z przeglądarki'),
+        ('done', 'Gotowe'),
+        ('failed', 'Błąd'),
+    )
+
+    stand = models.ForeignKey(Stand, on_delete=models.CASCADE, related_name='upload_jobs', verbose_name="Stoisko")
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='upload_jobs', verbose_name="Dodane przez")
+    # Pola formularza, z których po wysłaniu pliku powstaje materiał
+    material_type = models.CharField(max_length=10, choices=AdvertisementMaterial.TYPE_CHOICES, verbose_name="Typ materiału")
+    material_status = models.CharField(max_length=10, choices=AdvertisementMaterial.STATUS_CHOICES, default='active',
+                                       verbose_name="Status materiału")
+    duration = models.IntegerField(default=5, verbose_name="Czas wyświetlania (sekundy)")
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Data wygaśnięcia")
+    # Plik zapisany na dysku (UPLOAD_SPOOL_DIR) do czasu wysłania
+    spool_path = models.CharField(max_length=500, blank=True, default='', verbose_name="Plik tymczasowy")
+    # Skrót treści policzony przez serwer (deduplikacja, patrz assets.py)
+    sha256 = models.CharField(max_length=64, blank=True, default='', verbose_name="Skrót SHA-256")
+    # X-Unique-Upload-Id wysyłki kawałkami - ten sam przy wznawianiu przerwanej wysyłki
+    upload_id = models.CharField(max_length=64, blank=True, default='', verbose_name="Identyfikator wysyłki")
+    original_name = models.CharField(max_length=255, verbose_name="Nazwa pliku")
+    total_bytes = models.PositiveBigIntegerField(default=0, verbose_name="Rozmiar (bajty)")
+    uploaded_bytes = models.PositiveBigIntegerField(default=0, verbose_name="Wysłano (bajty)")
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='pending', verbose_name="Stan")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Liczba prób")
+    error = models.TextField(blank=True, default='', verbose_name="Błąd")
+    material = models.ForeignKey(AdvertisementMaterial, on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name='upload_jobs', verbose_name="Materiał")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Wysyłka pliku"
+        verbose_name_plural = "Wysyłki plików"
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['state', 'created_at'], name='upload_job_state_idx')]
+
+    def __str__(self):
+        return f"{self.original_name} ({self.get_state_display()})"
+
+    @property
+    def progress(self):
+        """Postęp wysyłki w procentach (0-100)."""
+        if self.state == 'done':
+            return 100
+        if not self.total_bytes:
+            return 0
+        return min(100, int(100 * self.uploaded_bytes / self.total_bytes))
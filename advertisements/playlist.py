@@ -0,0 +1,257 @@
+"""
+Skompilowana playlista stoiska dla API odtwarzacza.
+
+Wynik rozwiązania harmonogramów dla stoiska jest zapisywany w cache jako
+gotowy snapshot (dane + ETag), kluczowany identyfikatorem stoiska i wersją
+treści. Wersja jest podbijana sygnałami przy każdej zmianie materiałów,
+harmonogramów lub ustawień stoiska, więc stary snapshot przestaje być
+osiągalny bez jawnego usuwania.
+"""
+import hashlib
+import json
+import time
+from datetime import timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from . import renditions
+from .models import Stand
+from .resolver import PlaylistResolver
+from .serializers import StandSerializer, AdvertisementMaterialSerializer
+from .store_time import get_zone
+
+VERSION_KEY = 'playlist:version:{stand_id}'
+SNAPSHOT_KEY = 'playlist:snapshot:{stand_id}:{version}'
+LATEST_KEY = 'playlist:latest:{stand_id}'
+HISTORY_KEY = 'playlist:history:{stand_id}:{version}'
+
+# Górny limit życia snapshotu - nawet bez zmian treści odświeżamy go co godzinę
+SNAPSHOT_MAX_AGE = 60 * 60
+# Jak długo przechowujemy poprzednie wersje playlisty na potrzeby ?since=
+HISTORY_MAX_AGE = 24 * 60 * 60
+
+
+def _new_version():
+    return int(time.time() * 1000)
+
+
+def get_version(stand_id):
+    """Zwraca bieżącą wersję treści stoiska (tworzy ją przy pierwszym użyciu)."""
+    return get_versions([stand_id])[stand_id]
+
+
+def get_versions(stand_ids):
+    """Bieżące wersje treści wielu stoisk: {stand_id: wersja}."""
+    keys = {VERSION_KEY.format(stand_id=stand_id): stand_id for stand_id in stand_ids}
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        version = _new_version()
+        for key in missing:
+            cache.add(key, version, None)
+        found.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in found.items()}
+
+
+def invalidate_stands(stand_ids):
+    """
+    Podbija wersję treści podanych stoisk.
+
+    Wersja rośnie monotonicznie - nawet po utracie cache nowa wartość
+    (znacznik czasu w ms) jest większa od poprzednich.
+    """
+    keys = {VERSION_KEY.format(stand_id=stand_id) for stand_id in stand_ids if stand_id}
+    if not keys:
+        return
+    current = cache.get_many(keys)
+    now = _new_version()
+    cache.set_many({key: max(now, current.get(key, 0) + 1) for key in keys}, None)
+
+
+def build_snapshot(resolver, stand, now=None):
+    """
+    Rozwiązuje playlistę stoiska. Zwracany snapshot nie ma jeszcze wersji -
+    nadaje ją _publish(); 'content' to skrót samej treści playlisty.
+    """
+    now = timezone.localtime(now or timezone.now())
+
+    # Adresy plików w wersji dopasowanej do ekranu stoiska
+    context = {'rendition': renditions.for_stand(stand)}
+    materials_data = []
+    for entry in resolver.playlist(stand, now):
+        material_data = AdvertisementMaterialSerializer(entry.material, context=context).data
+        if entry.priority is not None:
+            material_data['schedule_priority'] = entry.priority
+        materials_data.append(material_data)
+
+    data = dict(StandSerializer(stand, context={'materials': materials_data}).data)
+    body = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+
+    return {
+        'content': hashlib.md5(body.encode('utf-8')).hexdigest(),
+        'data': data,
+        'valid_until': resolver.next_transition(stand, now),
+    }
+
+
+def _publish(stand_id, version, snapshot, now):
+    """
+    Nadaje snapshotowi wersję i zapisuje go w cache.
+
+    Jeśli treść playlisty zmieniła się bez podbicia wersji (minęła granica
+    okna harmonogramu), wersja jest podbijana tutaj - dzięki temu wersja
+    jednoznacznie identyfikuje treść, co wykorzystuje synchronizacja różnicowa.
+    """
+    latest_key = LATEST_KEY.format(stand_id=stand_id)
+    latest = cache.get(latest_key)
+    if latest and latest['version'] >= version and latest['content'] != snapshot['content']:
+        invalidate_stands([stand_id])
+        version = get_version(stand_id)
+
+    snapshot['version'] = version
+    snapshot['etag'] = '"%s-%s"' % (version, snapshot['content'])
+    snapshot['data']['version'] = version
+
+    timeout = min(SNAPSHOT_MAX_AGE, max(1, int((snapshot['valid_until'] - now).total_seconds())))
+    cache.set(SNAPSHOT_KEY.format(stand_id=stand_id, version=version), snapshot, timeout)
+    cache.set(HISTORY_KEY.format(stand_id=stand_id, version=version), snapshot['data'], HISTORY_MAX_AGE)
+    cache.set(latest_key, {'version': version, 'content': snapshot['content']}, None)
+    return snapshot
+
+
+def get_snapshot(stand_id):
+    """
+    Zwraca snapshot playlisty stoiska z cache, budując go w razie potrzeby.
+
+    Rzuca Stand.DoesNotExist, jeśli stoisko nie istnieje.
+    """
+    snapshots = get_snapshots([stand_id])
+    if stand_id not in snapshots:
+        raise Stand.DoesNotExist
+    return snapshots[stand_id]
+
+
+def get_snapshots(stand_ids):
+    """
+    Snapshoty playlist wielu stoisk naraz: {stand_id: snapshot}.
+
+    Wersje i snapshoty są pobierane z cache zbiorczo, a brakujące budowane
+    jednym PlaylistResolverem (stała liczba zapytań niezależnie od liczby
+    stoisk). Nieistniejące stoiska są pomijane.
+    """
+    versions = get_versions(stand_ids)
+    keys = {SNAPSHOT_KEY.format(stand_id=stand_id, version=version): stand_id
+            for stand_id, version in versions.items()}
+    now = timezone.now()
+
+    snapshots = {}
+    for key, snapshot in cache.get_many(keys).items():
+        if snapshot['valid_until'] > now:
+            snapshots[keys[key]] = snapshot
+
+    missing = [stand_id for stand_id in versions if stand_id not in snapshots]
+    if missing:
+        resolver = PlaylistResolver(Stand.objects.filter(pk__in=missing))
+        for stand in resolver.stands:
+            snapshots[stand.id] = _publish(stand.id, versions[stand.id], build_snapshot(resolver, stand, now), now)
+    return snapshots
+
+
+def warm_snapshots(stand_ids, batch_size=500):
+    """
+    Buduje z wyprzedzeniem snapshoty stoisk, których nie ma jeszcze w cache
+    (np. po przejściu harmonogramu), żeby odtwarzacze i strona odtwarzacza
+    czytały już tylko gotowy stan.
+    """
+    stand_ids = list(stand_ids)
+    for start in range(0, len(stand_ids), batch_size):
+        get_snapshots(stand_ids[start:start + batch_size])
+
+
+def build_delta(snapshot, since):
+    """
+    Różnica między playlistą w wersji `since` a bieżącym snapshotem.
+
+    Zwraca None, jeśli stan w wersji `since` nie jest już dostępny
+    (klient powinien wtedy pobrać pełną playlistę).
+    """
+    if since == snapshot['version']:
+        return {'version': since, 'up_to_date': True}
+
+    previous = cache.get(HISTORY_KEY.format(stand_id=snapshot['data']['id'], version=since))
+    if previous is None:
+        return None
+
+    current = snapshot['data']
+    old_materials = {material['id']: material for material in previous['materials']}
+    new_ids = [material['id'] for material in current['materials']]
+    kept_ids = set(new_ids)
+
+    return {
+        'version': snapshot['version'],
+        'since': since,
+        'up_to_date': False,
+        'added': [material for material in current['materials'] if material['id'] not in old_materials],
+        'updated': [material for material in current['materials']
+                    if material['id'] in old_materials and material != old_materials[material['id']]],
+        'removed': [material_id for material_id in old_materials if material_id not in kept_ids],
+        # Pełna kolejność identyfikatorów - klient układa według niej playlistę
+        'order': new_ids,
+        'stand': {key: value for key, value in current.items()
+                  if key not in ('materials', 'version') and previous.get(key) != value},
+    }
+
+
+def build_manifest(resolver, stand, start, hours):
+    """
+    Rozwinięta oś czasu playlisty stoiska na najbliższe `hours` godzin.
+
+    Oś jest dzielona w punktach przejścia harmonogramów; sąsiednie okna
+    z identyczną playlistą są scalane. Każdy materiał występuje raz na liście
+    materiałów (URL, czas wyświetlania, rozmiar), a okna odwołują się do nich po id.
+    Czasy są podawane w strefie czasowej sklepu.
+    """
+    zone = get_zone(resolver.zone(stand))
+    # Obliczenia w UTC (bez dwuznaczności przy zmianie czasu), wynik w czasie sklepu
+    start = start.astimezone(dt_timezone.utc)
+    end = start + timedelta(hours=hours)
+
+    context = {'rendition': renditions.for_stand(stand)}
+    materials = {}
+    timeline = []
+    moment = start
+    while moment < end:
+        window_end = min(resolver.next_transition(stand, moment), end)
+        entries = resolver.playlist(stand, moment)
+        items = [{'id': entry.material.id, 'schedule_priority': entry.priority} for entry in entries]
+        for entry in entries:
+            if entry.material.id not in materials:
+                material_data = AdvertisementMaterialSerializer(entry.material, context=context).data
+                material_data['bytes'] = entry.material.file_size
+                materials[entry.material.id] = material_data
+
+        # Granice okien z dokładnością do sekundy (koniec okna harmonogramu jest włączny)
+        window = {'start': timezone.localtime(moment, zone).replace(microsecond=0),
+                  'end': timezone.localtime(window_end, zone).replace(microsecond=0), 'materials': items}
+        if timeline and timeline[-1]['materials'] == items:
+            timeline[-1]['end'] = window['end']
+        else:
+            timeline.append(window)
+        moment = window_end
+
+    return {
+        'stand': {
+            'id': stand.id,
+            'display_time': stand.display_time,
+            'transition_animation': stand.transition_animation,
+        },
+        'version': get_version(stand.id),
+        'generated_at': timezone.localtime(timezone=zone),
+        'valid_from': timezone.localtime(start, zone),
+        'valid_until': timezone.localtime(end, zone),
+        'materials': list(materials.values()),
+        'total_bytes': sum(material['bytes'] or 0 for material in materials.values()),
+        'timeline': timeline,
+    }
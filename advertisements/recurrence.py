@@ -0,0 +1,310 @@
+"""
+Reguła powtarzania harmonogramu w postaci kolumn, po których można filtrować w SQL.
+
+Z pól start_date, start_time, end_time, repeat_type i repeat_days wyliczane są:
+
+- weekday_mask - maska bitowa dni tygodnia (bit 0 = poniedziałek), w które
+  harmonogram może obowiązywać; 0 oznacza, że nie obowiązuje nigdy (custom),
+- month_day - dzień miesiąca harmonogramu miesięcznego,
+- last_day_of_month - harmonogram miesięczny w ostatni dzień miesiąca,
+- start_minute, end_minute - minuta doby początku i końca okna.
+
+scheduled_on(day) buduje warunek Q równoważny is_scheduled_for_date (dla typu
+'custom' jest to zawężenie wstępne - resztę sprawdza skompilowana reguła).
+
+Typ 'custom' to reguła w stylu RFC 5545 (RRULE), np. "FREQ=MONTHLY;BYDAY=2SA"
+(druga sobota miesiąca) lub "FREQ=YEARLY;BYMONTH=12;BYDAY=MO,TU,WE,TH,FR"
+z wyjątkami w osobnej linii "EXDATE:20261224,20261225". Reguła jest parsowana
+raz (compile_rule, cache LRU) do obiektu RecurrenceRule, który sprawdza dzień
+w czasie stałym - bez rozwijania wystąpień.
+"""
+import calendar
+from datetime import date, timedelta
+from functools import lru_cache
+
+from django.db.models import F, Q
+
+ALL_WEEKDAYS = 0b1111111
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+WEEKDAY_CODES = {'MO': 0, 'TU': 1, 'WE': 2, 'TH': 3, 'FR': 4, 'SA': 5, 'SU': 6}
+RULE_PARTS = {'FREQ', 'INTERVAL', 'UNTIL', 'COUNT', 'BYDAY', 'BYMONTHDAY', 'BYMONTH', 'WKST'}
+# Jak daleko szukamy ostatniego wystąpienia reguły z COUNT i ile dni najwyżej przegląda iterator
+MAX_RULE_DAYS = 20 * 366
+
+
+def is_last_day_of_month(value):
+    return value.day == calendar.monthrange(value.year, value.month)[1]
+
+
+def minute_of_day(value):
+    return value.hour * 60 + value.minute
+
+
+def masks_with_weekday(weekday):
+    """Wszystkie maski zawierające dany dzień tygodnia (warunek IN korzysta z indeksu)."""
+    bit = 1 << weekday
+    return tuple(mask for mask in range(1, ALL_WEEKDAYS + 1) if mask & bit)
+
+
+class RecurrenceRuleError(ValueError):
+    """Niepoprawna lub nieobsługiwana reguła powtarzania."""
+
+
+def _parse_date(value):
+    value = value.strip()
+    try:
+        return date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+    except (ValueError, IndexError):
+        raise RecurrenceRuleError(f"Niepoprawna data: {value}")
+
+
+def _parse_int(name, value, low, high):
+    try:
+        number = int(value)
+    except ValueError:
+        raise RecurrenceRuleError(f"{name}: oczekiwano liczby, otrzymano {value}")
+    if not low <= abs(number) <= high:
+        raise RecurrenceRuleError(f"{name}: wartość {value} poza zakresem")
+    return number
+
+
+class RecurrenceRule:
+    """
+    Skompilowana reguła powtarzania: zbiory dopuszczalnych miesięcy, dni
+    miesiąca i dni tygodnia (także n-tych w miesiącu/roku), krok okresu
+    i data końcowa. matches() sprawdza dzień w czasie stałym.
+    """
+
+    def __init__(self, start, freq, interval=1, until=None, months=(), month_days=(),
+                 weekdays=(), ordinal_weekdays=(), exdates=(), week_start=0):
+        self.start = start
+        self.freq = freq
+        self.interval = interval
+        self.until = until
+        self.months = frozenset(months)
+        self.month_days = frozenset(day for day in month_days if day > 0)
+        self.month_days_from_end = frozenset(day for day in month_days if day < 0)
+        self.weekdays = frozenset(weekdays)
+        self.ordinal_weekdays = frozenset(ordinal_weekdays)
+        self.exdates = frozenset(exdates)
+        self.week_start = week_start
+
+    @property
+    def weekday_mask(self):
+        """Dni tygodnia, w które reguła może obowiązywać (do zawężenia w SQL)."""
+        weekdays = self.weekdays | {weekday for _, weekday in self.ordinal_weekdays}
+        if not weekdays:
+            return ALL_WEEKDAYS
+        return sum(1 << weekday for weekday in weekdays)
+
+    def _period(self, day):
+        """Numer okresu (dnia, tygodnia, miesiąca, roku) liczony od startu reguły."""
+        if self.freq == 'DAILY':
+            return (day - self.start).days
+        if self.freq == 'WEEKLY':
+            week = day - timedelta(days=(day.weekday() - self.week_start) % 7)
+            start_week = self.start - timedelta(days=(self.start.weekday() - self.week_start) % 7)
+            return (week - start_week).days // 7
+        if self.freq == 'MONTHLY':
+            return (day.year - self.start.year) * 12 + day.month - self.start.month
+        return day.year - self.start.year
+
+    def _ordinals(self, day):
+        """Który to (od początku i od końca) taki dzień tygodnia w miesiącu lub roku."""
+        if self.freq == 'MONTHLY' or self.months:
+            position, length = day.day - 1, calendar.monthrange(day.year, day.month)[1]
+        else:
+            position = day.timetuple().tm_yday - 1
+            length = 366 if calendar.isleap(day.year) else 365
+        return position // 7 + 1, -((length - 1 - position) // 7 + 1)
+
+    def matches(self, day):
+        """Czy reguła przypada na dzień day."""
+        if day < self.start or (self.until is not None and day > self.until) or day in self.exdates:
+            return False
+        if self.interval > 1 and self._period(day) % self.interval:
+            return False
+        if self.months and day.month not in self.months:
+            return False
+        if self.month_days or self.month_days_from_end:
+            days_in_month = calendar.monthrange(day.year, day.month)[1]
+            if day.day not in self.month_days and day.day - days_in_month - 1 not in self.month_days_from_end:
+                return False
+        if self.weekdays or self.ordinal_weekdays:
+            weekday = day.weekday()
+            if weekday not in self.weekdays:
+                if not self.ordinal_weekdays:
+                    return False
+                first, last = self._ordinals(day)
+                if (first, weekday) not in self.ordinal_weekdays and (last, weekday) not in self.ordinal_weekdays:
+                    return False
+        return True
+
+    def occurrences(self, start, end, limit=None):
+        """Dni wystąpień w przedziale [start, end] (najwyżej MAX_RULE_DAYS dni, opcjonalnie limit wystąpień)."""
+        day = max(start, self.start)
+        if self.until is not None:
+            end = min(end, self.until)
+        end = min(end, day + timedelta(days=MAX_RULE_DAYS))
+        found = 0
+        while day <= end and (limit is None or found < limit):
+            if self.matches(day):
+                found += 1
+                yield day
+            day += timedelta(days=1)
+
+
+def compile_rule(text, start):
+    """
+    Parsuje regułę (RRULE oraz opcjonalnie EXDATE) dla harmonogramu
+    zaczynającego się w dniu start. Wynik - także błąd - jest cache'owany.
+    """
+    rule = _compile_cached(text, start)
+    if isinstance(rule, RecurrenceRuleError):
+        raise RecurrenceRuleError(str(rule))
+    return rule
+
+
+@lru_cache(maxsize=1024)
+def _compile_cached(text, start):
+    try:
+        return _compile(text, start)
+    except RecurrenceRuleError as e:
+        return e
+
+
+def _compile(text, start):
+    parts, exdates = {}, []
+    for line in (text or '').splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        name = line.split(':', 1)[0].split(';', 1)[0].upper() if ':' in line else 'RRULE'
+        value = line.rsplit(':', 1)[1] if ':' in line else line
+        if name == 'EXDATE':
+            exdates.extend(_parse_date(value) for value in value.split(',') if value.strip())
+        elif name == 'RRULE':
+            for part in value.split(';'):
+                if not part.strip():
+                    continue
+                key, separator, part_value = part.partition('=')
+                key = key.strip().upper()
+                if not separator or key not in RULE_PARTS:
+                    raise RecurrenceRuleError(f"Nieobsługiwany element reguły: {part.strip()}")
+                parts[key] = part_value.strip().upper()
+        else:
+            raise RecurrenceRuleError(f"Nieobsługiwana właściwość: {name}")
+
+    freq = parts.get('FREQ')
+    if freq not in FREQUENCIES:
+        raise RecurrenceRuleError("Reguła musi zawierać FREQ=DAILY, WEEKLY, MONTHLY lub YEARLY")
+    if 'COUNT' in parts and 'UNTIL' in parts:
+        raise RecurrenceRuleError("Reguła nie może zawierać jednocześnie COUNT i UNTIL")
+
+    interval = _parse_int('INTERVAL', parts.get('INTERVAL', '1'), 1, 1000)
+    if interval < 1:
+        raise RecurrenceRuleError("INTERVAL musi być dodatni")
+    months = [_parse_int('BYMONTH', value, 1, 12) for value in parts['BYMONTH'].split(',')] if 'BYMONTH' in parts else []
+    if any(month < 0 for month in months):
+        raise RecurrenceRuleError("BYMONTH musi być dodatni")
+    month_days = [_parse_int('BYMONTHDAY', value, 1, 31)
+                  for value in parts['BYMONTHDAY'].split(',')] if 'BYMONTHDAY' in parts else []
+    week_start = WEEKDAY_CODES.get(parts.get('WKST', 'MO'))
+    if week_start is None:
+        raise RecurrenceRuleError(f"Niepoprawny WKST: {parts['WKST']}")
+
+    weekdays, ordinal_weekdays = [], []
+    for value in parts['BYDAY'].split(',') if 'BYDAY' in parts else []:
+        value = value.strip()
+        weekday = WEEKDAY_CODES.get(value[-2:])
+        if weekday is None:
+            raise RecurrenceRuleError(f"Niepoprawny dzień tygodnia: {value}")
+        if len(value) == 2:
+            weekdays.append(weekday)
+            continue
+        if freq not in ('MONTHLY', 'YEARLY'):
+            raise RecurrenceRuleError("Numerowany dzień tygodnia (np. 2SA) wymaga FREQ=MONTHLY lub YEARLY")
+        ordinal_weekdays.append((_parse_int('BYDAY', value[:-2], 1, 53), weekday))
+
+    # Domyślne rozwinięcia z RFC 5545 - wartości brane z daty rozpoczęcia
+    if freq == 'WEEKLY' and not weekdays:
+        weekdays = [start.weekday()]
+    elif freq == 'MONTHLY' and not (month_days or weekdays or ordinal_weekdays):
+        month_days = [start.day]
+    elif freq == 'YEARLY' and not (months or month_days or weekdays or ordinal_weekdays):
+        months, month_days = [start.month], [start.day]
+    elif freq == 'YEARLY' and months and not (month_days or weekdays or ordinal_weekdays):
+        month_days = [start.day]
+
+    rule = RecurrenceRule(start, freq, interval, _parse_date(parts['UNTIL'][:8]) if 'UNTIL' in parts else None,
+                          months, month_days, weekdays, ordinal_weekdays, exdates, week_start)
+    if 'COUNT' in parts:
+        # COUNT zamieniamy raz na datę ostatniego wystąpienia - matches() pozostaje O(1)
+        count = _parse_int('COUNT', parts['COUNT'], 1, 10000)
+        last = None
+        for last in rule.occurrences(start, start + timedelta(days=MAX_RULE_DAYS), limit=count):
+            pass
+        rule.until = last if last is not None else start - timedelta(days=1)
+    return rule
+
+
+def recurrence_columns(start_date, start_time, end_time, repeat_type, repeat_days, recurrence_rule=None):
+    """Wartości kolumn reguły powtarzania dla pól harmonogramu."""
+    weekday_mask, month_day, last_day = 0, None, False
+    if repeat_type == 'none':
+        weekday_mask = 1 << start_date.weekday()
+    elif repeat_type == 'daily':
+        weekday_mask = ALL_WEEKDAYS
+    elif repeat_type == 'weekly':
+        for weekday in repeat_days or ():
+            if isinstance(weekday, int) and 0 <= weekday <= 6:
+                weekday_mask |= 1 << weekday
+    elif repeat_type == 'monthly':
+        weekday_mask = ALL_WEEKDAYS
+        if start_date.day >= 28 and is_last_day_of_month(start_date):
+            last_day = True
+        else:
+            month_day = start_date.day
+    elif repeat_type == 'custom' and recurrence_rule:
+        try:
+            weekday_mask = compile_rule(recurrence_rule, start_date).weekday_mask
+        except RecurrenceRuleError:
+            weekday_mask = 0
+    return {
+        'weekday_mask': weekday_mask,
+        'month_day': month_day,
+        'last_day_of_month': last_day,
+        'start_minute': minute_of_day(start_time),
+        'end_minute': minute_of_day(end_time),
+    }
+
+
+def scheduled_on(day):
+    """Warunek Q: harmonogram jest zaplanowany na dzień day (jak is_scheduled_for_date)."""
+    monthly = Q(month_day=day.day)
+    if is_last_day_of_month(day):
+        monthly |= Q(last_day_of_month=True)
+    return (
+        Q(start_date__lte=day)
+        & (Q(end_date__isnull=True) | Q(end_date__gte=day))
+        & Q(weekday_mask__in=masks_with_weekday(day.weekday()))
+        & (~Q(repeat_type='none') | Q(start_date=day))
+        & (Q(month_day__isnull=True, last_day_of_month=False) | monthly)
+    )
+
+
+def within_time_window(current_time):
+    """
+    Warunek Q: godzina mieści się w oknie emisji (jak is_within_time_window).
+    Minuty doby zawężają wyszukiwanie po indeksie, a dokładne porównanie godzin
+    rozstrzyga graniczną minutę (okna mogą mieć sekundy).
+    """
+    minute = minute_of_day(current_time)
+    same_day = Q(start_time__lte=F('end_time'))
+    return (
+        same_day & Q(start_minute__lte=minute, end_minute__gte=minute)
+        & Q(start_time__lte=current_time, end_time__gte=current_time)
+        | ~same_day & (Q(start_minute__lte=minute, start_time__lte=current_time)
+                       | Q(end_minute__gte=minute, end_time__gte=current_time))
+    )
@@ -0,0 +1,101 @@
+"""
+Drabinka rozdzielczości (renditions) materiałów.
+
+Każde wideo jest przy wysyłce transkodowane z wyprzedzeniem (eager) do
+kilku rozdzielczości (LADDER) i kodeków (VIDEO_CODECS), a API odtwarzacza
+podaje stoisku wersję dopasowaną do rozdzielczości ekranu zgłaszanej
+w heartbeacie (PlayerStatus.screen_resolution): najmniejszą, która
+pokrywa ekran. Adresy wersji używają dokładnie tych samych transformacji
+co eager, więc Cloudinary serwuje gotowe pliki zamiast transkodować je
+przy pierwszym odtworzeniu.
+
+Obrazy nie mają wersji eager - skalowanie obrazu po stronie CDN jest tanie,
+a f_auto i tak zależy od przeglądarki.
+"""
+import re
+from collections import namedtuple
+
+from cloudinary.utils import cloudinary_url
+
+Rendition = namedtuple('Rendition', ['name', 'width', 'height'])
+VideoCodec = namedtuple('VideoCodec', ['name', 'format', 'mime_type'])
+
+LADDER = (
+    Rendition('720p', 1280, 720),
+    Rendition('1080p', 1920, 1080),
+    Rendition('2160p', 3840, 2160),
+)
+# Wersja dla stoisk, które nie zgłosiły jeszcze rozdzielczości ekranu
+DEFAULT_RENDITION = LADDER[1]
+
+# Pierwszy kodek jest odtwarzany wszędzie; pozostałe odtwarzacz wybiera, jeśli je obsługuje
+VIDEO_CODECS = (
+    VideoCodec('h264', 'mp4', 'video/mp4; codecs="avc1.640028"'),
+    VideoCodec('h265', 'mp4', 'video/mp4; codecs="hvc1"'),
+    VideoCodec('vp9', 'webm', 'video/webm; codecs="vp9"'),
+)
+
+RESOLUTION = re.compile(r'^\s*(\d+)\s*[xX×]\s*(\d+)\s*$')
+
+
+def parse_resolution(value):
+    """Rozdzielczość 'SZEROKOŚĆxWYSOKOŚĆ' jako (szerokość, wysokość) lub None."""
+    match = RESOLUTION.match(value or '')
+    if match is None:
+        return None
+    width, height = int(match.group(1)), int(match.group(2))
+    return (width, height) if width and height else None
+
+
+def select(resolution):
+    """Najmniejsza wersja pokrywająca ekran (ekran pionowy jak poziomy); największa dla większych ekranów."""
+    size = parse_resolution(resolution)
+    if size is None:
+        return DEFAULT_RENDITION
+    long_side, short_side = max(size), min(size)
+    for rendition in LADDER:
+        if rendition.width >= long_side and rendition.height >= short_side:
+            return rendition
+    return LADDER[-1]
+
+
+def for_stand(stand):
+    """Wersja dla stoiska według rozdzielczości z jego statusu odtwarzacza."""
+    player_status = getattr(stand, 'player_status', None)
+    return select(player_status.screen_resolution if player_status else None)
+
+
+def _video_transformation(rendition, codec):
+    return {'width': rendition.width, 'height': rendition.height, 'crop': 'limit',
+            'quality': 'auto', 'video_codec': codec.name}
+
+
+def eager_transformations(material_type):
+    """Transformacje eager dla wysyłanego pliku: każda wersja wideo w każdym kodeku."""
+    if material_type != 'video':
+        return []
+    return [dict(_video_transformation(rendition, codec), format=codec.format)
+            for rendition in LADDER for codec in VIDEO_CODECS]
+
+
+def eager_for(material):
+    """Opcja eager CloudinaryField (wywoływana z instancją materiału przy zapisie)."""
+    return eager_transformations(material.material_type)
+
+
+def video_sources(public_id, rendition):
+    """Adresy wersji wideo we wszystkich kodekach: [{'codec', 'type', 'url'}]."""
+    sources = []
+    for codec in VIDEO_CODECS:
+        url, _ = cloudinary_url(public_id, resource_type='video', format=codec.format, secure=True,
+                                transformation=[_video_transformation(rendition, codec)])
+        sources.append({'codec': codec.name, 'type': codec.mime_type, 'url': url})
+    return sources
+
+
+def image_url(public_id, rendition):
+    url, _ = cloudinary_url(public_id, resource_type='image', secure=True, transformation=[
+        {'width': rendition.width, 'height': rendition.height, 'crop': 'limit',
+         'fetch_format': 'auto', 'quality': 'auto'},
+    ])
+    return url
@@ -0,0 +1,136 @@
+"""
+Wspólne rozwiązywanie playlist stoisk na podstawie harmonogramów emisji.
+
+Z tego modułu korzystają API odtwarzacza, widok odtwarzacza oraz komenda
+update_schedules, dzięki czemu o tym, co jest emitowane, decyduje jedna
+implementacja. Dane dla dowolnej liczby stoisk są pobierane stałą liczbą
+zapytań (stoiska, materiały, harmonogramy + prefetch materiałów).
+
+Harmonogramy są rozwiązywane w czasie lokalnym sklepu stoiska
+(Store.timezone) - zamianę chwil wykonuje store_time na podstawie
+zapamiętanych granic doby i zmian czasu.
+"""
+from collections import namedtuple
+
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import Stand, AdvertisementMaterial, EmissionSchedule
+from .schedule_index import ScheduleIndex
+from .store_time import next_local_transition, to_local
+
+PlaylistEntry = namedtuple('PlaylistEntry', ['material', 'priority'])
+
+
+class PlaylistResolver:
+    """
+    Rozwiązuje playlisty dla zbioru stoisk.
+
+    Reguła: jeśli na stoisku jest aktywny co najmniej jeden harmonogram,
+    emitowane są tylko (aktywne) materiały z aktywnych harmonogramów,
+    każdy z najwyższym priorytetem spośród swoich harmonogramów. W
+    przeciwnym razie emitowane są wszystkie aktywne materiały stoiska.
+    """
+
+    def __init__(self, stands):
+        if hasattr(stands, 'select_related'):
+            stands = stands.select_related('department__store', 'player_status')
+        self.stands = list(stands)
+        stand_ids = [stand.id for stand in self.stands]
+
+        self._materials = {stand_id: [] for stand_id in stand_ids}
+        for material in AdvertisementMaterial.objects.filter(stand_id__in=stand_ids).order_by('order', 'id'):
+            self._materials[material.stand_id].append(material)
+
+        schedules = EmissionSchedule.objects.filter(
+            is_active=True,
+            materials__stand_id__in=stand_ids,
+        ).distinct().prefetch_related(
+            Prefetch('materials', queryset=AdvertisementMaterial.objects.order_by('order', 'id'))
+        )
+        self._schedules = {stand_id: [] for stand_id in stand_ids}
+        for schedule in schedules:
+            for stand_id in {material.stand_id for material in schedule.materials.all()}:
+                if stand_id in self._schedules:
+                    self._schedules[stand_id].append(schedule)
+
+        self._indexes = {}
+
+    @classmethod
+    def for_stand(cls, stand_id):
+        """Resolver dla pojedynczego stoiska; rzuca Stand.DoesNotExist."""
+        resolver = cls(Stand.objects.filter(pk=stand_id))
+        if not resolver.stands:
+            raise Stand.DoesNotExist
+        return resolver
+
+    @property
+    def stand(self):
+        return self.stands[0]
+
+    def materials(self, stand):
+        """Wszystkie materiały stoiska w kolejności wyświetlania."""
+        return self._materials[stand.id]
+
+    def schedules(self, stand):
+        """Aktywne (is_active) harmonogramy zawierające materiały stoiska."""
+        return self._schedules[stand.id]
+
+    def index(self, stand):
+        index = self._indexes.get(stand.id)
+        if index is None:
+            index = self._indexes[stand.id] = ScheduleIndex(self._schedules[stand.id])
+        return index
+
+    def zone(self, stand):
+        """Strefa czasowa sklepu stoiska."""
+        return stand.department.store.timezone
+
+    def active_schedules(self, stand, moment=None):
+        local = to_local(self.zone(stand), moment or timezone.now())
+        return self.index(stand).active_at(local)
+
+    def next_transition(self, stand, moment=None):
+        """
+        Najbliższa chwila (UTC), w której playlista stoiska może się zmienić:
+        granica okna harmonogramu albo wygaśnięcie (expires_at) materiału.
+        """
+        moment = moment or timezone.now()
+        due = next_local_transition(self.zone(stand), self.index(stand), moment)
+        expiring = [material.expires_at for material in self._materials[stand.id]
+                    if material.expires_at is not None and material.expires_at > moment]
+        return min([due] + expiring)
+
+    def material_priorities(self, stand, moment=None):
+        """
+        Materiały stoiska objęte aktywnymi w danej chwili harmonogramami,
+        z najwyższym priorytetem spośród tych harmonogramów (bez względu na status).
+        """
+        priorities = {}
+        for schedule in self.active_schedules(stand, moment):
+            for material in schedule.materials.all():
+                if material.stand_id != stand.id:
+                    continue
+                if schedule.priority > priorities.get(material.id, (None, float('-inf')))[1]:
+                    priorities[material.id] = (material, schedule.priority)
+        return priorities
+
+    def playlist(self, stand, moment=None):
+        """
+        Uporządkowana playlista stoiska: lista PlaylistEntry. Dla materiałów
+        z harmonogramów priority to priorytet harmonogramu, w przeciwnym razie None.
+        """
+        moment = moment or timezone.now()
+
+        def playable(material):
+            # Wygasły materiał znika z playlisty od razu, a nie dopiero po cleanup_materials
+            return material.status == 'active' and (material.expires_at is None or material.expires_at > moment)
+
+        priorities = self.material_priorities(stand, moment)
+        if not priorities:
+            return [PlaylistEntry(material, None) for material in self._materials[stand.id] if playable(material)]
+
+        entries = [PlaylistEntry(material, priority) for material, priority in priorities.values()
+                   if playable(material)]
+        entries.sort(key=lambda entry: (-entry.priority, entry.material.order, entry.material.id))
+        return entries
@@ -0,0 +1,107 @@
+"""
+Indeks aktywnych harmonogramów emisji.
+
+Dla każdego dnia indeks buduje posortowaną listę punktów przejścia (moment
+w ciągu doby, w którym zmienia się zbiór aktywnych harmonogramów) razem ze
+zbiorem harmonogramów obowiązujących do następnego punktu. Zapytanie
+"które harmonogramy są aktywne w chwili T" to wyszukiwanie binarne po tej
+liście. Semantyka jest taka sama jak w EmissionSchedule.apply_schedule:
+dzień sprawdza is_scheduled_for_date, a harmonogram nocny (np. 22:00-6:00)
+obowiązuje w danym dniu zarówno od 0:00 do końca, jak i od początku do północy.
+"""
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+
+DAY_MICROSECONDS = 24 * 60 * 60 * 1000000
+
+
+def _microseconds(value):
+    """Czas w ciągu doby (time) jako liczba mikrosekund od północy."""
+    return ((value.hour * 60 + value.minute) * 60 + value.second) * 1000000 + value.microsecond
+
+
+def schedule_segments(schedule):
+    """
+    Przedziały [od, do) w mikrosekundach doby, w których harmonogram jest aktywny
+    w dniu, na który jest zaplanowany. Koniec okna jest włączny, stąd +1.
+    """
+    start = _microseconds(schedule.start_time)
+    end = _microseconds(schedule.end_time) + 1
+    if schedule.start_time <= schedule.end_time:
+        return [(start, end)]
+    # Zakres przez północ (np. 22:00-6:00)
+    return [(0, end), (start, DAY_MICROSECONDS)]
+
+
+class DayIndex:
+    """Punkty przejścia i zbiory aktywnych harmonogramów dla jednego dnia."""
+
+    def __init__(self, schedules):
+        changes = {0: []}
+        for schedule in schedules:
+            for start, end in schedule_segments(schedule):
+                changes.setdefault(start, []).append((1, schedule))
+                if end < DAY_MICROSECONDS:
+                    changes.setdefault(end, []).append((-1, schedule))
+
+        self.points = sorted(changes)
+        self.active = []
+        # Klucz id(), bo harmonogram może być jeszcze niezapisany (bez pk)
+        counts = {}
+        for point in self.points:
+            for delta, schedule in changes[point]:
+                entry = counts.setdefault(id(schedule), [schedule, 0])
+                entry[1] += delta
+            current = [schedule for schedule, count in counts.values() if count > 0]
+            current.sort(key=lambda s: (-s.priority, s.start_date, s.start_time, s.pk or 0))
+            self.active.append(tuple(current))
+
+    def active_at(self, microseconds):
+        return self.active[bisect_right(self.points, microseconds) - 1]
+
+    def next_point(self, microseconds):
+        """Następny punkt przejścia po podanym momencie lub None (północ)."""
+        position = bisect_right(self.points, microseconds)
+        if position < len(self.points):
+            return self.points[position]
+        return None
+
+
+class ScheduleIndex:
+    """
+    Indeks harmonogramów jednego stoiska (lub dowolnego zbioru harmonogramów).
+
+    Indeksy dni są budowane leniwie i trzymane dla kilku ostatnio
+    używanych dat, więc kolejne zapytania z tego samego dnia kosztują
+    jedno wyszukiwanie binarne.
+    """
+
+    DAY_CACHE_SIZE = 8
+
+    def __init__(self, schedules):
+        self.schedules = [schedule for schedule in schedules if schedule.is_active]
+        self._days = {}
+
+    def day(self, check_date):
+        index = self._days.get(check_date)
+        if index is None:
+            if len(self._days) >= self.DAY_CACHE_SIZE:
+                self._days.pop(next(iter(self._days)))
+            index = DayIndex([s for s in self.schedules if s.is_scheduled_for_date(check_date)])
+            self._days[check_date] = index
+        return index
+
+    def active_at(self, moment):
+        """Harmonogramy aktywne w chwili moment, od najwyższego priorytetu."""
+        return self.day(moment.date()).active_at(_microseconds(moment.time()))
+
+    def next_transition(self, moment):
+        """
+        Najbliższa chwila po moment, w której zbiór aktywnych harmonogramów
+        może się zmienić (najpóźniej północ kolejnego dnia).
+        """
+        point = self.day(moment.date()).next_point(_microseconds(moment.time()))
+        day_start = datetime.combine(moment.date(), time.min, tzinfo=moment.tzinfo)
+        if point is None:
+            return day_start + timedelta(days=1)
+        return day_start + timedelta(microseconds=point)
@@ -0,0 +1,152 @@
+"""
+Wektorowa ocena harmonogramów emisji na siatce czasu (raporty, prognozy).
+
+Harmonogramy są kodowane jako tablice NumPy (zakres dat, typ powtarzania,
+maska dni tygodnia, dzień miesiąca, okno godzinowe, flaga okna nocnego,
+priorytet), a siatka jako tablice dni i czasu w ciągu doby. Aktywność
+wszystkich harmonogramów we wszystkich komórkach siatki liczona jest jednym
+przebiegiem operacji tablicowych. Wynik jest identyczny z metodami
+EmissionSchedule.is_scheduled_for_date i is_within_time_window (oraz
+warunkiem is_active z apply_schedule); reguły 'custom' są dopasowywane
+dzień po dniu skompilowaną regułą RRULE.
+
+Siatka jest liczona w lokalnym czasie ściennym (bez przeskoków przy zmianie
+czasu), tak jak harmonogramy są definiowane.
+"""
+import calendar
+from datetime import timedelta
+
+import numpy as np
+
+from .models import EmissionSchedule
+from .schedule_index import _microseconds
+
+REPEAT_CODES = {'none': 0, 'daily': 1, 'weekly': 2, 'monthly': 3}
+# Brak daty zakończenia - większe od każdej daty porządkowej
+NO_END = np.iinfo(np.int64).max
+
+
+def _is_last_day(value):
+    return value.day == calendar.monthrange(value.year, value.month)[1]
+
+
+class ScheduleMatrix:
+    """Harmonogramy zakodowane jako tablice (jeden wiersz na harmonogram)."""
+
+    def __init__(self, schedules):
+        self.schedules = list(schedules)
+        self.ids = np.array([schedule.pk or 0 for schedule in self.schedules], dtype=np.int64)
+        self.priority = np.array([schedule.priority for schedule in self.schedules], dtype=np.int64)
+        self.is_active = np.array([bool(schedule.is_active) for schedule in self.schedules], dtype=bool)
+        self.start_date = np.array([schedule.start_date.toordinal() for schedule in self.schedules], dtype=np.int64)
+        self.end_date = np.array([schedule.end_date.toordinal() if schedule.end_date else NO_END
+                                  for schedule in self.schedules], dtype=np.int64)
+        # Typy spoza REPEAT_CODES (custom, nieznane) nie pasują do żadnego kodu;
+        # reguły custom są dopasowywane osobno skompilowaną regułą RRULE
+        self.repeat = np.array([REPEAT_CODES.get(schedule.repeat_type, -1) for schedule in self.schedules],
+                               dtype=np.int8)
+        # Dokładnie warunek "repeat_days and weekday in repeat_days" z is_scheduled_for_date
+        self.weekdays = np.array([[bool(schedule.repeat_days) and weekday in schedule.repeat_days
+                                   if schedule.repeat_type == 'weekly' else False
+                                   for weekday in range(7)] for schedule in self.schedules],
+                                 dtype=bool).reshape(len(self.schedules), 7)
+        self.month_day = np.array([schedule.start_date.day for schedule in self.schedules], dtype=np.int8)
+        self.last_day = np.array([schedule.start_date.day >= 28 and _is_last_day(schedule.start_date)
+                                  for schedule in self.schedules], dtype=bool)
+        self.start_time = np.array([_microseconds(schedule.start_time) for schedule in self.schedules],
+                                   dtype=np.int64)
+        self.end_time = np.array([_microseconds(schedule.end_time) for schedule in self.schedules], dtype=np.int64)
+        self.overnight = self.start_time > self.end_time
+        self.rules = [(row, rule) for row, rule in enumerate(schedule.compiled_rule() for schedule in self.schedules)
+                      if rule is not None]
+
+    def __len__(self):
+        return len(self.schedules)
+
+    def days(self, dates):
+        """Macierz [harmonogram x dzień]: czy harmonogram jest zaplanowany na dany dzień."""
+        ordinals = np.array([value.toordinal() for value in dates], dtype=np.int64)
+        weekdays = np.array([value.weekday() for value in dates], dtype=np.int8)
+        month_days = np.array([value.day for value in dates], dtype=np.int8)
+        last_days = np.array([_is_last_day(value) for value in dates], dtype=bool)
+
+        in_range = (ordinals >= self.start_date[:, None]) & (ordinals <= self.end_date[:, None])
+        repeat = self.repeat[:, None]
+        matches = (
+            ((repeat == 0) & (ordinals == self.start_date[:, None]))
+            | (repeat == 1)
+            | ((repeat == 2) & self.weekdays[:, weekdays])
+            | ((repeat == 3) & np.where(
+                self.last_day[:, None], last_days, month_days == self.month_day[:, None]))
+        )
+        for row, rule in self.rules:
+            matches[row] = np.fromiter((rule.matches(value) for value in dates), dtype=bool, count=len(dates))
+        return in_range & matches & self.is_active[:, None]
+
+    def times(self, microseconds):
+        """Macierz [harmonogram x chwila doby]: czy chwila mieści się w oknie godzinowym."""
+        microseconds = np.asarray(microseconds, dtype=np.int64)
+        after_start = microseconds >= self.start_time[:, None]
+        before_end = microseconds <= self.end_time[:, None]
+        return np.where(self.overnight[:, None], after_start | before_end, after_start & before_end)
+
+    def evaluate(self, start, end, step):
+        """
+        Aktywność harmonogramów na siatce [start, end) co step (naive datetime
+        w czasie lokalnym). Zwraca (chwile siatki, macierz bool [harmonogram x chwila]).
+        """
+        count = max(0, -(-(end - start) // step))
+        moments = [start + step * position for position in range(count)]
+        dates = sorted({moment.date() for moment in moments})
+        day_position = {value: position for position, value in enumerate(dates)}
+
+        day_columns = np.array([day_position[moment.date()] for moment in moments], dtype=np.int64)
+        microseconds = np.array([_microseconds(moment.time()) for moment in moments], dtype=np.int64)
+        active = self.days(dates)[:, day_columns] & self.times(microseconds)
+        return moments, active
+
+
+def stand_schedules(stand_ids):
+    """Aktywne harmonogramy stoisk i przypisanie {stand_id: [indeksy wierszy]} (dwa zapytania)."""
+    links = EmissionSchedule.materials.through.objects.filter(
+        advertisementmaterial__stand_id__in=stand_ids,
+        emissionschedule__is_active=True,
+    ).values_list('emissionschedule_id', 'advertisementmaterial__stand_id').distinct()
+
+    schedule_stands = {}
+    for schedule_id, stand_id in links:
+        schedule_stands.setdefault(schedule_id, set()).add(stand_id)
+
+    schedules = list(EmissionSchedule.objects.filter(id__in=schedule_stands).order_by('id'))
+    rows = {stand_id: [] for stand_id in stand_ids}
+    for row, schedule in enumerate(schedules):
+        for stand_id in schedule_stands[schedule.id]:
+            rows[stand_id].append(row)
+    return schedules, rows
+
+
+def stand_activity(stand_ids, start, end, step=timedelta(minutes=15)):
+    """
+    Aktywność harmonogramów stoisk na siatce czasu.
+
+    Zwraca (chwile siatki, {stand_id: (aktywność, priorytet)}), gdzie
+    aktywność to wektor bool "czy obowiązuje jakikolwiek harmonogram", a
+    priorytet to wektor float z najwyższym priorytetem aktywnego harmonogramu
+    (NaN, gdy żaden nie obowiązuje - stoisko emituje wtedy wszystkie materiały).
+    """
+    stand_ids = list(stand_ids)
+    schedules, rows = stand_schedules(stand_ids)
+    matrix = ScheduleMatrix(schedules)
+    moments, active = matrix.evaluate(start, end, step)
+
+    weighted = np.where(active, matrix.priority[:, None].astype(float), -np.inf)
+    result = {}
+    for stand_id in stand_ids:
+        stand_rows = rows[stand_id]
+        if not stand_rows:
+            result[stand_id] = (np.zeros(len(moments), dtype=bool), np.full(len(moments), np.nan))
+            continue
+        priority = weighted[stand_rows].max(axis=0)
+        result[stand_id] = (active[stand_rows].any(axis=0), np.where(np.isinf(priority), np.nan, priority))
+    return moments, result
+
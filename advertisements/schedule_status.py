@@ -0,0 +1,158 @@
+"""
+Zbiorcza aktualizacja statusów harmonogramów i materiałów.
+
+Wygasłe harmonogramy są wyłączane jednym UPDATE na partię, a statusy
+materiałów liczone zbiorowo: materiał z harmonogramu aktywnego w tej chwili
+jest aktywny, materiał należący tylko do harmonogramów nieaktywnych w tej
+chwili - nieaktywny, a materiały bez aktywnych harmonogramów nie są ruszane.
+Aktualizacje przez QuerySet.update() omijają sygnały, dlatego wersje playlist
+zmienionych stoisk są podbijane tutaj.
+
+Harmonogramy są oceniane w czasie lokalnym sklepów, do których należą ich
+materiały - osobno dla każdej strefy czasowej sklepów (Store.timezone).
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import AdvertisementMaterial, EmissionSchedule, Store
+from .playlist import invalidate_stands
+from .recurrence import RecurrenceRuleError, compile_rule, scheduled_on, within_time_window
+from .store_time import to_local
+
+BATCH_SIZE = 1000
+# Ścieżka od harmonogramu i od materiału do strefy czasowej sklepu
+SCHEDULE_ZONE = 'materials__stand__department__store__timezone'
+MATERIAL_ZONE = 'stand__department__store__timezone'
+
+
+def _batches(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _invalidate_materials_stands(material_ids):
+    invalidate_stands(set(
+        AdvertisementMaterial.objects.filter(id__in=material_ids).values_list('stand_id', flat=True)
+    ))
+
+
+def store_zones():
+    """Strefy czasowe, w których działają sklepy."""
+    return list(Store.objects.values_list('timezone', flat=True).distinct().order_by('timezone'))
+
+
+def expired_schedules(now):
+    """Aktywne harmonogramy, których data (i godzina) zakończenia już minęła (now - czas lokalny)."""
+    today, current_time = now.date(), now.time()
+    return EmissionSchedule.objects.filter(is_active=True, end_date__isnull=False).filter(
+        Q(end_date__lt=today) | Q(end_date=today, end_time__lt=current_time)
+    )
+
+
+def deactivate_expired(now=None, schedule_ids=None):
+    """
+    Wyłącza wygasłe harmonogramy (wszystkie lub tylko spośród schedule_ids).
+    Harmonogram wygasa według czasu sklepu jego materiałów (harmonogram bez
+    materiałów - według strefy z ustawień). Zwraca liczbę wyłączonych.
+    """
+    now = now or timezone.now()
+    queries = [(zone, Q(**{SCHEDULE_ZONE: zone})) for zone in store_zones()]
+    queries.append((settings.TIME_ZONE, Q(materials__isnull=True)))
+    ids = set()
+    for zone, in_zone in queries:
+        expired = expired_schedules(to_local(zone, now)).filter(in_zone).values_list('id', flat=True).order_by()
+        if schedule_ids is not None:
+            expired = expired.filter(id__in=schedule_ids)
+        ids.update(expired.iterator(chunk_size=BATCH_SIZE))
+
+    count = 0
+    for batch in _batches(sorted(ids)):
+        stand_ids = set(AdvertisementMaterial.objects.filter(
+            schedules__in=batch,
+        ).values_list('stand_id', flat=True).distinct())
+        count += EmissionSchedule.objects.filter(id__in=batch, is_active=True).update(is_active=False)
+        invalidate_stands(stand_ids)
+    return count
+
+
+def schedules_active_at(now, material_ids=None, zone=None):
+    """
+    Identyfikatory harmonogramów aktywnych w chwili now, opcjonalnie tylko
+    tych zawierających któryś z materiałów material_ids. Z podaną strefą
+    zone - w czasie lokalnym tej strefy i tylko harmonogramy sklepów z tej
+    strefy, bez niej - w strefie z ustawień.
+
+    Zakres dat, reguła powtarzania i okno godzinowe są sprawdzane w bazie
+    na kolumnach reguły powtarzania (indeks schedule_recurrence_idx);
+    reguły typu 'custom' dodatkowo skompilowanym dopasowaniem RRULE.
+    """
+    local = to_local(zone or settings.TIME_ZONE, now)
+    today, current_time = local.date(), local.time()
+    schedules = EmissionSchedule.objects.filter(
+        scheduled_on(today), within_time_window(current_time), is_active=True,
+    ).values_list('id', 'repeat_type', 'start_date', 'recurrence_rule').order_by()
+    if zone is not None:
+        schedules = schedules.filter(**{SCHEDULE_ZONE: zone}).distinct()
+    if material_ids is not None:
+        schedules = schedules.filter(materials__in=material_ids).distinct()
+
+    active = set()
+    for schedule_id, repeat_type, start_date, rule in schedules.iterator(chunk_size=BATCH_SIZE):
+        if repeat_type == 'custom':
+            try:
+                if not compile_rule(rule, start_date).matches(today):
+                    continue
+            except RecurrenceRuleError:
+                continue
+        active.add(schedule_id)
+    return active
+
+
+def sync_material_statuses(now=None, material_ids=None):
+    """
+    Ustawia statusy materiałów objętych aktywnymi (is_active) harmonogramami
+    (wszystkich lub tylko material_ids), w czasie lokalnym sklepu każdego
+    materiału. Zwraca (aktywowane, dezaktywowane).
+    """
+    now = now or timezone.now()
+
+    scheduled_now = set()
+    activated = 0
+    for zone in store_zones():
+        for batch in _batches(sorted(schedules_active_at(now, material_ids, zone))):
+            materials = AdvertisementMaterial.objects.filter(
+                schedules__in=batch, **{MATERIAL_ZONE: zone},
+            ).values_list('id', 'status').distinct()
+            if material_ids is not None:
+                materials = materials.filter(id__in=material_ids)
+            to_activate = []
+            for material_id, material_status in materials:
+                scheduled_now.add(material_id)
+                if material_status != 'active':
+                    to_activate.append(material_id)
+            for ids in _batches(to_activate):
+                activated += AdvertisementMaterial.objects.filter(id__in=ids).update(status='active')
+                _invalidate_materials_stands(ids)
+
+    # Aktywne materiały z aktywnych harmonogramów, których żaden nie obowiązuje teraz
+    candidates = AdvertisementMaterial.objects.filter(
+        status='active', schedules__is_active=True,
+    ).values_list('id', flat=True).distinct().order_by('id')
+    if material_ids is not None:
+        candidates = candidates.filter(id__in=material_ids)
+    # Lista jest zbierana przed aktualizacją, bo UPDATE zmienia wynik otwartego zapytania
+    to_deactivate = [material_id for material_id in candidates.iterator(chunk_size=BATCH_SIZE)
+                     if material_id not in scheduled_now]
+
+    deactivated = 0
+    for ids in _batches(to_deactivate):
+        deactivated += AdvertisementMaterial.objects.filter(id__in=ids).update(status='inactive')
+        _invalidate_materials_stands(ids)
+    return activated, deactivated
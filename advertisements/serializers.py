@@ -1,6 +1,9 @@
 from rest_framework import serializers
 from cloudinary.utils import cloudinary_url
-from .models import Store, Department, Stand, AdvertisementMaterial
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.base import File
+from .models import Store, Department, Stand, AdvertisementMaterial, UploadJob
+from . import renditions
 
 class StoreSerializer(serializers.ModelSerializer):
     class Meta:
@@ -16,12 +19,20 @@ class DepartmentSerializer(serializers.ModelSerializer):
 
 class AdvertisementMaterialSerializer(serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
+    sources = serializers.SerializerMethodField()
     
     class Meta:
         model = AdvertisementMaterial
-        fields = ['id', 'material_type', 'file_url', 'order', 'duration']
+        fields = ['id', 'material_type', 'file_url', 'sources', 'order', 'duration']
     
     def get_file_url(self, obj):
+        # Wersja dopasowana do ekranu stoiska (kontekst 'rendition', patrz renditions.py)
+        rendition = self.context.get('rendition')
+        public_id = getattr(obj.file, 'public_id', None) if obj.file else None
+        if rendition is not None and public_id:
+            if obj.material_type == 'video':
+                return renditions.video_sources(public_id, rendition)[0]['url']
+            return renditions.image_url(public_id, rendition)
         # Używaj zawsze właściwego resource_type; wideo dostarczaj jako mp4
         if not obj.file:
             return None
@@ -40,6 +51,14 @@ class AdvertisementMaterialSerializer(serializers.ModelSerializer):
             url, _ = cloudinary_url(obj.file.public_id, resource_type='image', secure=True)
             return url
         return obj.file_url or None
+
+    def get_sources(self, obj):
+        # Warianty kodeków wideo - odtwarzacz wybiera pierwszy, który potrafi odtworzyć
+        rendition = self.context.get('rendition')
+        public_id = getattr(obj.file, 'public_id', None) if obj.file else None
+        if rendition is None or not public_id or obj.material_type != 'video':
+            return []
+        return renditions.video_sources(public_id, rendition)
     
 class StandSerializer(serializers.ModelSerializer):
     department = DepartmentSerializer(read_only=True)
@@ -50,6 +69,34 @@ class StandSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'department', 'display_time', 'transition_animation', 'materials']
     
     def get_materials(self, obj):
+        # Gotowa (rozwiązana) playlista przekazana w kontekście
+        if 'materials' in self.context:
+            return self.context['materials']
         # Only return active materials, ordered by the order field
         materials = obj.materials.filter(status='active').order_by('order')
-        return AdvertisementMaterialSerializer(materials, many=True, context=self.context).data
\ No newline at end of file
+        return AdvertisementMaterialSerializer(materials, many=True, context=self.context).data
+
+
+class DirectUploadSerializer(serializers.ModelSerializer):
+    """Dane nowego materiału, którego plik przeglądarka wyśle bezpośrednio do Cloudinary"""
+    # Skrót treści policzony przez przeglądarkę - tylko do wyszukania pliku, który już jest w Cloudinary
+    sha256 = serializers.RegexField(r'^[0-9a-f]{64}$', required=False, allow_blank=True, write_only=True)
+
+    class Meta:
+        model = UploadJob
+        fields = ['stand', 'material_type', 'material_status', 'duration', 'expires_at', 'original_name', 'total_bytes',
+                  'sha256']
+
+    def validate_original_name(self, value):
+        # Te same dozwolone rozszerzenia co przy wysyłce przez formularz
+        for validator in AdvertisementMaterial._meta.get_field('file').validators:
+            try:
+                validator(File(None, name=value))
+            except DjangoValidationError as e:
+                raise serializers.ValidationError(e.messages)
+        return value
+
+    def validate_total_bytes(self, value):
+        if not value:
+            raise serializers.ValidationError("Plik jest pusty")
+        return value
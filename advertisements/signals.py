@@ -0,0 +1,153 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from .assets import release
+from .emission_slots import discard_future, discard_material, regenerate_on_commit
+from .models import Store, Department, Stand, AdvertisementMaterial, EmissionSchedule
+from .playlist import invalidate_stands
+from .transitions import notify_schedules_changed
+
+
+def _invalidate_on_commit(stand_ids):
+    stand_ids = set(stand_ids)
+    if stand_ids:
+        transaction.on_commit(lambda: invalidate_stands(stand_ids))
+
+
+def _notify_on_commit(schedule_ids):
+    schedule_ids = set(schedule_ids)
+    if schedule_ids:
+        transaction.on_commit(lambda: notify_schedules_changed(schedule_ids))
+
+
+def _remember_previous(sender, instance, update_fields, *fields):
+    """Zapamiętuje wartości pól sprzed zapisu (porównywane w post_save przez _changed)."""
+    instance._previous_values = {}
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return
+    attnames = [sender._meta.get_field(field).attname for field in fields]
+    instance._previous_values = sender.objects.filter(pk=instance.pk).values(*attnames).first() or {}
+
+
+def _changed(instance, field):
+    attname = instance._meta.get_field(field).attname
+    previous = getattr(instance, '_previous_values', {})
+    return attname in previous and previous[attname] != getattr(instance, attname)
+
+
+def _schedule_stand_ids(schedule):
+    return Stand.objects.filter(materials__schedules=schedule).values_list('id', flat=True).distinct()
+
+
+@receiver(post_save, sender=Stand)
+@receiver(post_delete, sender=Stand)
+def invalidate_stand_playlist(sender, instance, **kwargs):
+    _invalidate_on_commit([instance.pk])
+
+
+@receiver(pre_save, sender=Stand)
+def remember_stand_department(sender, instance, update_fields=None, **kwargs):
+    _remember_previous(sender, instance, update_fields, 'department')
+
+
+@receiver(post_save, sender=Stand)
+def regenerate_stand_slots(sender, instance, created, **kwargs):
+    # Stoisko mogło trafić do działu sklepu w innej strefie czasowej
+    if _changed(instance, 'department'):
+        regenerate_on_commit(EmissionSchedule.objects.filter(materials__stand=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Department)
+def invalidate_department_playlists(sender, instance, **kwargs):
+    # Nazwa działu jest częścią odpowiedzi API odtwarzacza
+    _invalidate_on_commit(instance.stands.values_list('id', flat=True))
+
+
+@receiver(pre_save, sender=Store)
+def remember_store_timezone(sender, instance, update_fields=None, **kwargs):
+    _remember_previous(sender, instance, update_fields, 'timezone')
+
+
+@receiver(post_save, sender=Store)
+def invalidate_store_playlists(sender, instance, created, **kwargs):
+    _invalidate_on_commit(Stand.objects.filter(department__store=instance).values_list('id', flat=True))
+    # Wystąpienia emisji są liczone w strefie czasowej sklepu
+    if _changed(instance, 'timezone'):
+        regenerate_on_commit(EmissionSchedule.objects.filter(
+            materials__stand__department__store=instance).values_list('id', flat=True))
+
+
+@receiver(pre_save, sender=AdvertisementMaterial)
+def remember_material_stand(sender, instance, update_fields=None, **kwargs):
+    _remember_previous(sender, instance, update_fields, 'stand')
+
+
+@receiver(post_save, sender=AdvertisementMaterial)
+@receiver(post_delete, sender=AdvertisementMaterial)
+def invalidate_material_playlist(sender, instance, **kwargs):
+    # Materiał przeniesiony na inne stoisko znika też z playlisty poprzedniego
+    stand_ids = [instance.stand_id]
+    if _changed(instance, 'stand'):
+        stand_ids.append(instance._previous_values['stand_id'])
+    _invalidate_on_commit(stand_ids)
+
+
+@receiver(pre_delete, sender=AdvertisementMaterial)
+def discard_material_slots(sender, instance, **kwargs):
+    # Minione wystąpienia zostają w historii (material = NULL), przyszłe nie będą wyemitowane
+    discard_material([instance.pk])
+
+
+@receiver(post_delete, sender=AdvertisementMaterial)
+def release_material_asset(sender, instance, **kwargs):
+    # Także przy usuwaniu kaskadowym (stoisko, dział, sklep), które pomija AdvertisementMaterial.delete
+    if instance.asset_id:
+        asset_id = instance.asset_id
+        transaction.on_commit(lambda: release(asset_id))
+
+
+@receiver(post_save, sender=AdvertisementMaterial)
+def regenerate_material_slots(sender, instance, **kwargs):
+    # Wystąpienia materiału przenoszą się razem z nim na inne stoisko
+    if _changed(instance, 'stand'):
+        regenerate_on_commit(instance.schedules.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=EmissionSchedule)
+def invalidate_schedule_playlists(sender, instance, **kwargs):
+    _invalidate_on_commit(_schedule_stand_ids(instance))
+    _notify_on_commit([instance.pk])
+    regenerate_on_commit([instance.pk])
+
+
+@receiver(pre_delete, sender=EmissionSchedule)
+def invalidate_deleted_schedule_playlists(sender, instance, **kwargs):
+    # Po usunięciu powiązania M2M już nie istnieją - zbieramy stoiska wcześniej
+    _invalidate_on_commit(list(_schedule_stand_ids(instance)))
+    _notify_on_commit([instance.pk])
+    discard_future([instance.pk])
+
+
+@receiver(m2m_changed, sender=EmissionSchedule.materials.through)
+def invalidate_schedule_materials_playlists(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        # instance to materiał, pk_set to harmonogramy
+        _invalidate_on_commit([instance.stand_id])
+        schedule_ids = list(instance.schedules.values_list('id', flat=True)) if action == 'pre_clear' else pk_set
+        _notify_on_commit(schedule_ids)
+        regenerate_on_commit(schedule_ids)
+    elif action == 'pre_clear':
+        _invalidate_on_commit(list(_schedule_stand_ids(instance)))
+        _notify_on_commit([instance.pk])
+        regenerate_on_commit([instance.pk])
+    else:
+        _invalidate_on_commit(
+            AdvertisementMaterial.objects.filter(pk__in=pk_set).values_list('stand_id', flat=True)
+        )
+        _notify_on_commit([instance.pk])
+        regenerate_on_commit([instance.pk])
@@ -0,0 +1,129 @@
+"""
+Czas lokalny sklepów (Store.timezone).
+
+Harmonogramy są definiowane w lokalnym czasie ściennym sklepu. Dla każdej
+pary (strefa, dzień) raz wyliczane są granice doby w UTC oraz przesunięcia
+względem UTC obowiązujące w jej kolejnych częściach (zmiana czasu dzieli dobę
+na dwie części) - wynik trafia do cache LRU. Zamiana chwili na czas lokalny
+sklepu to wtedy wyszukanie części doby i dodanie przesunięcia, bez
+każdorazowej konwersji przez bazę stref czasowych.
+"""
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
+
+from django.conf import settings
+from django.utils.timezone import is_naive
+
+# Doba lokalna: data, początek i koniec w UTC, początki części doby (UTC) i ich przesunięcia
+LocalDay = namedtuple('LocalDay', ['date', 'start', 'end', 'starts', 'offsets'])
+
+# Co ile sprawdzamy przesunięcie przy szukaniu zmian czasu (zmiany są co najmniej kwadrans po kwadransie)
+PROBE_STEP = timedelta(minutes=15)
+
+# Ostatnio używana doba każdej strefy - większość zamian dotyczy bieżącej doby
+_current_days = {}
+
+
+def default_timezone():
+    return settings.TIME_ZONE
+
+
+@lru_cache(maxsize=None)
+def timezone_choices():
+    return sorted(available_timezones())
+
+
+@lru_cache(maxsize=None)
+def get_zone(name):
+    """ZoneInfo strefy; nieznana nazwa daje strefę z ustawień."""
+    try:
+        return ZoneInfo(name or settings.TIME_ZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(settings.TIME_ZONE)
+
+
+def _offset_change(zone, low, high, offset):
+    """Pierwsza pełna sekunda w (low, high], od której przesunięcie jest inne niż offset."""
+    low_seconds, high_seconds = 0, int((high - low).total_seconds())
+    while high_seconds - low_seconds > 1:
+        middle = (low_seconds + high_seconds) // 2
+        if (low + timedelta(seconds=middle)).astimezone(zone).utcoffset() == offset:
+            low_seconds = middle
+        else:
+            high_seconds = middle
+    return low + timedelta(seconds=high_seconds)
+
+
+@lru_cache(maxsize=4096)
+def local_day(zone_name, day):
+    """Granice doby day w strefie zone_name i zmiany przesunięcia w jej trakcie."""
+    zone = get_zone(zone_name)
+    start = datetime.combine(day, time.min, tzinfo=zone).astimezone(dt_timezone.utc)
+    end = datetime.combine(day + timedelta(days=1), time.min, tzinfo=zone).astimezone(dt_timezone.utc)
+
+    starts, offsets = [start], [start.astimezone(zone).utcoffset()]
+    probe = start + PROBE_STEP
+    while probe < end + PROBE_STEP:
+        point = min(probe, end - timedelta(seconds=1))
+        offset = point.astimezone(zone).utcoffset()
+        if offset != offsets[-1]:
+            starts.append(_offset_change(zone, max(start, probe - PROBE_STEP), point, offsets[-1]))
+            offsets.append(offset)
+        probe += PROBE_STEP
+    return LocalDay(day, start, end, tuple(starts), tuple(offsets))
+
+
+def _day_for(zone_name, instant):
+    day = _current_days.get(zone_name)
+    if day is None or not day.start <= instant < day.end:
+        day = local_day(zone_name, instant.astimezone(get_zone(zone_name)).date())
+        _current_days[zone_name] = day
+    return day
+
+
+def to_local(zone_name, instant):
+    """Chwila (aware) jako naiwny czas ścienny sklepu."""
+    if is_naive(instant):
+        raise ValueError("to_local wymaga chwili ze strefą czasową")
+    day = _day_for(zone_name, instant)
+    offset = day.offsets[bisect_right(day.starts, instant) - 1]
+    return instant.replace(tzinfo=None) - instant.utcoffset() + offset
+
+
+def from_local(zone_name, local, after=None):
+    """
+    Naiwny czas ścienny sklepu jako chwila w UTC. Godzina powtórzona przy
+    zmianie czasu daje pierwszą chwilę późniejszą niż after (domyślnie
+    pierwszą), a godzina nieistniejąca - chwilę po przestawieniu zegara.
+    """
+    day = local_day(zone_name, local.date())
+    candidates = []
+    for position, (start, offset) in enumerate(zip(day.starts, day.offsets)):
+        end = day.starts[position + 1] if position + 1 < len(day.starts) else day.end
+        instant = (local - offset).replace(tzinfo=dt_timezone.utc)
+        if start <= instant < end:
+            candidates.append(instant)
+    if not candidates:
+        return (local - day.offsets[0]).replace(tzinfo=dt_timezone.utc)
+    if after is not None:
+        for instant in candidates:
+            if instant > after:
+                return instant
+    return candidates[0]
+
+
+
+def next_local_transition(zone_name, index, moment):
+    """
+    Najbliższa chwila (UTC) po moment, w której zbiór harmonogramów
+    aktywnych według index (ScheduleIndex w czasie ściennym sklepu) może się
+    zmienić. Zmiana czasu też jest taką chwilą - zegar ścienny przeskakuje.
+    """
+    due = from_local(zone_name, index.next_transition(to_local(zone_name, moment)), after=moment)
+    for start in _day_for(zone_name, moment).starts[1:]:
+        if moment < start < due:
+            return start
+    return due
@@ -1,3 +1,342 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from . import conflicts, heartbeats, signals
+from .forms import EmissionScheduleForm
+from .models import (AdvertisementMaterial, Department, EmissionSchedule, PlayerHeartbeat, PlayerUptimeHourly,
+                     PlayerUptimeInterval, Stand, Store)
+from .recurrence import RecurrenceRuleError, compile_rule
+from .transitions import next_change
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+def schedule(**fields):
+    """Niezapisany harmonogram (wystarcza do obliczeń na regule powtarzania)."""
+    values = dict(name='Test', start_date=date(2026, 3, 1), start_time=time(1), end_time=time(3),
+                  repeat_type='daily', priority=1, is_active=True)
+    values.update(fields)
+    return EmissionSchedule(**values)
+
+
+class NextChangeTests(SimpleTestCase):
+    """transitions.next_change - najbliższa zmiana stanu harmonogramu w strefie sklepu."""
+
+    def test_spring_forward_day(self):
+        # 29.03.2026 w Warszawie zegar przeskakuje z 2:00 na 3:00 (CET -> CEST)
+        daily = schedule(start_time=time(1), end_time=time(3))
+        self.assertEqual(next_change(daily, utc(2026, 3, 28, 23, 30), 'Europe/Warsaw'), utc(2026, 3, 29, 0, 0))
+        # Koniec okna 3:00 czasu letniego to już 1:00 UTC (okno jest krótsze o godzinę)
+        self.assertEqual(next_change(daily, utc(2026, 3, 29, 0, 30), 'Europe/Warsaw'),
+                         utc(2026, 3, 29, 1, 0) + timedelta(microseconds=1))
+
+    def test_window_inside_skipped_hour_does_not_run(self):
+        skipped = schedule(start_time=time(2, 30), end_time=time(2, 45))
+        self.assertEqual(next_change(skipped, utc(2026, 3, 28, 23, 0), 'Europe/Warsaw'), utc(2026, 3, 30, 0, 30))
+
+    def test_fall_back_repeats_window(self):
+        # 25.10.2026 godzina 2:00-3:00 występuje dwa razy - okno obowiązuje w obu
+        repeated = schedule(start_time=time(2, 30), end_time=time(2, 45))
+        self.assertEqual(next_change(repeated, utc(2026, 10, 24, 23, 0), 'Europe/Warsaw'), utc(2026, 10, 25, 0, 30))
+        self.assertEqual(next_change(repeated, utc(2026, 10, 25, 0, 40), 'Europe/Warsaw'),
+                         utc(2026, 10, 25, 0, 45) + timedelta(microseconds=1))
+        self.assertEqual(next_change(repeated, utc(2026, 10, 25, 0, 46), 'Europe/Warsaw'), utc(2026, 10, 25, 1, 30))
+
+    def test_overnight_window_continues_past_midnight(self):
+        overnight = schedule(start_time=time(22), end_time=time(6))
+        self.assertEqual(next_change(overnight, utc(2026, 5, 1, 12), 'UTC'), utc(2026, 5, 1, 22))
+        # Północ nie jest zmianą - kolejny dzień też jest zaplanowany
+        self.assertEqual(next_change(overnight, utc(2026, 5, 1, 23), 'UTC'),
+                         utc(2026, 5, 2, 6) + timedelta(microseconds=1))
+
+    def test_one_off_overnight_window_ends_at_midnight(self):
+        # Jednorazowy harmonogram obowiązuje tylko w swoim dniu (jak is_scheduled_for_date)
+        once = schedule(start_date=date(2026, 5, 1), start_time=time(22), end_time=time(6), repeat_type='none')
+        self.assertEqual(next_change(once, utc(2026, 5, 1, 23), 'UTC'), utc(2026, 5, 2))
+        self.assertIsNone(next_change(once, utc(2026, 5, 2, 1), 'UTC'))
+
+    def test_weekly_without_days_never_changes(self):
+        self.assertIsNone(next_change(schedule(repeat_type='weekly', repeat_days=[]), utc(2026, 5, 1), 'UTC'))
+        self.assertIsNone(next_change(schedule(repeat_type='weekly', repeat_days=None), utc(2026, 5, 1), 'UTC'))
+
+    def test_weekly_jumps_to_next_selected_day(self):
+        mondays = schedule(repeat_type='weekly', repeat_days=[0], start_time=time(8), end_time=time(9))
+        # Środa 6.05.2026 -> poniedziałek 11.05.2026
+        self.assertEqual(next_change(mondays, utc(2026, 5, 6, 12), 'UTC'), utc(2026, 5, 11, 8))
+
+    def test_whole_day_schedule_changes_after_end_date(self):
+        whole_day = schedule(start_time=time(0), end_time=time(23, 59, 59, 999999), end_date=date(2026, 6, 30))
+        self.assertEqual(next_change(whole_day, utc(2026, 5, 1, 12), 'UTC'), utc(2026, 7, 1))
+        self.assertIsNone(next_change(whole_day, utc(2026, 7, 2), 'UTC'))
+
+
+class ScheduleConflictFormTests(TestCase):
+    """Analiza konfliktów w formularzu harmonogramu (conflicts.analyse_stand)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        store = Store.objects.create(name='Sklep', location='Warszawa', timezone='Europe/Warsaw')
+        department = Department.objects.create(name='Dział', store=store)
+        cls.stand = Stand.objects.create(name='Stoisko', department=department)
+        cls.material = AdvertisementMaterial.objects.create(
+            stand=cls.stand, material_type='image', file='image/upload/v1/advertisements/test.jpg')
+        existing = EmissionSchedule.objects.create(
+            name='Poranek', start_date=date(2026, 1, 1), start_time=time(8), end_time=time(10),
+            repeat_type='daily', priority=5)
+        existing.materials.set([cls.material])
+
+    def form(self, **fields):
+        data = {'name': 'Nowy', 'start_date': '2026-01-01', 'start_time': '09:00', 'end_time': '11:00',
+                'repeat_type': 'daily', 'priority': 5, 'is_active': 'on'}
+        data.update(fields)
+        return EmissionScheduleForm(data, stand=self.stand, material_ids=[self.material.pk])
+
+    def test_overlap_with_same_priority_is_reported(self):
+        form = self.form()
+        self.assertFalse(form.is_valid())
+        self.assertIn('Poranek', ' '.join(form.non_field_errors()))
+        self.assertTrue(form.conflict_report.ties)
+
+    def test_ignore_conflicts_lets_the_save_through(self):
+        form = self.form(ignore_conflicts='on')
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.save().name, 'Nowy')
+
+    def test_other_priority_is_not_a_conflict(self):
+        self.assertTrue(self.form(priority=6).is_valid())
+
+    def test_analysis_starts_on_the_store_local_day(self):
+        Store.objects.filter(pk=self.stand.department.store_id).update(timezone='Pacific/Kiritimati')
+        stand = Stand.objects.select_related('department__store').get(pk=self.stand.pk)
+        # 12:00 UTC 1.05 to już 2.05 na Kiritimati (UTC+14), a wciąż 1.05 w strefie serwera
+        with mock.patch('django.utils.timezone.now', return_value=utc(2026, 5, 1, 12)), \
+                mock.patch.object(conflicts, 'analyse', wraps=conflicts.analyse) as analyse:
+            conflicts.analyse_stand(stand)
+        self.assertEqual(analyse.call_args.args[2], date(2026, 5, 2))
+
+
+class RecurrenceRuleTests(SimpleTestCase):
+    """recurrence.compile_rule i RecurrenceRule.matches."""
+
+    def occurrences(self, text, start, end):
+        return list(compile_rule(text, start).occurrences(start, end))
+
+    def test_count_limits_occurrences(self):
+        rule = compile_rule('FREQ=WEEKLY;BYDAY=MO,TH;COUNT=3', date(2026, 6, 1))
+        # COUNT zamieniony na datę ostatniego wystąpienia: pn 1.06, czw 4.06, pn 8.06
+        self.assertEqual(rule.until, date(2026, 6, 8))
+        self.assertEqual(list(rule.occurrences(date(2026, 6, 1), date(2026, 7, 1))),
+                         [date(2026, 6, 1), date(2026, 6, 4), date(2026, 6, 8)])
+        self.assertFalse(rule.matches(date(2026, 6, 11)))
+
+    def test_count_skips_exdates_and_interval(self):
+        occurrences = self.occurrences('RRULE:FREQ=DAILY;INTERVAL=2;COUNT=3\nEXDATE:20260603',
+                                       date(2026, 6, 1), date(2026, 6, 30))
+        self.assertEqual(occurrences, [date(2026, 6, 1), date(2026, 6, 5), date(2026, 6, 7)])
+
+    def test_last_day_of_month(self):
+        rule = compile_rule('FREQ=MONTHLY;BYMONTHDAY=-1', date(2026, 1, 1))
+        self.assertTrue(rule.matches(date(2026, 2, 28)))
+        self.assertTrue(rule.matches(date(2028, 2, 29)))
+        self.assertTrue(rule.matches(date(2026, 4, 30)))
+        self.assertFalse(rule.matches(date(2026, 3, 30)))
+        self.assertFalse(rule.matches(date(2028, 2, 28)))
+
+    def test_ordinal_weekdays(self):
+        # Druga sobota i ostatni piątek miesiąca
+        rule = compile_rule('FREQ=MONTHLY;BYDAY=2SA,-1FR', date(2026, 1, 1))
+        self.assertEqual(list(rule.occurrences(date(2026, 5, 1), date(2026, 5, 31))),
+                         [date(2026, 5, 9), date(2026, 5, 29)])
+        self.assertFalse(rule.matches(date(2026, 5, 2)))
+
+    def test_ordinal_weekday_in_year(self):
+        # Ostatnia niedziela marca
+        rule = compile_rule('FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU', date(2026, 1, 1))
+        self.assertEqual(list(rule.occurrences(date(2026, 1, 1), date(2027, 12, 31))),
+                         [date(2026, 3, 29), date(2027, 3, 28)])
+
+    def test_invalid_rules_are_rejected(self):
+        for text in ('FREQ=HOURLY', 'FREQ=DAILY;COUNT=2;UNTIL=20261231', 'FREQ=WEEKLY;BYDAY=2MO',
+                     'FREQ=MONTHLY;BYMONTHDAY=32', 'FREQ=DAILY;FOO=1'):
+            with self.subTest(text=text), self.assertRaises(RecurrenceRuleError):
+                compile_rule(text, date(2026, 1, 1))
+
+
+@override_settings(PLAYER_ONLINE_TIMEOUT=90)
+class HeartbeatRollupTests(TestCase):
+    """heartbeats.rollup - okresy pracy i godzinowe podsumowania."""
+
+    @classmethod
+    def setUpTestData(cls):
+        store = Store.objects.create(name='Sklep', location='Warszawa')
+        department = Department.objects.create(name='Dział', store=store)
+        cls.stand = Stand.objects.create(name='Stoisko', department=department)
+
+    def beat(self, *moments):
+        PlayerHeartbeat.objects.bulk_create(PlayerHeartbeat(stand=self.stand, timestamp=moment) for moment in moments)
+
+    def intervals(self):
+        return list(PlayerUptimeInterval.objects.filter(stand=self.stand).order_by('started_at')
+                    .values_list('started_at', 'ended_at'))
+
+    def hourly(self):
+        return list(PlayerUptimeHourly.objects.filter(stand=self.stand).order_by('hour')
+                    .values_list('hour', 'online_seconds', 'heartbeats'))
+
+    def test_gap_longer_than_timeout_splits_intervals(self):
+        # 12:01 -> 12:02:30 to 90 s (jeszcze ten sam okres), 12:02:30 -> 12:04:01 to już przerwa
+        self.beat(utc(2026, 5, 1, 12), utc(2026, 5, 1, 12, 1), utc(2026, 5, 1, 12, 2, 30),
+                  utc(2026, 5, 1, 12, 4, 1), utc(2026, 5, 1, 12, 5))
+        self.assertEqual(heartbeats.rollup(now=utc(2026, 5, 1, 13)), (5, 0))
+        self.assertEqual(self.intervals(), [(utc(2026, 5, 1, 12), utc(2026, 5, 1, 12, 2, 30)),
+                                            (utc(2026, 5, 1, 12, 4, 1), utc(2026, 5, 1, 12, 5))])
+        self.assertEqual(self.hourly(), [(utc(2026, 5, 1, 12), 150 + 59, 5)])
+        self.assertFalse(PlayerHeartbeat.objects.filter(rolled_up=False).exists())
+
+    def test_late_beat_closes_the_gap(self):
+        self.beat(utc(2026, 5, 1, 12), utc(2026, 5, 1, 12, 3))
+        heartbeats.rollup(now=utc(2026, 5, 1, 13))
+        self.assertEqual(len(self.intervals()), 2)
+        # Spóźniony heartbeat z 12:01:30 łączy oba okresy (po 90 s z każdej strony)
+        self.beat(utc(2026, 5, 1, 12, 1, 30))
+        self.assertEqual(heartbeats.rollup(now=utc(2026, 5, 1, 13)), (1, 0))
+        self.assertEqual(self.intervals(), [(utc(2026, 5, 1, 12), utc(2026, 5, 1, 12, 3))])
+        self.assertEqual(self.hourly(), [(utc(2026, 5, 1, 12), 180, 3)])
+
+    def test_interval_spanning_hour_boundary_is_split_between_hours(self):
+        self.beat(utc(2026, 5, 1, 12, 59), utc(2026, 5, 1, 13), utc(2026, 5, 1, 13, 1, 30))
+        heartbeats.rollup(now=utc(2026, 5, 1, 14))
+        self.assertEqual(self.intervals(), [(utc(2026, 5, 1, 12, 59), utc(2026, 5, 1, 13, 1, 30))])
+        self.assertEqual(self.hourly(), [(utc(2026, 5, 1, 12), 60, 1), (utc(2026, 5, 1, 13), 90, 2)])
+
+        # Kolejna partia wydłuża istniejący okres - dolicza tylko nowy czas
+        self.beat(utc(2026, 5, 1, 13, 2))
+        heartbeats.rollup(now=utc(2026, 5, 1, 14))
+        self.assertEqual(self.intervals(), [(utc(2026, 5, 1, 12, 59), utc(2026, 5, 1, 13, 2))])
+        self.assertEqual(self.hourly(), [(utc(2026, 5, 1, 12), 60, 1), (utc(2026, 5, 1, 13), 120, 3)])
+        uptime = heartbeats.stand_uptime(self.stand.pk, utc(2026, 5, 1, 13), utc(2026, 5, 1, 14))
+        self.assertEqual(uptime['online_seconds'], 120)
+
+    def test_old_beats_are_deleted_after_retention(self):
+        self.beat(utc(2026, 4, 1, 12), utc(2026, 5, 1, 12))
+        self.assertEqual(heartbeats.rollup(now=utc(2026, 5, 1, 13), retention_days=7), (2, 1))
+        self.assertEqual(PlayerHeartbeat.objects.count(), 1)
+        # Okresy pracy zostają po usunięciu surowych heartbeatów
+        self.assertEqual(len(self.intervals()), 2)
+
+
+class SlotRegenerationSignalTests(TestCase):
+    """Regeneracja wystąpień emisji i playlist po przeniesieniu stoiska lub materiału oraz zmianie strefy sklepu."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = Store.objects.create(name='Sklep', location='Warszawa', timezone='Europe/Warsaw')
+        cls.department = Department.objects.create(name='Dział', store=cls.store)
+        cls.other_department = Department.objects.create(name='Inny dział', store=cls.store)
+        cls.stand = Stand.objects.create(name='Stoisko', department=cls.department)
+        material = AdvertisementMaterial.objects.create(
+            stand=cls.stand, material_type='image', file='image/upload/v1/advertisements/test.jpg')
+        cls.schedule = EmissionSchedule.objects.create(
+            name='Poranek', start_date=date(2026, 1, 1), start_time=time(8), end_time=time(10))
+        cls.schedule.materials.set([material])
+
+    def regenerated(self, save):
+        with mock.patch.object(signals, 'regenerate_on_commit') as regenerate:
+            save()
+        return [list(call.args[0]) for call in regenerate.call_args_list]
+
+    def test_stand_regenerates_only_when_department_changes(self):
+        self.assertEqual(self.regenerated(self.stand.save), [])
+        self.stand.name = 'Nowa nazwa'
+        self.assertEqual(self.regenerated(lambda: self.stand.save(update_fields=['name'])), [])
+        self.stand.department = self.other_department
+        self.assertEqual(self.regenerated(self.stand.save), [[self.schedule.pk]])
+
+    def test_store_regenerates_only_when_timezone_changes(self):
+        self.store.name = 'Nowa nazwa'
+        self.assertEqual(self.regenerated(self.store.save), [])
+        self.store.timezone = 'Europe/London'
+        self.assertEqual(self.regenerated(lambda: self.store.save(update_fields=['name'])), [])
+        self.assertEqual(self.regenerated(self.store.save), [[self.schedule.pk]])
+
+    def test_moved_material_invalidates_both_stands(self):
+        other_stand = Stand.objects.create(name='Drugie stoisko', department=self.department)
+        material = AdvertisementMaterial.objects.get(stand=self.stand)
+        material.stand = other_stand
+        with mock.patch.object(signals, 'invalidate_stands') as invalidate, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.regenerated(material.save), [[self.schedule.pk]])
+        self.assertIn(mock.call({self.stand.pk, other_stand.pk}), invalidate.call_args_list)
+
+
+class HeartbeatFlushTests(TestCase):
+    """heartbeats.flush - zapis bufora statusów i historii."""
+
+    @classmethod
+    def setUpTestData(cls):
+        store = Store.objects.create(name='Sklep', location='Warszawa')
+        department = Department.objects.create(name='Dział', store=store)
+        cls.stand = Stand.objects.create(name='Stoisko', department=department)
+
+    def setUp(self):
+        heartbeats._buffer.clear()
+        heartbeats._beats.clear()
+        self.addCleanup(heartbeats._buffer.clear)
+        self.addCleanup(heartbeats._beats.clear)
+
+    def buffer(self, last_seen, **entry):
+        heartbeats._buffer[self.stand.pk] = {'last_seen': last_seen, 'is_online': True, 'ip_address': None,
+                                             'user_agent': '', **entry}
+        heartbeats._beats.append(PlayerHeartbeat(stand_id=self.stand.pk, timestamp=last_seen))
+
+    def test_flush_creates_and_updates_status(self):
+        self.buffer(utc(2026, 5, 1, 12), version='1.0')
+        self.assertEqual(heartbeats.flush(), 1)
+        self.buffer(utc(2026, 5, 1, 12, 1), version='1.1')
+        self.assertEqual(heartbeats.flush(), 1)
+        status = self.stand.player_status
+        status.refresh_from_db()
+        self.assertEqual((status.last_seen, status.version), (utc(2026, 5, 1, 12, 1), '1.1'))
+        self.assertEqual(PlayerHeartbeat.objects.count(), 2)
+
+    def test_stale_status_does_not_overwrite_newer_one(self):
+        # Inny proces zdążył zapisać nowszy heartbeat
+        self.buffer(utc(2026, 5, 1, 12, 5), version='2.0')
+        heartbeats.flush()
+        self.buffer(utc(2026, 5, 1, 12), version='1.0')
+        heartbeats.flush()
+        status = self.stand.player_status
+        status.refresh_from_db()
+        self.assertEqual((status.last_seen, status.version), (utc(2026, 5, 1, 12, 5), '2.0'))
+        # Starszy heartbeat trafia jednak do historii
+        self.assertEqual(PlayerHeartbeat.objects.count(), 2)
+
+    @override_settings(PLAYER_ONLINE_TIMEOUT=90, HEARTBEAT_RETRY_LIMIT=2)
+    def test_failed_flush_requeues_limited_buffer(self):
+        now = utc(2026, 5, 1, 12)
+        self.buffer(now - timedelta(seconds=30))
+        heartbeats._beats[:0] = [PlayerHeartbeat(stand_id=self.stand.pk, timestamp=now - timedelta(seconds=90 + i))
+                                 for i in (3, 2)]
+        with mock.patch.object(heartbeats, '_update_newer', side_effect=RuntimeError('baza niedostępna')), \
+                mock.patch('django.utils.timezone.now', return_value=now), \
+                self.assertLogs('advertisements.heartbeats', 'WARNING') as logs:
+            self.assertEqual(heartbeats.flush(), 0)
+        self.assertIn('odrzucono 1', logs.output[-1])
+        self.assertIn(self.stand.pk, heartbeats._buffer)
+        self.assertEqual([beat.timestamp for beat in heartbeats._beats],
+                         [now - timedelta(seconds=92), now - timedelta(seconds=30)])
+
+    @override_settings(PLAYER_ONLINE_TIMEOUT=90)
+    def test_failed_flush_drops_statuses_older_than_timeout(self):
+        now = utc(2026, 5, 1, 12)
+        self.buffer(now - timedelta(seconds=91))
+        with mock.patch.object(heartbeats, '_update_newer', side_effect=RuntimeError('baza niedostępna')), \
+                mock.patch('django.utils.timezone.now', return_value=now), \
+                self.assertLogs('advertisements.heartbeats', 'ERROR'):
+            heartbeats.flush()
+        self.assertNotIn(self.stand.pk, heartbeats._buffer)
+        self.assertEqual(len(heartbeats._beats), 1)
@@ -0,0 +1,359 @@
+"""
+Sterowany zdarzeniami silnik przejść harmonogramów.
+
+Dla każdego aktywnego harmonogramu wyliczana jest najbliższa chwila, w której
+harmonogram włącza się lub wyłącza; chwile trzymane są w kopcu (heapq).
+Silnik budzi się dopiero, gdy nadchodzi najwcześniejsze przejście, aktualizuje
+statusy materiałów tylko tego harmonogramu, podbija wersje playlist jego
+stoisk i od razu buduje ich nowe snapshoty - bez skanowania wszystkich
+harmonogramów co minutę. Dzięki temu strona i API odtwarzacza czytają
+bieżący stan harmonogramów z cache.
+
+Przejścia są liczone w czasie lokalnym sklepów, do których należą materiały
+harmonogramu (Store.timezone); w kolejce trzymane są chwile w UTC.
+
+Zmiany harmonogramów (dodanie, edycja, usunięcie, zmiana materiałów) trafiają
+do silnika przez kanał zmian w cache (notify_schedules_changed, wywoływane
+z sygnałów). Przy wielu procesach kanał wymaga współdzielonego cache
+(CACHE_URL), podobnie jak wersje playlist.
+
+Pełna synchronizacja (load) pomija harmonogramy, które nie mogą się już
+zmienić (zakończone, jednorazowe z minionym dniem), i nie przelicza
+wystąpień emisji ani snapshotów wszystkich stoisk - horyzont wystąpień
+przesuwa refresh_emission_slots (cron), a snapshoty stoisk, których
+playlisty się zmieniły, budują się przy pierwszym odczycie.
+"""
+import calendar
+import heapq
+import logging
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from . import schedule_status
+from .models import EmissionSchedule
+from .playlist import invalidate_stands, warm_snapshots
+from .schedule_index import DAY_MICROSECONDS, ScheduleIndex, schedule_segments
+from .store_time import local_day, next_local_transition, to_local
+
+logger = logging.getLogger(__name__)
+
+CHANGES_SEQ_KEY = 'transitions:seq'
+CHANGE_KEY = 'transitions:change:{seq}'
+CHANGE_MAX_AGE = 24 * 60 * 60
+
+# Jak daleko w przód szukamy następnego przejścia harmonogramu
+HORIZON_DAYS = 400
+# Maksymalny czas uśpienia - co tyle sekund silnik sprawdza kanał zmian
+POLL_INTERVAL = 5
+# Co ile sekund kolejka jest przebudowywana od zera (zabezpieczenie przed utratą zmian)
+RESYNC_INTERVAL = 60 * 60
+
+
+def notify_schedules_changed(schedule_ids):
+    """Zgłasza silnikowi zmianę harmonogramów (także usunięcie)."""
+    schedule_ids = [schedule_id for schedule_id in set(schedule_ids) if schedule_id]
+    if not schedule_ids:
+        return
+    cache.add(CHANGES_SEQ_KEY, 0, None)
+    last = cache.incr(CHANGES_SEQ_KEY, len(schedule_ids))
+    first = last - len(schedule_ids) + 1
+    cache.set_many({CHANGE_KEY.format(seq=first + offset): schedule_id
+                    for offset, schedule_id in enumerate(schedule_ids)}, CHANGE_MAX_AGE)
+
+
+def _last_day(schedule):
+    """
+    Ostatni dzień, na który harmonogram może przypadać (end_date, jedyny dzień
+    jednorazowego, UNTIL reguły), None - bez końca. Harmonogram, który nie
+    przypada na żaden dzień (tygodniowy bez dni, niepoprawna reguła), kończy
+    się przed start_date.
+    """
+    never = schedule.start_date - timedelta(days=1)
+    days = [schedule.end_date] if schedule.end_date else []
+    if schedule.repeat_type == 'none':
+        days.append(schedule.start_date)
+    elif schedule.repeat_type == 'weekly':
+        if not schedule.repeat_days:
+            return never
+    elif schedule.repeat_type == 'custom':
+        rule = schedule.compiled_rule()
+        if rule is None:
+            return never
+        if rule.until is not None:
+            days.append(rule.until)
+    elif schedule.repeat_type != 'daily' and schedule.repeat_type != 'monthly':
+        return never
+    return min(days) if days else None
+
+
+def _whole_day(schedule):
+    """Czy w dniu, na który przypada, harmonogram obowiązuje całą dobę."""
+    return schedule_segments(schedule) == [(0, DAY_MICROSECONDS)]
+
+
+def _next_monthly(schedule, day):
+    """Najbliższy dzień harmonogramu miesięcznego po day."""
+    start = schedule.start_date
+    last_of_month = start.day == calendar.monthrange(start.year, start.month)[1] and start.day >= 28
+    year, month = day.year, day.month
+    for _ in range(3):
+        days_in_month = calendar.monthrange(year, month)[1]
+        if last_of_month or start.day <= days_in_month:
+            candidate = date(year, month, days_in_month if last_of_month else start.day)
+            if candidate > day:
+                return candidate
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return None
+
+
+def _next_day(schedule, day, scheduled, last_day):
+    """
+    Pierwszy dzień po day, na który harmonogram przypada (scheduled=True) albo
+    nie przypada (False) - wyliczony z reguły powtarzania, nie przeglądaniem
+    kolejnych dni. None, jeśli taki dzień nie nastąpi.
+    """
+    after = max(day, schedule.start_date - timedelta(days=1))
+    if scheduled:
+        if schedule.repeat_type == 'none' or schedule.repeat_type == 'daily':
+            candidate = after + timedelta(days=1)
+        elif schedule.repeat_type == 'weekly':
+            candidate = next(after + timedelta(days=offset) for offset in range(1, 8)
+                             if (after + timedelta(days=offset)).weekday() in schedule.repeat_days)
+        elif schedule.repeat_type == 'monthly':
+            candidate = _next_monthly(schedule, after)
+        else:
+            end = after + timedelta(days=HORIZON_DAYS)
+            candidate = next(schedule.compiled_rule().occurrences(after + timedelta(days=1), end, limit=1), None)
+        if candidate is None or (last_day is not None and candidate > last_day):
+            return None
+        return candidate
+
+    if schedule.repeat_type == 'daily':
+        candidate = None
+    elif schedule.repeat_type == 'weekly':
+        candidate = next((day + timedelta(days=offset) for offset in range(1, 8)
+                          if (day + timedelta(days=offset)).weekday() not in schedule.repeat_days), None)
+    elif schedule.repeat_type == 'custom':
+        rule = schedule.compiled_rule()
+        candidate = next((day + timedelta(days=offset) for offset in range(1, HORIZON_DAYS + 1)
+                          if not rule.matches(day + timedelta(days=offset))), None)
+    else:
+        # Jednorazowy i miesięczny nie przypadają na dwa kolejne dni
+        candidate = day + timedelta(days=1)
+    if last_day is not None and (candidate is None or candidate > last_day):
+        return last_day + timedelta(days=1)
+    return candidate
+
+
+def next_change(schedule, moment, zone=None):
+    """
+    Najbliższa chwila (UTC) po moment, w której harmonogram zmienia stan
+    aktywności w strefie zone (domyślnie z ustawień), lub None, jeśli już się
+    nie zmieni (albo nie w horyzoncie HORIZON_DAYS).
+
+    Dni, na które harmonogram nie przypada, i dni, w które obowiązuje całą
+    dobę, są przeskakiwane od razu do najbliższego dnia z innym stanem
+    (_next_day), więc pętla wykonuje najwyżej kilka kroków na każdy dzień
+    z oknem godzinowym.
+    """
+    zone = zone or settings.TIME_ZONE
+    last_day = _last_day(schedule)
+    local = to_local(zone, moment)
+    if last_day is not None and (local.date() > last_day or last_day < schedule.start_date):
+        return None
+    index = ScheduleIndex([schedule])
+    active = bool(index.active_at(local))
+    limit = moment + timedelta(days=HORIZON_DAYS)
+    while moment < limit:
+        day = to_local(zone, moment).date()
+        if last_day is not None and day > last_day:
+            return None
+        if not schedule.is_scheduled_for_date(day) or _whole_day(schedule):
+            # Do najbliższego dnia o innym stanie harmonogram się nie zmienia
+            following = _next_day(schedule, day, not schedule.is_scheduled_for_date(day), last_day)
+            if following is None:
+                return None
+            moment = local_day(zone, following).start
+        else:
+            moment = next_local_transition(zone, index, moment)
+        if bool(index.active_at(to_local(zone, moment))) != active:
+            return moment
+    return None
+
+
+class TransitionEngine:
+    """Kolejka najbliższych przejść harmonogramów."""
+
+    def __init__(self):
+        self._heap = []
+        self._due = {}
+        self._schedules = {}
+        self._zones = {}
+        self._seq = 0
+        self._loaded_at = None
+
+    def __len__(self):
+        return len(self._due)
+
+    @property
+    def next_due(self):
+        """Chwila najbliższego przejścia lub None."""
+        while self._heap:
+            due, schedule_id = self._heap[0]
+            if self._due.get(schedule_id) == due:
+                return due
+            heapq.heappop(self._heap)  # wpis nieaktualny (harmonogram zmieniony)
+        return None
+
+    def _queryset(self):
+        return EmissionSchedule.objects.filter(is_active=True).only(
+            'id', 'start_date', 'end_date', 'start_time', 'end_time',
+            'repeat_type', 'repeat_days', 'recurrence_rule', 'priority', 'is_active',
+        ).order_by()
+
+    def _schedule_zones(self, schedule_ids=None):
+        """{id harmonogramu: strefy czasowe sklepów jego materiałów}."""
+        links = EmissionSchedule.materials.through.objects.values_list(
+            'emissionschedule_id', 'advertisementmaterial__stand__department__store__timezone',
+        ).distinct()
+        if schedule_ids is not None:
+            links = links.filter(emissionschedule_id__in=schedule_ids)
+        zones = {}
+        for schedule_id, zone in links:
+            zones.setdefault(schedule_id, set()).add(zone)
+        return zones
+
+    def _push(self, schedule, now):
+        changes = [due for due in (next_change(schedule, now, zone)
+                                   for zone in self._zones.get(schedule.id) or [settings.TIME_ZONE])
+                   if due is not None]
+        due = min(changes) if changes else None
+        self._schedules[schedule.id] = schedule
+        if due is None:
+            self._due.pop(schedule.id, None)
+            return
+        self._due[schedule.id] = due
+        heapq.heappush(self._heap, (due, schedule.id))
+
+    def _forget(self, schedule_id):
+        self._schedules.pop(schedule_id, None)
+        self._zones.pop(schedule_id, None)
+        self._due.pop(schedule_id, None)
+
+    def load(self, now=None):
+        """Buduje kolejkę od zera i uzgadnia bieżące statusy (pełna synchronizacja)."""
+        now = timezone.localtime(now or timezone.now())
+        self._seq = cache.get(CHANGES_SEQ_KEY) or 0
+        schedule_status.deactivate_expired(now)
+        schedule_status.sync_material_statuses(now)
+
+        self._heap, self._due, self._schedules = [], {}, {}
+        self._zones = self._schedule_zones()
+        # Z zapasem na różnicę stref sklepów - resztę odrzuca next_change
+        finished = now.date() - timedelta(days=2)
+        schedules = self._queryset().exclude(
+            Q(end_date__lt=finished) | Q(repeat_type='none', start_date__lt=finished)
+        )
+        for schedule in schedules.iterator(chunk_size=schedule_status.BATCH_SIZE):
+            self._push(schedule, now)
+        self._loaded_at = now
+        logger.info(f'Kolejka przejść: {len(self)} harmonogramów, najbliższe przejście {self.next_due}')
+
+    def refresh(self, schedule_ids, now=None):
+        """Przelicza przejścia podanych harmonogramów po ich zmianie lub usunięciu."""
+        now = timezone.localtime(now or timezone.now())
+        schedule_ids = set(schedule_ids)
+        for schedule_id in schedule_ids:
+            self._forget(schedule_id)
+        self._zones.update(self._schedule_zones(schedule_ids))
+        for schedule in self._queryset().filter(id__in=schedule_ids):
+            self._push(schedule, now)
+        # Zmieniony harmonogram mógł zmienić stan od razu - uzgodnij jego materiały
+        self._apply(schedule_ids, now)
+
+    def poll_changes(self, now=None):
+        """Pobiera zmiany z kanału w cache. Zwraca liczbę przeliczonych harmonogramów."""
+        seq = cache.get(CHANGES_SEQ_KEY) or 0
+        if seq == self._seq:
+            return 0
+        if seq < self._seq:
+            # Cache został wyczyszczony - nie wiemy, co się zmieniło
+            self.load(now)
+            return len(self)
+
+        keys = [CHANGE_KEY.format(seq=number) for number in range(self._seq + 1, seq + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) < len(keys):
+            self.load(now)
+            return len(self)
+        self._seq = seq
+        self.refresh(changes.values(), now)
+        return len(set(changes.values()))
+
+    def _apply(self, schedule_ids, now):
+        material_ids = set(EmissionSchedule.materials.through.objects.filter(
+            emissionschedule_id__in=schedule_ids,
+        ).values_list('advertisementmaterial_id', flat=True))
+        schedule_status.deactivate_expired(now, schedule_ids)
+        if material_ids:
+            schedule_status.sync_material_statuses(now, material_ids)
+        # Playlista zmienia się na granicy okna nawet bez zmiany statusów materiałów
+        stand_ids = set(EmissionSchedule.materials.through.objects.filter(
+            emissionschedule_id__in=schedule_ids,
+        ).values_list('advertisementmaterial__stand_id', flat=True))
+        invalidate_stands(stand_ids)
+        warm_snapshots(stand_ids)
+
+    def run_due(self, now=None):
+        """Wykonuje wszystkie przejścia, których czas minął. Zwraca ich liczbę."""
+        now = timezone.localtime(now or timezone.now())
+        fired = []
+        while True:
+            due = self.next_due
+            if due is None or due > now:
+                break
+            _, schedule_id = heapq.heappop(self._heap)
+            del self._due[schedule_id]
+            fired.append(schedule_id)
+        if not fired:
+            return 0
+
+        self._apply(fired, now)
+        for schedule_id in fired:
+            schedule = self._schedules.get(schedule_id)
+            # Zakończony harmonogram nie ma już przejść - next_change zwróci None
+            if schedule is not None:
+                self._push(schedule, now)
+        logger.info(f'Wykonano przejścia {len(fired)} harmonogramów')
+        return len(fired)
+
+    def run_forever(self, poll_interval=POLL_INTERVAL, resync_interval=RESYNC_INTERVAL):
+        """Pętla silnika: śpi do najbliższego przejścia (lub do sprawdzenia zmian)."""
+        from django.db import close_old_connections
+
+        while True:
+            close_old_connections()
+            try:
+                now = timezone.localtime(timezone.now())
+                if self._loaded_at is None or (now - self._loaded_at).total_seconds() >= resync_interval:
+                    self.load(now)
+                else:
+                    self.poll_changes(now)
+                self.run_due(now)
+            except Exception as e:
+                # Kolejka mogła zostać przerwana w połowie - w kolejnym obiegu pełna synchronizacja
+                logger.error(f'Błąd silnika przejść harmonogramów: {e}')
+                self._loaded_at = None
+            finally:
+                close_old_connections()
+
+            due = self.next_due
+            sleep = poll_interval
+            if due is not None:
+                sleep = min(sleep, max(0, (due - timezone.now()).total_seconds()))
+            time.sleep(sleep)
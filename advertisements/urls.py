@@ -4,12 +4,25 @@ from . import api_views, views
 urlpatterns = [
     # API endpoints
     path('api/stand/<int:stand_id>/', api_views.stand_materials, name='api-stand-materials'),
+    path('api/playlists/', api_views.batch_stand_materials, name='api-batch-stand-materials'),
+    path('api/stand/<int:stand_id>/manifest/', api_views.stand_manifest, name='api-stand-manifest'),
+    path('api/stand/<int:stand_id>/events/', api_views.stand_playlist_events, name='api-stand-playlist-events'),
+    path('api/stand/<int:stand_id>/events/ticket/', api_views.stand_playlist_events_ticket,
+         name='api-stand-playlist-events-ticket'),
     path('api/token/', api_views.get_token, name='api-get-token'),
     path('api/player/status/', api_views.report_player_status, name='api-player-status'),
     path('api/player/status/<int:stand_id>/', api_views.get_player_status, name='api-get-player-status'),
     path('api/player/status/', api_views.report_player_status, name='api-player-status'),
     path('api/player/status/<int:stand_id>/', api_views.get_player_status, name='api-get-player-status'),
-    path('api/schedule-events/<int:stand_id>/', api_views.api_schedule_events, name='api-schedule-events'),
+    path('api/players/status/', api_views.fleet_player_status, name='api-fleet-player-status'),
+    path('api/player/uptime/<int:stand_id>/', api_views.get_player_uptime, name='api-get-player-uptime'),
+    path('api/uploads/<int:job_id>/', api_views.upload_job_status, name='api-upload-job'),
+    path('api/uploads/direct/', api_views.direct_upload_start, name='api-direct-upload-start'),
+    path('api/uploads/<int:job_id>/sign/', api_views.direct_upload_sign, name='api-direct-upload-sign'),
+    path('api/uploads/<int:job_id>/complete/', api_views.direct_upload_complete, name='api-direct-upload-complete'),
+    path('api/uploads/<int:job_id>/local/', api_views.direct_upload_local, name='api-direct-upload-local'),
+    path('api/slots/', api_views.emission_slot_list, name='api-emission-slots'),
+    path('api/schedule-events/<int:stand_id>/', api_views.schedule_events, name='api-schedule-events'),
     path('api/player/reset_token/', api_views.reset_player_token, name='api-reset-player-token'),
 
     # Player view
@@ -22,6 +35,7 @@ urlpatterns = [
     path('material/create/<int:stand_id>/', views.MaterialCreateView.as_view(), name='material-create'),
     path('material/<int:pk>/update/', views.MaterialUpdateView.as_view(), name='material-update'),
     path('material/<int:pk>/delete/', views.MaterialDeleteView.as_view(), name='material-delete'),
+    path('material/<int:pk>/distribute/', views.MaterialDistributeView.as_view(), name='material-distribute'),
 
     # Store management
     path('stores/', views.StoreListView.as_view(), name='store-list'),
@@ -49,7 +63,7 @@ urlpatterns = [
     path('api/schedule/<int:schedule_id>/', api_views.schedule_details, name='api-schedule-details'),
     path('schedule/<int:pk>/update/', views.ScheduleUpdateView.as_view(), name='schedule-update'),
     path('schedule/<int:pk>/delete/', views.ScheduleDeleteView.as_view(), name='schedule-delete'),
-    path('api/stand/<int:stand_id>/schedule/events/', views.get_schedule_events, name='api-schedule-events'),
+    path('api/stand/<int:stand_id>/schedule/events/', api_views.schedule_events, name='api-stand-schedule-events'),
     path('api/schedules/update-statuses/', api_views.update_schedule_statuses, name='api-update-schedule-statuses'),
     
     # Raportowanie
@@ -59,4 +59,12 @@ class CloudinaryFileExtensionValidator:
                 'message': self.message,
                 'code': self.code,
             },
-        )
\ No newline at end of file
+        )
+
+def validate_timezone(value):
+    """Sprawdza, czy nazwa strefy czasowej istnieje w bazie stref (np. 'Europe/Warsaw')."""
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+    try:
+        ZoneInfo(value)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValidationError(_("Nieznana strefa czasowa: %(value)s"), params={'value': value}, code='invalid_timezone')
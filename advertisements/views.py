@@ -1,17 +1,14 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
-from django.views.generic import TemplateView, ListView, DetailView, CreateView, UpdateView, DeleteView
+from django.views.generic import TemplateView, ListView, DetailView, CreateView, UpdateView, DeleteView, FormView
 from django.urls import reverse_lazy, reverse
 from django.http import JsonResponse
 from django.contrib import messages
 from django.views.decorators.http import require_POST
 from rest_framework.authtoken.models import Token
 from django.contrib.auth.mixins import LoginRequiredMixin
-from datetime import datetime, timedelta
 import io
-import random
-import colorsys
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
 from reportlab.lib.pagesizes import letter, landscape
 from reportlab.lib import colors
@@ -19,25 +16,30 @@ from reportlab.lib.styles import getSampleStyleSheet
 from django.http import FileResponse, HttpResponse
 import csv
 import xlsxwriter
-import cloudinary
-import cloudinary.uploader
 
 from .models import Store, Department, Stand, AdvertisementMaterial, EmissionSchedule
 from accounts.permissions import SuperadminRequiredMixin, StoreAdminRequiredMixin, EditorRequiredMixin, StoreAccessMixin
-from .forms import AdvertisementMaterialForm, StandAnimationForm, EmissionScheduleForm, MaterialReportForm
+from . import assets, distribution, media, playlist
+from .store_time import timezone_choices
+from .forms import AdvertisementMaterialForm, StandAnimationForm, EmissionScheduleForm, MaterialReportForm, \
+    MaterialDistributionForm
 from django.utils.timezone import now
 
 
 class PlayerView(TemplateView):
     template_name = 'player/player.html'
 
-    def dispatch(self, request, *args, **kwargs):
-        # Aktualizacja harmonogramów
-        from advertisements.models import EmissionSchedule
-        schedules = EmissionSchedule.objects.filter(is_active=True)
-        for schedule in schedules:
-            schedule.apply_schedule()
-        return super().dispatch(request, *args, **kwargs)
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Playlista stoiska rozwiązywana przez PlaylistResolver (przez snapshot w cache,
+        # który od razu obsłuży pierwsze zapytanie odtwarzacza do API)
+        stand_id = self.request.GET.get('stand', '')
+        if stand_id.isdigit():
+            try:
+                context['stand'] = playlist.get_snapshot(int(stand_id))['data']
+            except Stand.DoesNotExist:
+                pass
+        return context
 
 
 class StandMaterialsView(LoginRequiredMixin, DetailView):
@@ -91,30 +93,23 @@ class MaterialCreateView(EditorRequiredMixin, StoreAccessMixin, CreateView):
         return initial
 
     def form_valid(self, form):
-        self.object = form.save(commit=False)
-        file_obj = form.cleaned_data.get('file')
-
-        if file_obj and getattr(file_obj, 'size', 0) > 20 * 1024 * 1024:
-            # Duże pliki -> upload_large (chunked)
-            result = cloudinary.uploader.upload_large(
-                file_obj,
-                resource_type='auto',
-                folder='advertisements/',
-                chunk_size=6 * 1024 * 1024,  # 6MB chunki
-                use_filename=True,
-                unique_filename=True
-            )
-            # Zapisz referencję do Cloudinary
-            self.object.file = result.get('public_id')
-        else:
-            # Standardowy zapis przez CloudinaryField
-            pass
-        self.object.save()
-        messages.success(self.request, "Materiał dodany.")
-        return redirect(self.get_success_url())
-    
-    def get_success_url(self):
-        return reverse('stand-materials', kwargs={'pk': self.object.stand.pk})
+        # Plik trafia na dysk i do kolejki - do Cloudinary wysyła go worker (process_uploads),
+        # a materiał powstaje dopiero po zakończeniu wysyłki
+        job = media.enqueue(form, self.request.user)
+        success_url = reverse('stand-materials', kwargs={'pk': job.stand_id})
+        if self.request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({
+                'job_id': job.pk,
+                'status_url': reverse('api-upload-job', kwargs={'job_id': job.pk}),
+                'success_url': success_url,
+            }, status=202)
+        messages.info(self.request, "Plik jest wysyłany w tle - materiał pojawi się na liście po zakończeniu wysyłki.")
+        return redirect(success_url)
+
+    def form_invalid(self, form):
+        if self.request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({'errors': form.errors}, status=400)
+        return super().form_invalid(form)
 
 
 class MaterialUpdateView(EditorRequiredMixin, StoreAccessMixin, UpdateView):
@@ -127,7 +122,13 @@ class MaterialUpdateView(EditorRequiredMixin, StoreAccessMixin, UpdateView):
         return reverse('stand-materials', kwargs={'pk': self.object.stand.pk})
 
     def form_valid(self, form):
+        # Nowy plik nie należy już do współdzielonego pliku z rejestru - zwalniamy odwołanie
+        released = None
+        if 'file' in form.changed_data and form.instance.asset_id:
+            released, form.instance.asset = form.instance.asset_id, None
         response = super().form_valid(form)
+        if released:
+            assets.release(released)
         messages.success(self.request, "Materiał został zaktualizowany.")
         return response
 
@@ -146,6 +147,60 @@ class MaterialDeleteView(EditorRequiredMixin, StoreAccessMixin, DeleteView):
         return response
 
 
+class MaterialDistributeView(StoreAdminRequiredMixin, FormView):
+    """Rozesłanie materiału (tego samego pliku w Cloudinary) na wiele stoisk jednym żądaniem"""
+    form_class = MaterialDistributionForm
+    template_name = 'advertisements/material_distribute.html'
+
+    def test_func(self):
+        self.material = get_object_or_404(
+            AdvertisementMaterial.objects.select_related('stand__department__store'), pk=self.kwargs['pk']
+        )
+        user = self.request.user
+        return user.is_superadmin() or (
+            user.is_store_admin() and user.managed_store_id == self.material.stand.department.store_id
+        )
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['user'] = self.request.user
+        return kwargs
+
+    def get_initial(self):
+        return {
+            'store': self.material.stand.department.store,
+            'status': self.material.status,
+            'duration': self.material.duration,
+            'never_expires': self.material.expires_at is None,
+            'expires_at': self.material.expires_at,
+        }
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['material'] = self.material
+        return context
+
+    def form_valid(self, form):
+        data = form.cleaned_data
+        try:
+            stand_ids = distribution.distribute(
+                self.material, form.target_stands(),
+                status=data['status'],
+                duration=data['duration'],
+                expires_at=data['expires_at'],
+                skip_existing=data['skip_existing'],
+            )
+        except ValueError as e:
+            messages.error(self.request, f"Nie można rozesłać materiału: {e}")
+            return self.form_invalid(form)
+
+        if stand_ids:
+            messages.success(self.request, f"Materiał został dodany na {len(stand_ids)} stoisk.")
+        else:
+            messages.info(self.request, "Żadne z wybranych stoisk nie wymagało dodania materiału.")
+        return redirect('stand-materials', pk=self.material.stand_id)
+
+
 class StoreListView(SuperadminRequiredMixin, ListView):
     model = Store
     template_name = 'advertisements/store_list.html'
@@ -155,8 +210,9 @@ class StoreListView(SuperadminRequiredMixin, ListView):
 
 class StoreCreateView(SuperadminRequiredMixin, CreateView):
     model = Store
-    fields = ['name', 'location']
+    fields = ['name', 'location', 'timezone']
     template_name = 'advertisements/store_form.html'
+    extra_context = {'timezones': timezone_choices}
     success_url = reverse_lazy('store-list')
 
     def form_valid(self, form):
@@ -166,8 +222,9 @@ class StoreCreateView(SuperadminRequiredMixin, CreateView):
 
 class StoreUpdateView(SuperadminRequiredMixin, UpdateView):
     model = Store
-    fields = ['name', 'location']
+    fields = ['name', 'location', 'timezone']
     template_name = 'advertisements/store_form.html'
+    extra_context = {'timezones': timezone_choices}
 
     def get_success_url(self):
         return reverse('store-detail', kwargs={'pk': self.object.pk})
@@ -351,12 +408,22 @@ class ScheduleCreateView(EditorRequiredMixin, StoreAccessMixin, CreateView):
         context['selected_material_ids'] = selected_material_ids
         return context
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        stand_id = self.kwargs.get('stand_id')
+        if stand_id:
+            kwargs['stand'] = get_object_or_404(Stand, pk=stand_id)
+            kwargs['material_ids'] = [int(pk) for pk in self.request.POST.getlist('materials') if pk.isdigit()]
+        return kwargs
+
     def form_valid(self, form):
         self.object = form.save()
         material_ids = self.request.POST.getlist('materials')
         if material_ids:
             materials = AdvertisementMaterial.objects.filter(pk__in=material_ids)
             self.object.materials.set(materials)
+        for warning in form.conflict_warnings:
+            messages.warning(self.request, warning)
         return super().form_valid(form)
 
     def get_success_url(self):
@@ -382,6 +449,28 @@ class ScheduleUpdateView(EditorRequiredMixin, StoreAccessMixin, UpdateView):
         context['selected_material_ids'] = [str(m.id) for m in self.object.materials.all()]
         return context
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        if self.request.method == 'POST':
+            # Konflikty sprawdzamy dla materiałów zaznaczonych w formularzu, nie dotychczasowych
+            material_ids = [int(pk) for pk in self.request.POST.getlist('materials') if pk.isdigit()]
+        else:
+            material_ids = list(self.object.materials.values_list('id', flat=True))
+        material = (AdvertisementMaterial.objects.select_related('stand').filter(pk__in=material_ids).first()
+                    or self.object.materials.select_related('stand').first())
+        if material:
+            kwargs['stand'] = material.stand
+            kwargs['material_ids'] = material_ids
+        return kwargs
+
+    def form_valid(self, form):
+        self.object = form.save()
+        if form.stand is not None:
+            self.object.materials.set(AdvertisementMaterial.objects.filter(pk__in=form.material_ids, stand=form.stand))
+        for warning in form.conflict_warnings:
+            messages.warning(self.request, warning)
+        return redirect(self.get_success_url())
+
     def get_success_url(self):
         # Pobierz stand_id przed zapisaniem zmian, aby poprawnie przekierować
         stand_id = self.object.materials.first().stand.id if self.object.materials.first() else None
@@ -403,118 +492,6 @@ class ScheduleDeleteView(EditorRequiredMixin, StoreAccessMixin, DeleteView):
         return reverse_lazy('store-list')
 
 
-def get_random_color():
-    """Generuje losowy kolor w formacie szesnastkowym."""
-    # Użycie HSV dla lepszej różnorodności i czytelności kolorów
-    h = random.random()
-    s = 0.5 + random.random() * 0.5  # Saturation
-    v = 0.5 + random.random() * 0.5  # Value
-    r, g, b = colorsys.hsv_to_rgb(h, s, v)
-    return f"#{int(r * 255):02x}{int(g * 255):02x}{int(b * 255):02x}"
-
-
-def get_schedule_events(request, stand_id):
-    start_date = request.GET.get('start')
-    end_date = request.GET.get('end')
-
-    if start_date and end_date:
-        start = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-        end = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-    else:
-        today = datetime.today()
-        start = datetime(today.year, today.month, 1)
-        end = start + timedelta(days=42)
-
-    schedules = EmissionSchedule.objects.filter(materials__stand_id=stand_id).distinct()
-
-    events = []
-    for schedule in schedules:
-        # Pomijaj harmonogramy bez wymaganych dat/godzin
-        if not schedule.start_date or not schedule.start_time:
-            continue
-
-        # Ustal wartości końcowe, jeśli brak to użyj startowych
-        end_date_val = schedule.end_date or schedule.start_date
-        end_time_val = schedule.end_time or schedule.start_time
-
-        materials_data = []
-        for material in schedule.materials.all():
-            materials_data.append({
-                'id': material.id,
-                'type': material.get_material_type_display(),
-            })
-
-        event_start_time = schedule.start_time.isoformat() if schedule.start_time else "00:00:00"
-        event_end_time = end_time_val.isoformat() if end_time_val else "23:59:59"
-
-        event_title = f"{schedule.name} ({', '.join([mat['type'] for mat in materials_data])})"
-
-        random_color = get_random_color()
-
-        base_event = {
-            'id': schedule.id,
-            'title': event_title,
-            'backgroundColor': random_color,
-            'borderColor': random_color,
-            'textColor': '#ffffff',
-            'extendedProps': {
-                'materials': materials_data,
-                'repeat_type': schedule.repeat_type,
-                'priority': schedule.priority,
-                'stand_id': stand_id,
-            }
-        }
-
-        if schedule.repeat_type == 'none':
-            base_event.update({
-                'start': f"{schedule.start_date.isoformat()}T{event_start_time}",
-                'end': f"{end_date_val.isoformat()}T{event_end_time}",
-            })
-            events.append(base_event)
-
-        elif schedule.repeat_type == 'daily':
-            base_event.update({
-                'daysOfWeek': [0, 1, 2, 3, 4, 5, 6],
-                'startTime': event_start_time,
-                'endTime': event_end_time,
-                'startRecur': schedule.start_date.isoformat(),
-                'endRecur': end_date_val.isoformat() if end_date_val else None
-            })
-            events.append(base_event)
-
-        elif schedule.repeat_type == 'weekly' and schedule.repeat_days:
-            base_event.update({
-                'daysOfWeek': [int(day) for day in schedule.repeat_days],
-                'startTime': event_start_time,
-                'endTime': event_end_time,
-                'startRecur': schedule.start_date.isoformat(),
-                'endRecur': end_date_val.isoformat() if end_date_val else None
-            })
-            events.append(base_event)
-
-        elif schedule.repeat_type == 'monthly':
-            current_date = schedule.start_date
-            end_limit = end_date_val or end.date()
-            while current_date <= end_limit:
-                if current_date.day == schedule.start_date.day:
-                    monthly_event = base_event.copy()
-                    monthly_event['start'] = f"{current_date.isoformat()}T{event_start_time}"
-                    monthly_event['end'] = f"{current_date.isoformat()}T{event_end_time}"
-                    events.append(monthly_event)
-
-                # Obliczenie następnego miesiąca
-                next_month = current_date.month + 1
-                year = current_date.year + (next_month > 12)
-                month = (next_month - 1) % 12 + 1
-
-                try:
-                    current_date = current_date.replace(year=year, month=month)
-                except ValueError:
-                    last_day_of_month = (current_date.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-                    current_date = last_day_of_month.replace(year=year, month=month)
-
-    return JsonResponse(events, safe=False)
-
 @login_required
 def generate_materials_report(request):
     """
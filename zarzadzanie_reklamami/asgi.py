@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Strumień zmian playlist (Server-Sent Events, /advertisements/api/stand/<id>/events/)
+utrzymuje długie połączenia, dlatego aplikację należy serwować przez ASGI,
+np. `uvicorn zarzadzanie_reklamami.asgi:application`.
 """
 
 import os
@@ -101,6 +101,23 @@ DATABASES = {
     }
 }
 
+# Cache (m.in. skompilowane playlisty stoisk). Przy wielu procesach
+# ustaw CACHE_URL na współdzielony backend, np. redis:// lub memcache://
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Co ile sekund bufor heartbeatów odtwarzaczy jest zapisywany do bazy (zbiorczo)
+HEARTBEAT_FLUSH_INTERVAL = env.int('HEARTBEAT_FLUSH_INTERVAL', default=15)
+# Ile niezapisanych heartbeatów trzymać w pamięci procesu, gdy baza jest niedostępna
+HEARTBEAT_RETRY_LIMIT = env.int('HEARTBEAT_RETRY_LIMIT', default=100000)
+# Po ilu sekundach bez heartbeatu odtwarzacz jest offline
+PLAYER_ONLINE_TIMEOUT = env.int('PLAYER_ONLINE_TIMEOUT', default=90)
+# Ile dni przechowywać surowe heartbeaty (starsze są dostępne tylko jako podsumowania)
+HEARTBEAT_RETENTION_DAYS = env.int('HEARTBEAT_RETENTION_DAYS', default=7)
+# Ile dni przechowywać minione wystąpienia emisji (historia do uzgadniania proof-of-play)
+EMISSION_SLOT_RETENTION_DAYS = env.int('EMISSION_SLOT_RETENTION_DAYS', default=90)
+
 CSRF_TRUSTED_ORIGINS = [
     'https://zarzadzaniereklamami-production-e866.up.railway.app'
 ]
@@ -173,9 +190,14 @@ MEDIA_URL = '/media/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-# File upload size limit (100MB)
-DATA_UPLOAD_MAX_MEMORY_SIZE = 512 * 1024 * 1024
-FILE_UPLOAD_MAX_MEMORY_SIZE = 64 * 1024 * 1024 
+# Limity pamięci przy przyjmowaniu formularzy: pliki większe niż FILE_UPLOAD_MAX_MEMORY_SIZE
+# Django zapisuje od razu na dysk, a pola inne niż pliki nie potrzebują więcej niż kilka MB
+DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440
+# Katalog kolejki plików czekających na wysłanie do Cloudinary (wspólny dla procesów webowych i process_uploads)
+UPLOAD_SPOOL_DIR = env('UPLOAD_SPOOL_DIR', default=os.path.join(BASE_DIR, 'upload_spool'))
+# Bezpośrednia wysyłka z przeglądarki: 'cloudinary' albo 'local' (zastępnik do testów i pracy lokalnej)
+DIRECT_UPLOAD_BACKEND = env('DIRECT_UPLOAD_BACKEND', default='cloudinary')
 # Login and logout URLs
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'